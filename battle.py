@@ -0,0 +1,72 @@
+import random
+
+# Константы боя; их же использует пакетный движок battle_np.py
+BASE_DAMAGE_RANGE = (0.5, 1.8)  # от 50% до 180% от атаки
+DEFENSE_RANGE = (0.3, 0.8)  # защита работает от 30% до 80%
+CRIT_CHANCE = 0.15
+CRIT_RANGE = (1.5, 2.5)  # крит от 150% до 250%
+MISS_CHANCE = 0.10
+LUCKY_CHANCE = 0.05
+LUCKY_RANGE = (1.2, 2.0)  # удачный удар: от 120% до 200% атаки
+
+def calculate_battle_damage(attacker_stats, defender_stats):
+    """Улучшенная система расчета урона с большей случайностью"""
+    attack = attacker_stats["attack"]
+    defense = defender_stats["defense"]
+
+    # Базовый урон с большим разбросом
+    base_damage = attack * random.uniform(*BASE_DAMAGE_RANGE)
+
+    # Защита снижает урон, но не полностью
+    defense_reduction = defense * random.uniform(*DEFENSE_RANGE)
+
+    # Финальный урон
+    damage = base_damage - defense_reduction
+    damage = max(1, round(damage))  # минимум 1 урона
+
+    # Шанс критического удара (15%)
+    is_crit = random.random() < CRIT_CHANCE
+    if is_crit:
+        damage = int(damage * random.uniform(*CRIT_RANGE))
+
+    # Шанс промаха (10%) - урон становится 0
+    is_miss = random.random() < MISS_CHANCE
+    if is_miss:
+        damage = 0
+        is_crit = False
+
+    # Шанс удачного удара (5%) - игнорирует защиту
+    is_lucky = random.random() < LUCKY_CHANCE
+    if is_lucky and not is_miss:
+        damage = int(attack * random.uniform(*LUCKY_RANGE))
+        return damage, is_crit, is_miss, is_lucky
+
+    return damage, is_crit, is_miss, False
+
+def can_fight(stats):
+    """Минимальные член и сиськи для боя"""
+    return stats["attack"] >= 3 and stats["defense"] >= 1
+
+def resolve_fight(attacker_stats, defender_stats):
+    """Один бой: удары обоих, победитель и перенос бонуса
+
+    Меняет статы на месте: победитель получает бонус и победу,
+    проигравший теряет столько же и получает поражение, при ничьей
+    ничего не меняется. Возвращает (удар атакующего, удар защитника,
+    0 — победил атакующий / 1 — защитник / None — ничья, (бонус см, бонус lvl)).
+    """
+    hit1 = calculate_battle_damage(attacker_stats, defender_stats)
+    hit2 = calculate_battle_damage(defender_stats, attacker_stats)
+    bonus = (random.randint(2, 5), random.randint(1, 3))
+
+    if hit1[0] == hit2[0]:
+        return hit1, hit2, None, bonus
+    winner_side = 0 if hit1[0] > hit2[0] else 1
+    winner, loser = (attacker_stats, defender_stats) if winner_side == 0 else (defender_stats, attacker_stats)
+    winner["wins"] += 1
+    loser["losses"] += 1
+    winner["attack"] += bonus[0]
+    winner["defense"] += bonus[1]
+    loser["attack"] -= bonus[0]
+    loser["defense"] -= bonus[1]
+    return hit1, hit2, winner_side, bonus
@@ -0,0 +1,167 @@
+"""Пакетный движок боя на NumPy для симуляций и подбора баланса
+
+    python battle_np.py table --attack 5:60:5 --def-a 2 --def-d 2
+    python battle_np.py check
+"""
+import math
+import argparse
+import numpy as np  # type: ignore
+
+from battle import (
+    BASE_DAMAGE_RANGE, DEFENSE_RANGE, CRIT_CHANCE, CRIT_RANGE,
+    MISS_CHANCE, LUCKY_CHANCE, LUCKY_RANGE, calculate_battle_damage,
+)
+
+
+def battle_damage(attack, defense, rng: np.random.Generator = None):
+    """Векторный calculate_battle_damage: массивы атаки и защиты -> массивы урона и флагов
+
+    Распределение совпадает со скалярной версией: round — банковское
+    округление, как в Python, int() — отбрасывание дробной части.
+    """
+    rng = rng or np.random.default_rng()
+    attack, defense = np.broadcast_arrays(np.asarray(attack, dtype=np.float64),
+                                          np.asarray(defense, dtype=np.float64))
+    shape = attack.shape
+
+    base_damage = attack * rng.uniform(*BASE_DAMAGE_RANGE, shape)
+    defense_reduction = defense * rng.uniform(*DEFENSE_RANGE, shape)
+    damage = np.maximum(1, np.round(base_damage - defense_reduction))
+
+    is_crit = rng.random(shape) < CRIT_CHANCE
+    damage = np.where(is_crit, np.trunc(damage * rng.uniform(*CRIT_RANGE, shape)), damage)
+
+    is_miss = rng.random(shape) < MISS_CHANCE
+    damage[is_miss] = 0
+    is_crit &= ~is_miss
+
+    is_lucky = (rng.random(shape) < LUCKY_CHANCE) & ~is_miss
+    damage = np.where(is_lucky, np.trunc(attack * rng.uniform(*LUCKY_RANGE, shape)), damage)
+
+    return damage.astype(np.int64), is_crit, is_miss, is_lucky
+
+
+def simulate_fights(attacker_attack, attacker_defense, defender_attack, defender_defense,
+                    rng: np.random.Generator = None):
+    """Исход боёв как в callback_fight_accept: 1 — победа атакующего, -1 — защитника, 0 — ничья"""
+    rng = rng or np.random.default_rng()
+    attacker_attack, attacker_defense, defender_attack, defender_defense = np.broadcast_arrays(
+        attacker_attack, attacker_defense, defender_attack, defender_defense)
+    dmg1 = battle_damage(attacker_attack, defender_defense, rng)[0]
+    dmg2 = battle_damage(defender_attack, attacker_defense, rng)[0]
+    return np.sign(dmg1 - dmg2)
+
+
+def win_probability(attacker_attack, attacker_defense, defender_attack, defender_defense,
+                    fights: int = 10_000, rng: np.random.Generator = None):
+    """Вероятности (победа, ничья, поражение) атакующего по fights симуляциям"""
+    outcome = simulate_fights(
+        np.full(fights, attacker_attack), attacker_defense,
+        defender_attack, defender_defense, rng,
+    )
+    return (outcome > 0).mean(), (outcome == 0).mean(), (outcome < 0).mean()
+
+
+def win_table(attacks, attacker_defense: int, defender_defense: int, fights: int, rng=None):
+    """Матрица вероятности победы: строки — атака атакующего, столбцы — атака защитника"""
+    rng = rng or np.random.default_rng()
+    a = np.asarray(attacks)[:, None, None]
+    d = np.asarray(attacks)[None, :, None]
+    shape = (len(attacks), len(attacks), fights)
+    outcome = simulate_fights(
+        np.broadcast_to(a, shape), attacker_defense,
+        np.broadcast_to(d, shape), defender_defense, rng,
+    )
+    return (outcome > 0).mean(axis=2)
+
+
+# ===================
+# ПРОВЕРКА ЭКВИВАЛЕНТНОСТИ
+# ===================
+
+def _chi2_pvalue(stat: float, dof: int) -> float:
+    """p-значение хи-квадрат (аппроксимация Уилсона-Хилферти)"""
+    if dof <= 0:
+        return 1.0
+    z = ((stat / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare_with_scalar(attack: int, defense: int, samples: int = 200_000, seed: int = 1):
+    """Двухвыборочный хи-квадрат по распределению урона и флагов крит/промах/удача"""
+    import random
+    random.seed(seed)
+    scalar = np.array([
+        calculate_battle_damage({"attack": attack}, {"defense": defense})
+        for _ in range(samples)
+    ], dtype=np.int64)
+    damage, crit, miss, lucky = battle_damage(np.full(samples, attack), defense, np.random.default_rng(seed))
+    vector = np.stack([damage, crit, miss, lucky], axis=1).astype(np.int64)
+
+    # Категория = (урон, крит, промах, удача); редкие категории объединяем
+    keys_s = [tuple(row) for row in scalar]
+    keys_v = [tuple(row) for row in vector]
+    counts = {}
+    for key in keys_s:
+        counts.setdefault(key, [0, 0])[0] += 1
+    for key in keys_v:
+        counts.setdefault(key, [0, 0])[1] += 1
+
+    bins, rare = [], [0, 0]
+    for s, v in counts.values():
+        if s + v < 20:
+            rare[0] += s
+            rare[1] += v
+        else:
+            bins.append((s, v))
+    if sum(rare):
+        bins.append(tuple(rare))
+
+    stat = 0.0
+    for s, v in bins:
+        expected = (s + v) / 2
+        stat += (s - expected) ** 2 / expected + (v - expected) ** 2 / expected
+    return stat, len(bins) - 1, _chi2_pvalue(stat, len(bins) - 1)
+
+
+def _parse_range(text: str) -> list:
+    start, stop, step = (int(x) for x in text.split(":"))
+    return list(range(start, stop + 1, step))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Симуляция боёв H&C")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    table = sub.add_parser("table", help="таблица вероятности победы атакующего")
+    table.add_argument("--attack", default="5:60:5", help="диапазон атаки start:stop:step")
+    table.add_argument("--def-a", type=int, default=2, help="защита атакующего")
+    table.add_argument("--def-d", type=int, default=2, help="защита защитника")
+    table.add_argument("--fights", type=int, default=20_000, help="боёв на клетку")
+    table.add_argument("--seed", type=int, default=None)
+
+    check = sub.add_parser("check", help="сравнение со скалярным calculate_battle_damage")
+    check.add_argument("--samples", type=int, default=200_000)
+
+    args = parser.parse_args()
+    if args.command == "table":
+        attacks = _parse_range(args.attack)
+        probs = win_table(attacks, args.def_a, args.def_d, args.fights, np.random.default_rng(args.seed))
+        print(f"Победа атакующего (сиськи: атакующий {args.def_a}, защитник {args.def_d}), "
+              f"{args.fights} боёв на клетку")
+        print("атк\\защ " + "".join(f"{d:>6}" for d in attacks))
+        for a, row in zip(attacks, probs):
+            print(f"{a:>7} " + "".join(f"{p * 100:5.1f}%" for p in row))
+    else:
+        failed = False
+        for attack, defense in ((10, 2), (3, 1), (40, 15), (-5, 3), (120, 60)):
+            stat, dof, pvalue = compare_with_scalar(attack, defense, args.samples)
+            ok = pvalue > 0.001
+            failed |= not ok
+            print(f"атака {attack:>4}, защита {defense:>3}: chi2={stat:9.1f} dof={dof:4} "
+                  f"p={pvalue:.4f} {'OK' if ok else 'РАСХОЖДЕНИЕ'}")
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,108 +1,159 @@
 import os
-import json
 import random
+import asyncio
+import re
+import time
+import logging
 from datetime import datetime 
 from aiogram import Bot, Dispatcher, types# type: ignore
 from aiogram.filters import Command# type: ignore
-from aiogram.types import Message, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery # type: ignore
+from aiogram.types import Message, InlineQuery, CallbackQuery, FSInputFile # type: ignore
 from dotenv import load_dotenv# type: ignore
 from aiogram.utils.keyboard import InlineKeyboardBuilder # type: ignore
+from aiogram.dispatcher.event.bases import UNHANDLED # type: ignore
+from repository import create_repository, new_player
+from battle import can_fight, resolve_fight
+from odds import WinOddsTable
+from leaderboard import TopCache
+from names import NameResolver, NameMiddleware, UserProfileCache
+from fights import FightRegistry
+from locks import PlayerLocks
+from callbacks import CallbackRouter
+from outbox import OutboundScheduler
+from runner import UpdateLimiter, MAX_CONCURRENT_UPDATES, SHUTDOWN_DRAIN_TIMEOUT, run
+from metrics import Metrics, HandlerMetrics, ApiMetrics, instrument_persistence, METRICS_PORT
+from shards import ShardCluster
+from dedupe import CallbackDedupe
+from matchmaking import MatchQueue, rating
+from tournament import Tournament, MODES as TOURNAMENT_MODES
+from notify import GrowNotifier
+from fightlog import FightLog, fight_entry
+from bulk import export_players, import_players, bulk_update, OPERATIONS as BULK_OPERATIONS
+from render import (
+    MENU_TEXT, NOT_YOUR_MENU, TOP_TITLES, main_keyboard, back_keyboard, new_fight_keyboard,
+    top_keyboard, challenge_keyboard, fight_keyboard, inline_results, profile_text, cooldown_text,
+    grow_text, challenge_text, fight_call_text, fight_result_text, top_text, respond,
+    MATCH_LEFT, match_wait_text, cooldown_keyboard, tournament_keyboard, tournament_open_text, tournament_summary_text,
+    fight_history_text,
+)
 
 async def get_top_text(top_type: str):
-    if not players:
+    if top_type not in TOP_TITLES:
+        return "Неизвестный тип топа."
+
+    cached = top_cache.get(top_type)
+    if cached is not None:
+        return cached
+
+    generation = top_cache.generation(top_type)
+    top_players = await repo.top(top_type, 10)
+    if not top_players:
         return "Нет данных для таблицы лидеров."
 
-    if top_type == "wins":
-        sorted_players = sorted(players.items(), key=lambda x: x[1].get("wins", 0), reverse=True)
-        title = "🏆 Топ-10 по победам:"
-        value = lambda p: f"{p['wins']} побед"
-    elif top_type == "size":
-        sorted_players = sorted(players.items(), key=lambda x: (x[1].get("attack", 0) + x[1].get("defense", 0)), reverse=True)
-        title = "🥒🍒 Топ-10 по сумме члена и сисек:"
-        value = lambda p: f"{p['attack']}см + {p['defense']} lvl"
-    elif top_type == "winrate":
-        def winrate(p):
-            total = p["wins"] + p["losses"]
-            return (p["wins"] / total * 100) if total > 0 else 0
-        sorted_players = sorted(players.items(), key=lambda x: winrate(x[1]), reverse=True)
-        title = "📊 Топ-10 по винрейту:"
-        value = lambda p: f"{(p['wins'] / (p['wins'] + p['losses']) * 100):.1f}%" if (p['wins'] + p['losses']) > 0 else "0%"
-    else:
-        return "Неизвестный тип топа."
+    await name_resolver.fill_missing(top_players)
 
-    text = f"{title}\n\n"
-    for i, (user_id, data) in enumerate(sorted_players[:10], 1):
-        name = data.get("name")
-        if not name:
-            try:
-                user = await bot.get_chat(int(user_id))
-                name = user.full_name[:20]
-                players[user_id]["name"] = name
-                save_players()
-            except:
-                name = f"ID:{user_id}"
-        text += f"{i}. {name} — {value(data)}\n"
+    text = top_text(top_type, top_players)
+    top_cache.put(top_type, text, top_players, generation)
     return text
 
-def get_top_keyboard(current: str, owner_id: str):
-    order = ["wins", "size", "winrate"]
-    labels = {"wins": "🏆 Победы", "size": "🥒🍒 Размер", "winrate": "📊 Винрейт"}
-    idx = order.index(current)
-    next_type = order[(idx + 1) % len(order)]
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{owner_id}"),
-            InlineKeyboardButton(text=f"➡️ {labels[next_type]}", callback_data=f"top_{next_type}")
-        ]
-    ])
-
 GROW_COOLDOWN = 2 * 60 * 60  # 2 часа в секундах
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATA_FILE = "players.json"
+DB_FILE = "players.db"
+PLAYER_BACKEND = os.getenv("PLAYER_BACKEND", "json")  # json или sqlite
+TOP_CACHE_TTL = 5  # с шардами: топ не старше 5 секунд (сохранения чужих шардов не видны)
+
+cluster = ShardCluster.from_env()  # SHARD_COUNT > 1 — игроки разбиты по процессам
 
 bot = Bot(token=BOT_TOKEN)
+outbox = OutboundScheduler(global_rate=30 / cluster.count)  # лимиты Telegram, RetryAfter и склейка правок
+bot.session.middleware(outbox)
+metrics = Metrics()  # /metrics для Prometheus на METRICS_PORT
+bot.session.middleware(ApiMetrics(metrics))  # после outbox: время самого запроса
 dp = Dispatcher()
-
-# Загружаем или создаём базу
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        players = json.load(f)
-else:
-    players = {}
-
-pending_fights = {}  # Для хранения активных вызовов на бой
-message_owners = {}  # Для хранения владельцев сообщений {message_id: user_id}
+update_limiter = UpdateLimiter(MAX_CONCURRENT_UPDATES)  # лимит параллельных апдейтов
+dp.update.outer_middleware(update_limiter)
+
+# Хранилище игроков; открывается при старте диспетчера. С шардами здесь
+# только свои игроки, а repo и player_locks ходят к остальным шардам
+local_repo = create_repository(PLAYER_BACKEND, cluster.partition_file(DATA_FILE), cluster.partition_file(DB_FILE))
+repo = cluster.wrap_repository(local_repo, DATA_FILE)
+top_cache = TopCache(ttl=TOP_CACHE_TTL if cluster.sharded else None)  # готовые тексты топов
+repo.subscribe(top_cache)
+
+player_locks = cluster.wrap_locks(PlayerLocks())  # замки игроков для чтения-изменения-сохранения
+
+# Имена для топов: из апдейтов, недостающие — пачкой через get_chat
+name_resolver = NameResolver(bot, repo, player_locks)
+repo.subscribe(name_resolver)
+profile_cache = UserProfileCache()  # профили для текста боя без get_chat
+dp.update.outer_middleware(NameMiddleware(name_resolver, profile_cache))
+callback_dedupe = CallbackDedupe()  # повторные нажатия ждут первое, быстрые серии отбрасываются
+dp.callback_query.outer_middleware(callback_dedupe)
+
+FIGHTS_FILE = "fights.json"
+FIGHT_TTL = 15 * 60  # вызов на бой живёт 15 минут
+MAX_FIGHTS_PER_PLAYER = 3
+
+ODDS_FILE = "odds.bin"  # обязательно собрать при деплое: python odds.py build
+odds = WinOddsTable(ODDS_FILE)  # шансы на победу для вызова и результата боя
+NEWBIE_STATS = new_player()
+
+fights = FightRegistry(FIGHT_TTL, MAX_FIGHTS_PER_PLAYER, cluster.partition_file(FIGHTS_FILE))  # активные вызовы на бой
+fight_stats = {"fights": 0, "api_calls": 0}  # сколько запросов к API стоит бой
+FIGHT_LOG_FILE = "fights.log"
+# История боёв для профиля; с шардами бой пишется в журналы шардов обоих игроков
+fight_log = cluster.wrap_fight_log(FightLog(cluster.partition_file(FIGHT_LOG_FILE)))
+match_queue = MatchQueue()  # /match: ждущие соперника по рейтингу (с шардами — только на MATCH_SHARD)
+tournament = None  # открытый турнир (Tournament) — один на бота
+# Замки всех участников держатся весь расчёт сетки; с шардами каждый чужой
+# замок — отдельный RPC с продлением аренды, поэтому сетка там меньше
+TOURNAMENT_MAX_PLAYERS = 200 if cluster.sharded else 1000
+
+# /notify: одна куча сроков роста на всех подписчиков своего шарда
+grow_notifier = GrowNotifier(bot, local_repo, player_locks, GROW_COOLDOWN)
+local_repo.subscribe(grow_notifier)
+
+instrument_persistence(metrics, local_repo, fights)
+metrics.gauge("players", "Игроков в хранилище (шарда)", local_repo.count)
+metrics.gauge("fights_open", "Открытых вызовов на бой", lambda: len(fights))
+metrics.gauge("updates_in_flight", "Апдейтов в обработке", lambda: update_limiter.in_flight)
+metrics.gauge("top_cache", "Кэш текстов топов", top_cache.stats)
+metrics.gauge("fight_registry", "Реестр вызовов на бой", fights.stats)
+metrics.gauge("fight_log", "Журнал боёв", fight_log.stats)
+metrics.gauge("match_queue", "Очередь подбора соперника", match_queue.stats)
+metrics.gauge("grow_notifier", "Напоминания о росте", grow_notifier.stats)
+metrics.gauge("callback_dedupe", "Повторные нажатия кнопок", callback_dedupe.stats)
+metrics.gauge("player_locks", "Замки игроков", player_locks.stats)
+metrics.gauge("outbox", "Планировщик исходящих запросов", outbox.stats)
+metrics.gauge("fight_api", "Бои и запросы get_chat ради них", lambda: fight_stats)
 
 ADMIN_ID = 887888895
 
-def init_player(user_id: str):
+async def init_player(user_id: int) -> dict:
     """Инициализация нового игрока"""
-    if user_id not in players:
-        players[user_id] = {
-            "attack": 10,  # стандарт 10 см
-            "defense": 2,  # стандарт 2 lvl
-            "wins": 0,
-            "losses": 0,
-            "last_grow": 0
-        }
-        save_players()
-
-def save_players():
-    """Сохранение данных игроков"""
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(players, f, ensure_ascii=False, indent=2)
+    return await repo.get_or_create(user_id)
 
 def get_name(user: types.User):
     """Получение имени пользователя"""
     return f"@{user.username}" if user.username else user.full_name[:20]
 
-def get_grow_cooldown_text(user_id: str) -> str:
+async def get_cached_user(user_id: int):
+    """Профиль из кэша, get_chat — только если его там нет"""
+    user = profile_cache.get(user_id)
+    if user is None:
+        fight_stats["api_calls"] += 1
+        user = await bot.get_chat(user_id)
+        profile_cache.put(user_id, user)
+    return user
+
+def get_grow_cooldown_text(p: dict) -> str:
     """Получение текста с оставшимся временем до следующего роста"""
     now_ts = int(datetime.now().timestamp())
-    last_grow_ts = players[user_id]["last_grow"]
+    last_grow_ts = p["last_grow"]
     remain = GROW_COOLDOWN - (now_ts - last_grow_ts)
     
     if remain <= 0:
@@ -117,459 +168,246 @@ def get_grow_cooldown_text(user_id: str) -> str:
     else:
         return f"Подожди {minutes}м {seconds}с"
 
-def can_grow(user_id: str) -> bool:
+def can_grow(p: dict) -> bool:
     """Проверка, можно ли расти"""
     now_ts = int(datetime.now().timestamp())
-    last_grow_ts = players[user_id]["last_grow"]
+    last_grow_ts = p["last_grow"]
     return now_ts - last_grow_ts >= GROW_COOLDOWN
 
-def grow_player(user_id: str) -> dict:
+async def grow_player(user_id: int, p: dict) -> dict:
     cucumber_change = random.randint(-2, 13)
     shield_change = random.randint(-2, 5)
-    players[user_id]["attack"] += cucumber_change
-    players[user_id]["defense"] += shield_change
-    players[user_id]["last_grow"] = int(datetime.now().timestamp())
-    save_players()
+    p["attack"] += cucumber_change
+    p["defense"] += shield_change
+    p["last_grow"] = int(datetime.now().timestamp())
+    await repo.save(user_id, p)
     return {
         "cucumber_change": cucumber_change,
         "shield_change": shield_change,
-        "new_attack": players[user_id]["attack"],
-        "new_defense": players[user_id]["defense"]
+        "new_attack": p["attack"],
+        "new_defense": p["defense"]
     }
 
-def calculate_battle_damage(attacker_stats, defender_stats):
-    """Улучшенная система расчета урона с большей случайностью"""
-    attack = attacker_stats["attack"]
-    defense = defender_stats["defense"]
-    
-    # Базовый урон с большим разбросом
-    base_damage = attack * random.uniform(0.5, 1.8)  # от 50% до 180% от атаки
-    
-    # Защита снижает урон, но не полностью
-    defense_reduction = defense * random.uniform(0.3, 0.8)  # защита работает от 30% до 80%
-    
-    # Финальный урон
-    damage = base_damage - defense_reduction
-    damage = max(1, round(damage))  # минимум 1 урона
-    
-    # Шанс критического удара (15%)
-    is_crit = random.random() < 0.15
-    if is_crit:
-        damage = int(damage * random.uniform(1.5, 2.5))  # крит от 150% до 250%
-    
-    # Шанс промаха (10%) - урон становится 0
-    is_miss = random.random() < 0.10
-    if is_miss:
-        damage = 0
-        is_crit = False
-    
-    # Шанс удачного удара (5%) - игнорирует защиту
-    is_lucky = random.random() < 0.05
-    if is_lucky and not is_miss:
-        damage = int(attack * random.uniform(1.2, 2.0))
-        return damage, is_crit, is_miss, is_lucky
-    
-    return damage, is_crit, is_miss, False
-
-def get_profile_text(user_id: str, user: types.User) -> str:
+def get_profile_text(p: dict, user: types.User) -> str:
     """Генерация текста профиля"""
-    if user_id not in players:
+    if p is None:
         return "❌ Сначала нужно начать игру!"
-    
-    p = players[user_id]
-    total = p["wins"] + p["losses"]
-    winrate = (p["wins"] / total * 100) if total > 0 else 0
-    
+    history = fight_log.last_fights(user.id)
+    names = {}  # соперники только из кэша профилей: профиль не ждёт get_chat
+    for record in history:
+        opponent_id = record.defender if record.attacker == user.id else record.attacker
+        profile = profile_cache.get(opponent_id)
+        if profile is not None:
+            names[opponent_id] = get_name(profile)
     return (
-        f"👤 Профиль {get_name(user)}\n"
-        f"🥒 Член: {p['attack']}см\n"
-        f"🍒Сиськи: {p['defense']} lvl\n"
-        f"🏆 Побед: {p['wins']}\n"
-        f"💀 Поражений: {p['losses']}\n"
-        f"📊 Винрейт: {winrate:.1f}%\n\n"
-        f"🕐 Рост: {get_grow_cooldown_text(user_id)}"
+        profile_text(get_name(user), p, get_grow_cooldown_text(p)) + "\n\n"
+        + fight_history_text(user.id, history, fight_log.streak(user.id), names)
     )
 
-def get_main_keyboard(owner_id: str) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👤 Профиль", callback_data=f"profile_{owner_id}")],
-        [InlineKeyboardButton(text="🌱 Вырастить член", callback_data=f"grow_{owner_id}")],
-        [InlineKeyboardButton(text="⚔️ Атака", callback_data=f"attack_{owner_id}")],
-        [InlineKeyboardButton(text="🏆 Топ", callback_data="top_wins")]
-    ])
-
-def get_fight_keyboard(attacker_id: str) -> InlineKeyboardMarkup:
-    """Создание клавиатуры для боя"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⚔️ Принять бой!", callback_data=f"fight_accept_{attacker_id}")]
-    ])
-
 # ===================
 # INLINE HANDLERS
 # ===================
 
+INLINE_CACHE_TIME = 300  # Telegram сам отвечает на повторные запросы 5 минут
+
 @dp.inline_query()
 async def inline_query_handler(query: InlineQuery):
-    """Обработчик inline запросов"""
-    user_id = str(query.from_user.id)
-    init_player(user_id)
-    
-    # Создаем статью с главным меню
-    article = InlineQueryResultArticle(
-        id="main_menu",
-        title="🎮 RPG H&C",
-        description="Твоя RPG игра с членами и сисками!",
-        input_message_content=InputTextMessageContent(
-            message_text="🎮 **RPG H&C** - твоя мини-RPG игра!\n\nВыбери действие:",
-            parse_mode="Markdown"
-        ),
-        reply_markup=get_main_keyboard(user_id),
-    )
-    
-    await query.answer([article], cache_time=1)
+    """Обработчик inline запросов (без записи: игрок создаётся при первом действии)"""
+    user_id = query.from_user.id
+    # Меню у каждого своё (кнопки с id владельца), поэтому кэш персональный
+    await query.answer(inline_results(user_id), cache_time=INLINE_CACHE_TIME, is_personal=True)
 
 # ===================
 # CALLBACK HANDLERS
 # ===================
 
-@dp.callback_query(lambda c: c.data.startswith("profile_"))
-async def callback_profile(callback: CallbackQuery):
+callback_router = CallbackRouter()  # callback_data -> хендлер
+
+handler_metrics = HandlerMetrics(metrics, callback_router)  # время каждого хендлера
+for observer in (dp.message, dp.inline_query, dp.callback_query):
+    observer.middleware(handler_metrics)
+
+@dp.callback_query()
+async def callback_dispatch(callback: CallbackQuery):
+    """Единая точка входа для всех кнопок: разбор callback_data один раз"""
+    route = callback_router.resolve(callback.data)
+    if route is None:
+        return UNHANDLED
+    handler, arg = route
+    return await handler(callback, arg)
+
+@callback_router.route("profile")
+async def callback_profile(callback: CallbackQuery, owner_id: int):
     """Показ профиля через callback с проверкой владельца"""
-    # Извлекаем ID владельца из callback_data
-    owner_id = callback.data.replace("profile_", "")
-    user_id = str(callback.from_user.id)
-    user = callback.from_user  # <--- добавь эту строку
+    user_id = callback.from_user.id
 
     # Проверяем, что пользователь может видеть только свой профиль
     if owner_id != user_id:
-        await callback.answer("❌ Это не твое меню! Создай свое через inline режим", show_alert=True)
-        return
-
-    init_player(user_id)
-
-    if user_id not in players:
-        await callback.answer("Сначала используй /grow!", show_alert=True)
+        await callback.answer(NOT_YOUR_MENU, show_alert=True)
         return
 
-    p = players[user_id]
-    total = p["wins"] + p["losses"]
-    winrate = (p["wins"] / total * 100) if total > 0 else 0
-
-    profile_text = (
-        f"👤 Профиль {get_name(user)}\n"
-        f"🥒 Член: {p['attack']}см\n"
-        f"🍒Сиськи: {p['defense']} лвл\n"
-        f"🏆 Побед: {p['wins']}\n"
-        f"💀 Поражений: {p['losses']}\n"
-        f"📊 Винрейт: {winrate:.1f}%"
-    )
-
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=profile_text,
-            inline_message_id=callback.inline_message_id,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-            ])
-        )
-    else:
-        await callback.message.edit_text(
-            text=profile_text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-            ])
-        )
+    p = await init_player(user_id)
+    await respond(callback, get_profile_text(p, callback.from_user), back_keyboard(user_id))
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("grow_"))
-async def callback_grow(callback: CallbackQuery):
+@callback_router.route("grow")
+async def callback_grow(callback: CallbackQuery, owner_id: int):
     """Рост огурца через callback с проверкой владельца"""
-    # Извлекаем ID владельца из callback_data
-    owner_id = callback.data.replace("grow_", "")
-    user_id = str(callback.from_user.id)
+    user_id = callback.from_user.id
     
     if owner_id != user_id:
-        await callback.answer("❌ Это не твое меню! Создай свое через inline режим", show_alert=True)
+        await callback.answer(NOT_YOUR_MENU, show_alert=True)
         return
     
-    init_player(user_id)
-
-    if not can_grow(user_id):
-        cooldown_text = get_grow_cooldown_text(user_id)
-        
-        if callback.inline_message_id:
-            await bot.edit_message_text(
-                text=f"⏰ {cooldown_text}",
-                inline_message_id=callback.inline_message_id,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-                ])
-            )
-        else:
-            await callback.message.edit_text(
-                f"⏰ {cooldown_text}",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-                ])
-            )
+    async with player_locks.hold(user_id):
+        p = await init_player(user_id)
+        result = await grow_player(user_id, p) if can_grow(p) else None
+
+    if result is None:
+        await respond(callback, cooldown_text(get_grow_cooldown_text(p)), cooldown_keyboard(user_id))
         await callback.answer("Еще рано растить! ⏰")
         return
 
-    # Новая система роста с большими значениями
-    result = grow_player(user_id)
-    
-    # Эмодзи для изменений
-    cucumber_emoji = "📈" if result["cucumber_change"] > 0 else "📉" if result["cucumber_change"] < 0 else "➡️"
-    shield_emoji = "📈" if result["shield_change"] > 0 else "📉" if result["shield_change"] < 0 else "➡️"
-    
-    # Дополнительные эмодзи для больших изменений
-    if result["cucumber_change"] >= 10:
-        cucumber_emoji = "🚀"
-    elif result["cucumber_change"] <= -2:
-        cucumber_emoji = "💥"
-        
-    if result["shield_change"] >= 4:
-        shield_emoji = "🚀"
-    elif result["shield_change"] <= -2:
-        shield_emoji = "💥"
-
-    grow_text = (
-        f"🌱 **Результат роста:**\n\n"
-        f"🥒 Член: {cucumber_emoji} {result['cucumber_change']:+}см (теперь {result['new_attack']}см)\n"
-        f"🍒Сиськи: {shield_emoji} {result['shield_change']:+} lvl (теперь {result['new_defense']} lvl)"
-    )
-    
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=grow_text,
-            inline_message_id=callback.inline_message_id,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-            ])
-        )
-    else:
-        await callback.message.edit_text(
-            grow_text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{user_id}")]
-            ])
-        )
+    await respond(callback, grow_text(result), back_keyboard(user_id), parse_mode="Markdown")
     await callback.answer("Ты вырос! 🌱")
 
-@dp.callback_query(lambda c: c.data.startswith("attack_"))
-async def callback_attack(callback: CallbackQuery):
+@callback_router.route("notify")
+async def callback_notify(callback: CallbackQuery, owner_id: int):
+    """Включение и выключение напоминания о росте (без правки сообщения)"""
+    if owner_id != callback.from_user.id:
+        await callback.answer(NOT_YOUR_MENU, show_alert=True)
+        return
+    # У inline-сообщения чата нет — напоминаем в личку
+    chat_id = callback.message.chat.id if callback.message else owner_id
+    await callback.answer(await toggle_grow_notify(owner_id, chat_id), show_alert=True)
+
+async def toggle_grow_notify(user_id: int, chat_id: int) -> str:
+    """Подписка на «можно растить»; расписание переставит GrowNotifier как наблюдатель"""
+    async with player_locks.hold(user_id):
+        p = await init_player(user_id)
+        p["notify"] = None if p.get("notify") is not None else chat_id
+        await repo.save(user_id, p)
+    if p.get("notify") is None:
+        return "🔕 Напоминание о росте выключено"
+    if can_grow(p):
+        return "🔔 Напоминание включено. А растить можно уже сейчас! 🌱"
+    return f"🔔 Напомню, когда можно будет растить ({get_grow_cooldown_text(p)})"
+
+@callback_router.route("attack")
+async def callback_attack(callback: CallbackQuery, owner_id: int):
     """Вызов на бой через callback (убираем проверку владельца для атаки)"""
-    # Извлекаем ID владельца из callback_data
-    owner_id = callback.data.replace("attack_", "")
-    user_id = str(callback.from_user.id)
+    user_id = callback.from_user.id
     
-    init_player(owner_id)  # инициализируем владельца (того, кто вызвал)
-    
-    p = players[owner_id]
+    p = await init_player(owner_id)  # инициализируем владельца (того, кто вызвал)
     
     # Создаем уникальный fight_id для этого боя
-    fight_id = f"fight_{owner_id}_{int(datetime.now().timestamp())}"
-    
-    attack_text = (
-        f"⚔ {get_name(callback.from_user)} вызывает на бой!\n"
-        f"Член: {p['attack']}, Сиськи: {p['defense']}\n"
-        f"Побед: {p['wins']}, поражений: {p['losses']}\n"
-    )
-    
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=attack_text,
-            inline_message_id=callback.inline_message_id,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⚔️ Согласиться", callback_data=f"accept_{fight_id}")]
-            ])
-        )
-    else:
-        await callback.message.edit_text(
-            text=attack_text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⚔️ Согласиться", callback_data=f"accept_{fight_id}")]
-            ])
-        )
-    
-    # Сохраняем информацию о вызове
-    pending_fights[fight_id] = owner_id
+    fight_id = fights.open(owner_id)
+    if owner_id == user_id:
+        profile_cache.put(owner_id, callback.from_user)
     
+    text = challenge_text(get_name(callback.from_user), p, await odds.win_chance(p, NEWBIE_STATS))
+    await respond(callback, text, challenge_keyboard(fight_id))
     await callback.answer("Ты готов к бою! ⚔️")
 
-@dp.callback_query(lambda c: c.data.startswith("accept_"))
-async def callback_fight_accept(callback: CallbackQuery):
-    fight_id = callback.data.replace("accept_", "")
-    if fight_id not in pending_fights:
+@callback_router.route("accept")
+async def callback_fight_accept(callback: CallbackQuery, fight_id: str):
+    attacker_id = fights.get(fight_id)
+    if attacker_id is None:
         await callback.answer("Этот бой уже завершен!", show_alert=True)
         return
 
-    attacker_id = pending_fights[fight_id]
-    defender_id = str(callback.from_user.id)
+    defender_id = callback.from_user.id
 
     if attacker_id == defender_id:
         await callback.answer("Нельзя сражаться с самим собой! 🤪", show_alert=True)
         return
 
-    if attacker_id not in players or defender_id not in players:
-        await callback.answer("Один из игроков не инициализирован!", show_alert=True)
+    try:
+        attacker_name = get_name(await get_cached_user(attacker_id))
+    except:
+        attacker_name = "Атакующий"
+    defender_name = get_name(callback.from_user)
+
+    ok, text = await play_fight(attacker_id, defender_id, attacker_name, defender_name, fight_id)
+    if not ok:
+        await callback.answer(text, show_alert=True)
         return
 
-    # Проверка на минимальные значения для боя
-    if players[attacker_id]["attack"] < 3 or players[attacker_id]["defense"] < 1:
-        await callback.answer("У противника слишком маленький член или защита для боя!", show_alert=True)
+    await respond(callback, text, new_fight_keyboard(defender_id), parse_mode="Markdown")
+    await callback.answer("Бой завершен! ⚔️")
+
+async def play_fight(attacker_id: int, defender_id: int, attacker_name: str, defender_name: str,
+                     fight_id: str = None):
+    """Бой двух игроков: (True, текст результата) или (False, почему не состоялся)
+
+    fight_id — вызов, который закрывается этим боем (None для подбора)
+    """
+    # Оба игрока под замком до сохранения: параллельный рост или другой бой
+    # с их участием подождёт, а не перезапишет результат
+    async with player_locks.hold(attacker_id, defender_id):
+        attacker = await repo.get(attacker_id)
+        defender = await init_player(defender_id)  # принятие боя может быть первым действием
+        if attacker is None or defender is None:
+            return False, "Один из игроков не инициализирован!"
+
+        # Проверка на минимальные значения для боя
+        if not can_fight(attacker):
+            return False, "У противника слишком маленький член или защита для боя!"
+        if not can_fight(defender):
+            return False, "У тебя слишком маленький член или защита для боя!"
+
+        # Закрываем вызов до расчёта: повторное нажатие его уже не найдёт
+        if fight_id is not None and fights.claim(fight_id) is None:
+            return False, "Этот бой уже завершен!"
+
+        # НОВАЯ система боя с рандомом
+        fight_stats["fights"] += 1
+
+        # Шансы до боя — из заранее посчитанной таблицы
+        chances = (await odds.win_chance(attacker, defender), await odds.win_chance(defender, attacker))
+
+        # Удары, победитель и перенос бонуса — общие с турниром
+        hit1, hit2, winner_side, bonus = resolve_fight(attacker, defender)
+        winner_name = None if winner_side is None else (attacker_name, defender_name)[winner_side]
+
+        await repo.save_many({attacker_id: attacker, defender_id: defender})
+        await fight_log.record([fight_entry(attacker_id, defender_id, hit1, hit2, winner_side, bonus)])
+
+    return True, fight_result_text(attacker_name, defender_name, chances, (hit1, hit2), winner_name, bonus)
+
+@callback_router.route("tour")
+async def callback_tournament_join(callback: CallbackQuery, organizer_id: int):
+    """Запись в открытый турнир; сообщение не правим — только всплывашка"""
+    if tournament is None or tournament.organizer_id != organizer_id:
+        await callback.answer("Регистрация на турнир закрыта", show_alert=True)
         return
-    if players[defender_id]["attack"] < 3 or players[defender_id]["defense"] < 1:
+    p = await init_player(callback.from_user.id)
+    if not can_fight(p):
         await callback.answer("У тебя слишком маленький член или защита для боя!", show_alert=True)
         return
+    if not tournament.join(callback.from_user.id, get_name(callback.from_user)):
+        await callback.answer(f"Ты уже в турнире (или мест нет). Участников: {len(tournament)}")
+        return
+    await callback.answer(f"Ты в турнире! 🏟 Участников: {len(tournament)}")
 
-    # НОВАЯ система боя с рандомом
-    attacker = players[attacker_id]
-    defender = players[defender_id]
-
-    # Рассчитываем урон для каждого игрока
-    dmg1, crit1, miss1, lucky1 = calculate_battle_damage(attacker, defender)
-    dmg2, crit2, miss2, lucky2 = calculate_battle_damage(defender, attacker)
-
-    # Определяем победителя
-    winner_attack_bonus = random.randint(2, 5)
-    winner_defense_bonus = random.randint(1, 3)
-
-    if dmg1 > dmg2:
-        attacker["wins"] += 1
-        defender["losses"] += 1
-        attacker["attack"] += winner_attack_bonus
-        attacker["defense"] += winner_defense_bonus
-        defender["attack"] -= winner_attack_bonus
-        defender["defense"] -= winner_defense_bonus
-        # ↓↓↓ Добавь это ↓↓↓
-        try:
-            attacker_user = await bot.get_chat(int(attacker_id))
-            attacker_name = f"@{attacker_user.username}" if attacker_user.username else attacker_user.full_name[:20]
-        except:
-            attacker_name = "Атакующий"
-        result = f"🏆 Победитель: {attacker_name}"
-        winner_bonus = f"\n🎁 Получает: +{winner_attack_bonus}см члена, +{winner_defense_bonus} lvl сисек"
-    elif dmg2 > dmg1:
-        defender["wins"] += 1
-        attacker["losses"] += 1
-        defender["attack"] += winner_attack_bonus
-        defender["defense"] += winner_defense_bonus
-        attacker["attack"] -= winner_attack_bonus
-        attacker["defense"] -= winner_defense_bonus
-        result = f"🏆 Победитель: {get_name(callback.from_user)}"
-        winner_bonus = f"\n🎁 Получает: +{winner_attack_bonus}см члена,+{winner_defense_bonus} lvl сисек"
-    else:
-        result = "🤝 Ничья! Никто не получает награды."
-        winner_bonus = ""
-
-    save_players()
-    del pending_fights[fight_id]
-
-    # Формируем детальный результат боя
-    try:
-        attacker_user = await bot.get_chat(int(attacker_id))
-        attacker_name = f"@{attacker_user.username}" if attacker_user.username else attacker_user.full_name[:20]
-    except:
-        attacker_name = "Атакующий"
-    
-    text = "⚔️ **Результат боя:**\n\n"
-    
-    # Результат атаки первого игрока
-    text += f"🔸 {attacker_name}:\n"
-    if miss1:
-        text += f"   💨 Промах! (0 урона)"
-    else:
-        text += f"   💥 {dmg1} урона"
-        if crit1:
-            text += " 🔥КРИТ!"
-        if lucky1:
-            text += " ⭐УДАЧА!"
-    text += "\n"
-    
-    # Результат атаки второго игрока
-    text += f"🔹 {get_name(callback.from_user)}:\n"
-    if miss2:
-        text += f"   💨 Промах! (0 урона)"
-    else:
-        text += f"   💥 {dmg2} урона"
-        if crit2:
-            text += " 🔥КРИТ!"
-        if lucky2:
-            text += " ⭐УДАЧА!"
-    text += "\n\n"
-    
-    text += result + winner_bonus
-
-    # Обновляем сообщение с результатом боя
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=text,
-            inline_message_id=callback.inline_message_id,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Новый бой", callback_data=f"back_to_menu_{defender_id}")]
-            ])
-        )
-    else:
-        await callback.message.edit_text(
-            text=text,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔄 Новый бой", callback_data=f"back_to_menu_{defender_id}")]
-            ])
-        )
-    
-    await callback.answer("Бой завершен! ⚔️")
-
-@dp.callback_query(lambda c: c.data.startswith("back_to_menu_"))
-async def callback_back_to_menu(callback: CallbackQuery):
+@callback_router.route("back")
+async def callback_back_to_menu(callback: CallbackQuery, owner_id: int):
     """Возврат к главному меню с проверкой владельца"""
-    # Извлекаем ID владельца из callback_data
-    owner_id = callback.data.replace("back_to_menu_", "")
-    user_id = str(callback.from_user.id)
+    user_id = callback.from_user.id
     
     # Проверяем, что пользователь может управлять только своим меню
     if owner_id != user_id:
-        await callback.answer("❌ Это не твое меню! Создай свое через inline режим", show_alert=True)
+        await callback.answer(NOT_YOUR_MENU, show_alert=True)
         return
     
-    menu_text = "🎮 **RPG H&C** - твоя мини-RPG игра!\n\nВыбери действие:"
-    
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=menu_text,
-            inline_message_id=callback.inline_message_id,
-            parse_mode="Markdown",
-            reply_markup=get_main_keyboard(user_id)
-        )
-    else:
-        await callback.message.edit_text(
-            text=menu_text,
-            parse_mode="Markdown",
-            reply_markup=get_main_keyboard(user_id)
-        )
+    await respond(callback, MENU_TEXT, main_keyboard(user_id), parse_mode="Markdown")
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("top_"))
-async def callback_top_table(callback: CallbackQuery):
-    top_type = callback.data.replace("top_", "")
-    owner_id = str(callback.from_user.id)
+@callback_router.route("top")
+async def callback_top_table(callback: CallbackQuery, top_type: str):
+    owner_id = callback.from_user.id
     text = await get_top_text(top_type)
-    kb = get_top_keyboard(top_type, owner_id)
-    if callback.inline_message_id:
-        await bot.edit_message_text(
-            text=text,
-            inline_message_id=callback.inline_message_id,
-            reply_markup=kb
-        )
-    else:
-        await callback.message.edit_text(
-            text=text,
-            reply_markup=kb
-        )
+    await respond(callback, text, top_keyboard(top_type, owner_id))
     await callback.answer()
 
 # ===================
@@ -579,15 +417,15 @@ async def callback_top_table(callback: CallbackQuery):
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     """Команда старт"""
-    user_id = str(message.from_user.id)
-    init_player(user_id)
+    user_id = message.from_user.id
+    await init_player(user_id)
     
     await message.answer(
         f"🎮 Добро пожаловать в **RPG H&C**, (автор @knnzas), {get_name(message.from_user)}!\n\n"
         f"Как играть:\n"
         f"Ты можешь использовать бота двумя способами:\n"
         f"1️⃣ **Inline режим**: напиши `@{(await bot.get_me()).username}` в любом чате\n"
-        f"2️⃣ **Команды**: /grow, /profile, /fight\n\n"
+        f"2️⃣ **Команды**: /grow, /profile, /fight, /match, /notify\n\n"
         f"🌱 **Возможности:**\n"
         f"• Расти свой член для - Атаки\n"
         f"• Увеличивать уровень своих Сисек для - Защиты\n"
@@ -602,44 +440,24 @@ async def cmd_start(message: Message):
 @dp.message(Command("grow"))
 async def cmd_grow(message: Message):
     """Команда роста (совместимость)"""
-    user_id = str(message.from_user.id)
-    init_player(user_id)
+    user_id = message.from_user.id
+    async with player_locks.hold(user_id):
+        p = await init_player(user_id)
+        result = await grow_player(user_id, p) if can_grow(p) else None
     
-    if not can_grow(user_id):
-        cooldown_text = get_grow_cooldown_text(user_id)
-        await message.answer(f"⏰ {cooldown_text}")
+    if result is None:
+        await message.answer(cooldown_text(get_grow_cooldown_text(p)))
         return
-    
-    result = grow_player(user_id)
-    cucumber_emoji = "📈" if result["cucumber_change"] > 0 else "📉" if result["cucumber_change"] < 0 else "➡️"
-    shield_emoji = "📈" if result["shield_change"] > 0 else "📉" if result["shield_change"] < 0 else "➡️"
-    
-    # Специальные эмодзи для экстремальных значений
-    if result["cucumber_change"] >= 10:
-        cucumber_emoji = "🚀"
-    elif result["cucumber_change"] <= -2:
-        cucumber_emoji = "💥"
-        
-    if result["shield_change"] >= 4:
-        shield_emoji = "🚀"
-    elif result["shield_change"] <= -2:
-        shield_emoji = "💥"
-    
-    await message.answer(
-        f"🌱 **Результат роста:**\n\n"
-        f"🥒 Член: {cucumber_emoji} {result['cucumber_change']:+}см (теперь {result['new_attack']}см)\n"
-        f"🍒Сиськи: {shield_emoji} {result['shield_change']:+} lvl (теперь {result['new_defense']} lvl)",
-        parse_mode="Markdown"
-    )
+
+    await message.answer(grow_text(result), parse_mode="Markdown")
 
 @dp.message(Command("profile"))
 async def cmd_profile(message: Message):
     """Команда профиля (совместимость)"""
-    user_id = str(message.from_user.id)
-    init_player(user_id)
+    user_id = message.from_user.id
+    p = await init_player(user_id)
     
-    profile_text = get_profile_text(user_id, message.from_user)
-    await message.answer(profile_text)
+    await message.answer(get_profile_text(p, message.from_user))
 
 @dp.message(Command("fight"))
 async def cmd_fight(message: Message):
@@ -648,36 +466,64 @@ async def cmd_fight(message: Message):
         await message.answer("Ответь этой командой на сообщение игрока, чтобы вызвать его на бой!")
         return
     
-    user_id = str(message.from_user.id)
-    init_player(user_id)
+    user_id = message.from_user.id
+    p = await init_player(user_id)
     
-    p = players[user_id]
     await message.answer(
-        f"⚔️ **{get_name(message.from_user)} готов к бою!**\n\n"
-        f"🥒 Член: {p['attack']}см\n"
-        f"🍒Сиськи: {p['defense']} lvl\n"
-        f"🏆 Побед: {p['wins']}\n"
-        f"💀 Поражений: {p['losses']}\n\n"
-        f"Кто осмелится принять вызов?\n"
-        f"💡 *Теперь в боях есть криты, промахи и удача!*",
+        fight_call_text(get_name(message.from_user), p),
         parse_mode="Markdown",
-        reply_markup=get_fight_keyboard(user_id)
+        reply_markup=fight_keyboard(user_id)
     )
 
+@dp.message(Command("notify"))
+async def cmd_notify(message: Message):
+    """Напоминание о росте в этот чат; повторная команда — выключить"""
+    await message.answer(await toggle_grow_notify(message.from_user.id, message.chat.id))
+
+@dp.message(Command("match"))
+async def cmd_match(message: Message):
+    """Подбор соперника по рейтингу; повторная команда — выход из очереди"""
+    user_id = message.from_user.id
+    if match_queue.leave(user_id):
+        await message.answer(MATCH_LEFT)
+        return
+
+    p = await init_player(user_id)
+    if not can_fight(p):
+        await message.answer("У тебя слишком маленький член или защита для боя!")
+        return
+
+    user_rating = rating(p)
+    match = match_queue.join(user_id, user_rating, message.chat.id)
+    if match is None:
+        await message.answer(match_wait_text(user_rating))
+        return
+
+    opponent_id, opponent_chat = match
+    await run_match(opponent_id, opponent_chat, user_id, message.chat.id)
+
+async def run_match(attacker_id: int, attacker_chat: int, defender_id: int, defender_chat: int):
+    """Бой найденной пары; результат — в чаты, где каждый вставал в очередь"""
+    names = []
+    for user_id in (attacker_id, defender_id):
+        try:
+            names.append(get_name(await get_cached_user(user_id)))
+        except Exception:
+            names.append(f"ID:{user_id}")
+    ok, text = await play_fight(attacker_id, defender_id, *names)
+    parse_mode = "Markdown" if ok else None
+    for chat_id in dict.fromkeys((defender_chat, attacker_chat)):
+        try:
+            await bot.send_message(chat_id, text, parse_mode=parse_mode)
+        except Exception:
+            logging.exception("Не удалось отправить результат подбора в чат %s", chat_id)
+
 @dp.message(Command("admin_reset_all"))
 async def admin_reset_all(message: Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer("Нет доступа.")
         return
-    for user_id in players:
-        players[user_id] = {
-            "attack": 10,
-            "defense": 2,
-            "wins": 0,
-            "losses": 0,
-            "last_grow": 0
-        }
-    save_players()
+    await repo.reset_all()
     await message.answer("✅ Все пользователи сброшены.")
 
 @dp.message(Command("admin_reset"))
@@ -688,15 +534,9 @@ async def admin_reset(message: Message):
     if not message.reply_to_message:
         await message.answer("Ответь этой командой на сообщение пользователя для сброса.")
         return
-    target_id = str(message.reply_to_message.from_user.id)
-    players[target_id] = {
-        "attack": 10,
-        "defense": 2,
-        "wins": 0,
-        "losses": 0,
-        "last_grow": 0
-    }
-    save_players()
+    target_id = message.reply_to_message.from_user.id
+    async with player_locks.hold(target_id):
+        await repo.save(target_id, new_player())
     await message.answer(f"✅ Пользователь {get_name(message.reply_to_message.from_user)} сброшен.")
 
 @dp.message(Command("admin_set"))
@@ -717,20 +557,250 @@ async def admin_set(message: Message):
     except ValueError:
         await message.answer("Значения должны быть числами.")
         return
-    target_id = str(message.reply_to_message.from_user.id)
-    if target_id not in players:
-        init_player(target_id)
-    players[target_id]["attack"] = attack
-    players[target_id]["defense"] = defense
-    save_players()
+    target_id = message.reply_to_message.from_user.id
+    async with player_locks.hold(target_id):
+        p = await init_player(target_id)
+        p["attack"] = attack
+        p["defense"] = defense
+        await repo.save(target_id, p)
     await message.answer(f"✅ Установлено {attack}см и {defense} lvl для {get_name(message.reply_to_message.from_user)}.")
+
+@dp.message(Command("tournament_open"))
+async def admin_tournament_open(message: Message):
+    """Открыть регистрацию: /tournament_open [single|round]"""
+    global tournament
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    if tournament is not None:
+        await message.answer("Турнир уже открыт: /tournament_start или /tournament_cancel")
+        return
+    parts = message.text.split()
+    mode = parts[1] if len(parts) > 1 else "single"
+    if mode not in TOURNAMENT_MODES:
+        await message.answer("Формат: /tournament_open single|round")
+        return
+    tournament = Tournament(message.from_user.id, message.chat.id, mode, TOURNAMENT_MAX_PLAYERS)
+    await message.answer(
+        tournament_open_text(TOURNAMENT_MODES[mode]),
+        parse_mode="Markdown",
+        reply_markup=tournament_keyboard(message.from_user.id)
+    )
+
+@dp.message(Command("tournament_cancel"))
+async def admin_tournament_cancel(message: Message):
+    global tournament
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    tournament = None
+    await message.answer("Турнир отменён.")
+
+@dp.message(Command("tournament_start"))
+async def admin_tournament_start(message: Message):
+    """Все бои сетки в памяти, одна запись игроков и одно итоговое сообщение
+
+    Замки участников держатся от чтения записей до save_many (не дольше
+    расчёта сетки из TOURNAMENT_MAX_PLAYERS игроков); журнал боёв
+    пишется уже после них.
+    """
+    global tournament
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    if tournament is None or len(tournament) < 2:
+        await message.answer("Нужен открытый турнир хотя бы с двумя участниками.")
+        return
+    tour, tournament = tournament, None  # новые записи уже не принимаются
+
+    user_ids = list(tour.players)
+    async with player_locks.hold(*user_ids):
+        records = {}
+        for user_id in user_ids:
+            records[user_id] = (await init_player(user_id)).copy()
+        # Круговой на 1000 игроков — сотни тысяч пар, считаем вне цикла событий
+        standings = await asyncio.to_thread(tour.run, records)
+        await repo.save_many(records)
+    await fight_log.record(tour.history)
+    fight_stats["fights"] += tour.fights
+
+    text = tournament_summary_text(TOURNAMENT_MODES[tour.mode], tour.players, standings,
+                                   tour.fights, tour.wins, tour.losses)
+    await bot.send_message(tour.chat_id, text)
+
+class AdminProgress:
+    """Прогресс долгой операции: правка одного сообщения не чаще раза в interval секунд"""
+
+    def __init__(self, status: Message, title: str, interval: float = 3):
+        self.status = status
+        self.title = title
+        self.interval = interval
+        self._edited = time.monotonic()
+        self._task = None
+
+    def __call__(self, seen: int, done: int):
+        now = time.monotonic()
+        if now - self._edited < self.interval or (self._task is not None and not self._task.done()):
+            return
+        self._edited = now
+        self._task = asyncio.create_task(
+            self.status.edit_text(f"⏳ {self.title}: обработано {seen}, затронуто {done}"))
+
+def parse_bulk_args(text: str):
+    """/admin_bulk <reset|adjust|prune> [set ...] [where ...] -> (op, assignments, where)"""
+    match = re.match(r"^/\S+\s+(\w+)(?:\s+set\s+(.+?))?(?:\s+where\s+(.+))?\s*$", text or "", re.S)
+    if match is None:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+@dp.message(Command("admin_export"))
+async def admin_export(message: Message):
+    """Выгрузка игроков файлом: /admin_export [csv] [where <выражение>]"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    if cluster.sharded:
+        await message.answer("С шардами выгрузка — через python bulk.py по файлам шардов.")
+        return
+    match = re.match(r"^/\S+(?:\s+(csv|ndjson))?(?:\s+where\s+(.+))?\s*$", message.text or "", re.S)
+    if match is None:
+        await message.answer("Формат: /admin_export [csv] [where wins > 10]")
+        return
+    fmt = match.group(1) or "ndjson"
+    path = f"export.{fmt}"
+    status = await message.answer("⏳ Выгрузка...")
+    try:
+        count = await export_players(local_repo, path, fmt, match.group(2), progress=AdminProgress(status, "Выгрузка"))
+    except (ValueError, SyntaxError, ArithmeticError, TypeError) as e:
+        await status.edit_text(f"❌ {e}")
+        return
+    try:
+        await message.answer_document(FSInputFile(path), caption=f"✅ Игроков: {count}")
+    finally:
+        os.remove(path)
+
+@dp.message(Command("admin_import"))
+async def admin_import(message: Message):
+    """Загрузка игроков из NDJSON/CSV: командой ответить на сообщение с файлом"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    document = message.reply_to_message.document if message.reply_to_message else None
+    if document is None:
+        await message.answer("Ответь этой командой на сообщение с файлом .ndjson или .csv")
+        return
+    file_name = (document.file_name or "").lower()  # у некоторых загрузок имени нет
+    path = f"import.{os.getpid()}.{'csv' if file_name.endswith('.csv') else 'ndjson'}"
+    status = await message.answer("⏳ Загрузка...")
+    try:
+        await bot.download(document, destination=path)
+        count = await import_players(repo, path, locks=player_locks, progress=AdminProgress(status, "Загрузка"))
+    except (ValueError, KeyError) as e:
+        await status.edit_text(f"❌ Ошибка в файле: {e}")
+        return
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    await status.edit_text(f"✅ Загружено игроков: {count}")
+
+@dp.message(Command("admin_bulk"))
+async def admin_bulk(message: Message):
+    """Массовые операции: /admin_bulk reset|adjust|prune [set ...] [where ...]"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    args = parse_bulk_args(message.text)
+    if args is None or args[0] not in BULK_OPERATIONS:
+        await message.answer(
+            "Формат: /admin_bulk reset|adjust|prune [set поле = выражение, ...] [where условие]\n"
+            "Пример: /admin_bulk prune where wins + losses == 0 and now - last_grow > 90 * DAY"
+        )
+        return
+    op, assignments, where = args
+    status = await message.answer("⏳ Обработка...")
+    try:
+        if cluster.sharded:  # каждый шард — свою часть игроков, в фоне; ход опрашивается
+            count = await cluster.bulk(op, where, assignments, progress=AdminProgress(status, "Обработка"))
+        else:
+            count = await bulk_update(local_repo, op, where, assignments, locks=player_locks,
+                                      progress=AdminProgress(status, "Обработка"))
+    except (ValueError, SyntaxError, ArithmeticError, TypeError) as e:
+        await status.edit_text(f"❌ {e}")
+        return
+    await status.edit_text(f"✅ {op}: затронуто игроков {count}")
+
+@dp.message(Command("admin_stats"))
+async def admin_stats(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("Нет доступа.")
+        return
+    stats = top_cache.stats()
+    fights_count = fight_stats["fights"]
+    api_per_fight = (fight_stats["api_calls"] / fights_count) if fights_count > 0 else 0
+    fight_registry_stats = fights.stats()
+    lock_stats = player_locks.stats()
+    outbox_stats = outbox.stats()
+    await message.answer(
+        f"📈 Кэш топов: {stats['hits']} попаданий, {stats['misses']} промахов "
+        f"({stats['hit_rate']:.1f}%), сбросов: {stats['invalidations']}\n"
+        f"⚔️ Боёв: {fights_count}, запросов к API на бой: {api_per_fight:.2f}\n"
+        f"📨 Вызовов: открыто {fight_registry_stats['open']}, просрочено {fight_registry_stats['expired']}, "
+        f"вытеснено {fight_registry_stats['evicted']}\n"
+        f"🔒 Замки: {lock_stats['acquisitions']} захватов, {lock_stats['contended']} с ожиданием, "
+        f"ждали {lock_stats['wait_ms']:.0f} мс\n"
+        f"📤 API: отправлено {outbox_stats['sent']}, в очереди {outbox_stats['queued']} "
+        f"(макс. {outbox_stats['max_queued']}), склеено правок {outbox_stats['coalesced']}, "
+        f"повторов {outbox_stats['retries']}"
+    )
 @dp.message(Command("top"))
 async def cmd_top(message: Message):
-    user_id = str(message.from_user.id)
+    user_id = message.from_user.id
     text = await get_top_text("wins")
-    kb = get_top_keyboard("wins", user_id)
-    await message.answer(text, reply_markup=kb)
+    await message.answer(text, reply_markup=top_keyboard("wins", user_id))
+
+async def matchmaking_loop():
+    """Раз в секунду — подбор для дольше всех ждущих: их допуск вырос"""
+    while True:
+        await asyncio.sleep(1)
+        for attacker_id, attacker_chat, defender_id, defender_chat in match_queue.tick():
+            await run_match(attacker_id, attacker_chat, defender_id, defender_chat)
+
+async def expire_fights_loop():
+    """Периодическая очистка просроченных вызовов"""
+    while True:
+        await asyncio.sleep(60)
+        fights.expire()
+
+@dp.startup()
+async def on_startup(dispatcher: Dispatcher):
+    """Открытие хранилища игроков и журнала боёв, восстановление вызовов"""
+    await repo.open()
+    fights.load()
+    odds.load()
+    await asyncio.to_thread(fight_log.open)
+    await metrics.start_server(port=METRICS_PORT + cluster.index if METRICS_PORT else 0)
+    dispatcher["expire_fights_task"] = asyncio.create_task(expire_fights_loop())
+    dispatcher["matchmaking_task"] = asyncio.create_task(matchmaking_loop())
+    await grow_notifier.rebuild()  # с шардами — только свои игроки
+    dispatcher["grow_notifier_task"] = asyncio.create_task(grow_notifier.run())
+    dispatcher["fight_log_task"] = asyncio.create_task(fight_log.run())
+
+@dp.shutdown()
+async def on_shutdown(dispatcher: Dispatcher):
+    """Закрытие хранилища (для json — сброс журнала в снапшот)"""
+    # Сначала дожидаемся хендлеров в работе, потом финальное сохранение
+    await update_limiter.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    dispatcher["expire_fights_task"].cancel()
+    dispatcher["matchmaking_task"].cancel()
+    dispatcher["grow_notifier_task"].cancel()
+    dispatcher["fight_log_task"].cancel()
+    fights.save()
+    await fight_log.close()  # остаток хвоста и индекс последних боёв
+    if odds.lazy_cells:
+        odds.save()  # лениво посчитанные клетки пригодятся после перезапуска
+    await repo.close()
+    await metrics.stop_server()
+
 if __name__ == "__main__":
-    import asyncio
     print("🚀 RPG H&C бот запущен!")
-    asyncio.run(dp.start_polling(bot))
\ No newline at end of file
+    run(dp, bot, cluster)
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""Потоковые выгрузка и загрузка игроков и массовые операции
+
+Файлы читаются и пишутся построчно, игроки идут пачками через
+iter_players / save_many, поэтому память не зависит от размера файла
+(с PLAYER_BACKEND=sqlite — и от размера базы).
+
+    python bulk.py export players.ndjson
+    python bulk.py export players.csv --where "wins + losses > 0"
+    python bulk.py import players.ndjson
+    python bulk.py reset --where "losses > 100"
+    python bulk.py adjust --set "attack = attack + 5, defense = max(defense, 1)"
+    python bulk.py prune --where "wins + losses == 0 and now - last_grow > 90 * DAY"
+
+Команды CLI работают с файлами напрямую — бот в это время должен быть
+остановлен (у работающего бота те же операции есть в /admin_*).
+"""
+import os
+import ast
+import csv
+import json
+import time
+import asyncio
+import argparse
+
+from records import PlayerRecord
+from repository import create_repository, new_player
+
+# Колонки выгрузки: id и поля PlayerRecord
+COLUMNS = ("id",) + PlayerRecord.FIELDS + ("name", "notify")
+INT_COLUMNS = set(COLUMNS) - {"name"}
+
+# Имена, доступные в выражениях: поля игрока, id, текущее время и функции
+EXPR_NAMES = set(COLUMNS) | {"now", "DAY", "HOUR", "abs", "min", "max"}
+EXPR_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot,
+    ast.Name, ast.Load, ast.Constant, ast.Call,
+)
+EXPR_FUNCS = {"abs": abs, "min": min, "max": max}
+
+
+def _compile_expr(source: str):
+    """Выражение над полями игрока -> функция (user_id, p); только арифметика и сравнения"""
+    tree = ast.parse(source.strip(), mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, EXPR_NODES):
+            raise ValueError(f"Недопустимо в выражении: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in EXPR_NAMES:
+            raise ValueError(f"Неизвестное имя в выражении: {node.id}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in EXPR_FUNCS):
+            raise ValueError("В выражении можно вызывать только abs, min и max")
+    code = compile(tree, "<expr>", "eval")
+    # Проверенное AST: без атрибутов, индексов и builtins
+    scope = {"__builtins__": {}, "DAY": 86400, "HOUR": 3600, **EXPR_FUNCS}
+
+    def evaluate(user_id: int, p: PlayerRecord, now: int):
+        names = {field: getattr(p, field) for field in PlayerRecord.__slots__}
+        names["id"] = user_id
+        names["now"] = now
+        return eval(code, scope, names)
+    return evaluate
+
+
+def compile_filter(where: str = None):
+    """Фильтр --where: функция (user_id, p, now) -> bool; None — все игроки"""
+    if not where:
+        return None
+    evaluate = _compile_expr(where)
+    return lambda user_id, p, now: bool(evaluate(user_id, p, now))
+
+
+def compile_assignments(assignments: str):
+    """--set "attack = attack + 5, defense = 1" -> функция, меняющая запись на месте"""
+    compiled = []
+    for part in _split_top_level(assignments):
+        field, sep, expr = part.partition("=")
+        field = field.strip()
+        if not sep or field not in PlayerRecord.FIELDS:
+            raise ValueError(f"Ожидалось поле = выражение (поля: {', '.join(PlayerRecord.FIELDS)}): {part}")
+        compiled.append((field, _compile_expr(expr)))
+    if not compiled:
+        raise ValueError("Нечего менять: пустой --set")
+
+    def apply(user_id: int, p: PlayerRecord, now: int):
+        # Все правые части считаются по старым значениям, как в SQL UPDATE
+        values = [(field, int(evaluate(user_id, p, now))) for field, evaluate in compiled]
+        for field, value in values:
+            setattr(p, field, value)
+    return apply
+
+
+def _split_top_level(source: str) -> list:
+    """Разбиение по запятым вне скобок (внутри могут быть min(a, b))"""
+    parts, depth, current = [], 0, []
+    for char in source:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return [part for part in parts if part.strip()]
+
+
+def _format_of(path: str, fmt: str = None) -> str:
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return fmt
+
+
+# ===================
+# ВЫГРУЗКА И ЗАГРУЗКА
+# ===================
+
+async def export_players(repo, path: str, fmt: str = None, where: str = None,
+                         batch: int = 1000, progress=None) -> int:
+    """Игроки (по фильтру) в NDJSON или CSV; возвращает число выгруженных"""
+    fmt = _format_of(path, fmt)
+    matches = compile_filter(where)
+    now = int(time.time())
+    written = seen = 0
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(COLUMNS)
+        async for part in repo.iter_players(batch):
+            seen += len(part)
+            rows = [(user_id, p) for user_id, p in part if matches is None or matches(user_id, p, now)]
+            if writer is not None:
+                writer.writerows(
+                    [user_id] + [getattr(p, field) for field in COLUMNS[1:]] for user_id, p in rows
+                )
+            else:
+                f.write("".join(
+                    json.dumps({"id": user_id, **p.to_dict()}, ensure_ascii=False, separators=(",", ":")) + "\n"
+                    for user_id, p in rows
+                ))
+            written += len(rows)
+            if progress:
+                progress(seen, written)
+    os.replace(tmp_path, path)
+    return written
+
+
+def _read_rows(path: str, fmt: str):
+    """(user_id, PlayerRecord) из файла, по одной строке"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                data = {
+                    key: (int(value) if key in INT_COLUMNS else value) if value != "" else None
+                    for key, value in row.items() if key in COLUMNS
+                }
+                yield data.pop("id"), PlayerRecord.from_dict(data)
+        else:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield int(data.pop("id")), PlayerRecord.from_dict(data)
+
+
+async def import_players(repo, path: str, fmt: str = None, batch: int = 1000, locks=None, progress=None) -> int:
+    """Загрузка игроков из NDJSON или CSV пачками по batch через save_many
+
+    Существующие игроки перезаписываются, остальные не трогаются.
+    """
+    fmt = _format_of(path, fmt)
+    loaded = 0
+    chunk = {}
+    for user_id, p in _read_rows(path, fmt):
+        chunk[user_id] = p
+        if len(chunk) >= batch:
+            await _save_chunk(repo, chunk, locks)
+            loaded += len(chunk)
+            chunk = {}
+            if progress:
+                progress(loaded, loaded)
+    if chunk:
+        await _save_chunk(repo, chunk, locks)
+        loaded += len(chunk)
+        if progress:
+            progress(loaded, loaded)
+    return loaded
+
+
+async def _save_chunk(repo, chunk: dict, locks=None):
+    if locks is None:
+        await repo.save_many(chunk)
+        return
+    async with locks.hold(*chunk):
+        await repo.save_many(chunk)
+
+
+# ===================
+# МАССОВЫЕ ОПЕРАЦИИ
+# ===================
+
+OPERATIONS = ("reset", "adjust", "prune")
+
+
+async def bulk_update(repo, op: str, where: str = None, assignments: str = None,
+                      batch: int = 1000, locks=None, progress=None) -> int:
+    """reset / adjust / prune игроков по фильтру; возвращает число затронутых
+
+    Пачка игроков проверяется и меняется под их замками (если locks
+    заданы) и сохраняется одним save_many / delete_many. reset
+    делает игрока новичком целиком (без имени и подписки на напоминания),
+    как reset_all хранилища.
+    """
+    if op not in OPERATIONS:
+        raise ValueError(f"Неизвестная операция: {op}")
+    if op == "prune" and not where:
+        raise ValueError("prune без --where удалил бы всех игроков")
+    matches = compile_filter(where)
+    apply = compile_assignments(assignments) if op == "adjust" else None
+    now = int(time.time())
+    touched = seen = 0
+    async for part in repo.iter_players(batch):
+        seen += len(part)
+        if locks is not None:
+            async with locks.hold(*(user_id for user_id, _ in part)):
+                # Перечитываем под замком: запись из iter_players могла устареть
+                part = [(user_id, await repo.get(user_id)) for user_id, _ in part]
+                touched += await _apply_chunk(repo, op, part, matches, apply, now)
+        else:
+            touched += await _apply_chunk(repo, op, part, matches, apply, now)
+        if progress:
+            progress(seen, touched)
+    return touched
+
+
+async def _apply_chunk(repo, op: str, part: list, matches, apply, now: int) -> int:
+    changed = {}
+    for user_id, p in part:
+        if p is None or (matches is not None and not matches(user_id, p, now)):
+            continue
+        if op == "reset":
+            p = new_player()
+        elif op == "adjust":
+            apply(user_id, p, now)
+        changed[user_id] = p
+    if not changed:
+        return 0
+    if op == "prune":
+        await repo.delete_many(list(changed))
+    else:
+        await repo.save_many(changed)
+    return len(changed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка, загрузка и массовые операции над игроками")
+    parser.add_argument("--backend", default=os.getenv("PLAYER_BACKEND", "json"), choices=("json", "sqlite"))
+    parser.add_argument("--data", default="players.json", help="снапшот json-хранилища")
+    parser.add_argument("--db", default="players.db", help="база sqlite")
+    parser.add_argument("--batch", type=int, default=1000)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="игроки в файл")
+    export.add_argument("path")
+    export.add_argument("--format", choices=("ndjson", "csv"))
+    export.add_argument("--where")
+    load = sub.add_parser("import", help="игроки из файла (id совпал — перезапись)")
+    load.add_argument("path")
+    load.add_argument("--format", choices=("ndjson", "csv"))
+    for op in OPERATIONS:
+        command = sub.add_parser(op, help={"reset": "сброс статов", "adjust": "изменение статов",
+                                           "prune": "удаление игроков"}[op])
+        command.add_argument("--where", required=op == "prune")
+        if op == "adjust":
+            command.add_argument("--set", dest="assignments", required=True)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def progress(seen, done):
+        print(f"\rобработано {seen}, затронуто {done} ({time.perf_counter() - started:.1f} с)",
+              end="", flush=True)
+
+    async def run():
+        repo = create_repository(args.backend, args.data, args.db)
+        await repo.open()
+        try:
+            if args.command == "export":
+                return await export_players(repo, args.path, args.format, args.where, args.batch, progress)
+            if args.command == "import":
+                return await import_players(repo, args.path, args.format, args.batch, progress=progress)
+            return await bulk_update(repo, args.command, args.where, getattr(args, "assignments", None),
+                                     args.batch, progress=progress)
+        finally:
+            await repo.close()
+
+    count = asyncio.run(run())
+    print(f"\nГотово: {count} игроков за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from typing import NamedTuple
+
+
+class CallbackAction(NamedTuple):
+    """Разобранная callback_data: вид действия и его аргумент"""
+    kind: str  # profile / grow / attack / accept / back / top / tour / notify
+    arg: object  # id владельца меню или организатора турнира (int), fight_id или тип топа (str)
+
+
+# Первое слово callback_data -> (вид действия, обязательное продолжение префикса)
+PREFIXES = {
+    "profile": ("profile", ""),
+    "grow": ("grow", ""),
+    "attack": ("attack", ""),
+    "accept": ("accept", ""),
+    "back": ("back", "to_menu_"),
+    "top": ("top", ""),
+    "tour": ("tour", ""),
+    "notify": ("notify", ""),
+}
+
+# Действия, аргумент которых — id владельца меню (у турнира — организатора:
+# с шардами запись в турнир уходит на его шард)
+OWNER_ACTIONS = {"profile", "grow", "attack", "back", "tour", "notify"}
+
+
+def decode(data: str):
+    """Разбор callback_data за один проход; None — неизвестные данные"""
+    if not data:
+        return None
+    head, _, rest = data.partition("_")
+    entry = PREFIXES.get(head)
+    if entry is None:
+        return None
+    kind, tail = entry
+    if tail:
+        if not rest.startswith(tail):
+            return None
+        rest = rest[len(tail):]
+    if not rest:
+        return None
+    if kind in OWNER_ACTIONS:
+        if not rest.isdigit():
+            return None
+        return CallbackAction(kind, int(rest))
+    return CallbackAction(kind, rest)
+
+
+class CallbackRouter:
+    """Один обработчик callback_query вместо цепочки фильтров startswith
+
+    callback_data разбирается один раз, хендлер выбирается по виду
+    действия из словаря и получает уже готовый аргумент.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def route(self, kind: str):
+        def decorator(handler):
+            self._handlers[kind] = handler
+            return handler
+        return decorator
+
+    def resolve(self, data: str):
+        """(хендлер, аргумент) или None"""
+        action = decode(data)
+        if action is None:
+            return None
+        handler = self._handlers.get(action.kind)
+        if handler is None:
+            return None
+        return handler, action.arg
+
+
+if __name__ == "__main__":
+    # Микробенчмарк: полный проход апдейта через aiogram-роутер
+    # со старой цепочкой фильтров против одного хендлера с разбором
+    import time
+    import asyncio
+    from datetime import datetime
+    from aiogram import Router  # type: ignore
+    from aiogram.types import CallbackQuery, Message, Chat, User  # type: ignore
+
+    kinds = ("profile", "grow", "attack", "accept", "back", "top")
+    old_prefixes = ("profile_", "grow_", "attack_", "accept_", "back_to_menu_", "top_")
+
+    async def noop(callback, *args):
+        return None
+
+    old_router = Router()
+    for prefix in old_prefixes:
+        old_router.callback_query(lambda c, prefix=prefix: c.data.startswith(prefix))(noop)
+
+    callback_router = CallbackRouter()
+    for kind in kinds:
+        callback_router.route(kind)(noop)
+    new_router = Router()
+
+    @new_router.callback_query()
+    async def dispatch(callback):
+        handler, arg = callback_router.resolve(callback.data)
+        return await handler(callback, arg)
+
+    user = User(id=887888895, is_bot=False, first_name="bench")
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"))
+    samples = [
+        "profile_887888895", "grow_887888895", "attack_887888895",
+        "accept_fight_887888895_1754765577", "back_to_menu_887888895", "top_winrate",
+    ]
+
+    async def bench(router, callback, number):
+        started = time.perf_counter()
+        for _ in range(number):
+            await router.propagate_event("callback_query", callback)
+        return (time.perf_counter() - started) / number * 1e6
+
+    async def main():
+        number = 20_000
+        for data in samples:
+            callback = CallbackQuery(id="1", from_user=user, chat_instance="c", data=data, message=message)
+            old = await bench(old_router, callback, number)
+            new = await bench(new_router, callback, number)
+            print(f"{data:<40} цепочка: {old:6.2f} мкс   роутер: {new:6.2f} мкс")
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import os
+import time
+import asyncio
+import logging
+from aiogram import BaseMiddleware  # type: ignore
+
+CALLBACK_COOLDOWN = float(os.getenv("CALLBACK_COOLDOWN", "0.3"))  # секунды, 0 — без окна
+
+
+class CallbackDedupe(BaseMiddleware):
+    """Гасит повторные нажатия кнопок (outer-middleware на callback_query)
+
+    Ключ — (пользователь, callback_data). Пока нажатие с таким ключом
+    обрабатывается, повторы не запускают хендлер, а ждут и получают его
+    результат. Кроме того, после принятого нажатия та же кнопка того же
+    пользователя cooldown секунд не срабатывает: очередь быстрых тапов
+    отбрасывается, не дойдя до хендлеров, а переход на другую кнопку
+    (профиль -> назад) проходит сразу. Окно считается и от начала,
+    и от конца обработки, чтобы медленный хендлер его не съедал.
+    На погашенные нажатия сразу отвечает answerCallbackQuery без текста,
+    чтобы у кнопки не висела крутилка.
+    """
+
+    def __init__(self, cooldown: float = CALLBACK_COOLDOWN, sweep_interval: float = 60):
+        self.cooldown = cooldown
+        self.sweep_interval = sweep_interval
+        self._in_flight = {}  # {(user_id, data): Future с результатом хендлера}
+        self._last = {}  # {(user_id, data): время последнего принятого нажатия}
+        self._swept = time.monotonic()
+        self.coalesced = 0
+        self.dropped = 0
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or event.data is None:
+            return await handler(event, data)
+        key = (user.id, event.data)
+
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            await self._answer(event)
+            return await asyncio.shield(shared)  # отмена повтора не отменяет общий результат
+
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.cooldown:
+            self.dropped += 1
+            await self._answer(event)
+            return None
+        self._last[key] = now
+        self._sweep(now)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        result = None
+        try:
+            result = await handler(event, data)
+            return result
+        finally:
+            # При исключении повторы получают None: ошибку логирует только первый
+            del self._in_flight[key]
+            self._last[key] = time.monotonic()  # окно отсчитывается и от конца обработки
+            future.set_result(result)
+
+    @staticmethod
+    async def _answer(event):
+        try:
+            await event.answer()
+        except Exception:  # запрос мог устареть — крутилка тогда пропадёт сама
+            logging.debug("Не удалось ответить на погашенное нажатие %s", event.id, exc_info=True)
+
+    def _sweep(self, now: float):
+        """Раз в sweep_interval забываем кнопки с истёкшим окном"""
+        if now - self._swept < self.sweep_interval:
+            return
+        self._swept = now
+        self._last = {key: t for key, t in self._last.items() if now - t < self.cooldown}
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "keys": len(self._last),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
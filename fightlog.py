@@ -0,0 +1,312 @@
+"""История боёв: журнал записей фиксированной длины и запросы через mmap
+
+    python fightlog.py  # скорость записи и запросов на 10M боёв
+"""
+import os
+import mmap
+import time
+import struct
+import asyncio
+from typing import NamedTuple
+
+# Флаги ударов: по три бита на атакующего и защитника, два бита — исход
+CRIT, MISS, LUCKY = 1, 2, 4
+DEFENDER_SHIFT = 3
+RESULT_SHIFT = 6
+DRAW, ATTACKER_WON, DEFENDER_WON = 0, 1, 2
+
+NO_RECORD = 0xFFFFFFFF  # конец цепочки игрока
+MAX_DAMAGE = 0xFFFFFFFF  # урон в записи — uint32; /admin_set позволяет статы, дающие больше
+
+
+class FightRecord(NamedTuple):
+    """Один бой из журнала"""
+    ts: int
+    attacker: int
+    defender: int
+    damage_attacker: int
+    damage_defender: int
+    flags: int
+    bonus_attack: int  # 0/0 при ничьей: бонус не переходил
+    bonus_defense: int
+
+    @property
+    def outcome(self) -> int:
+        return self.flags >> RESULT_SHIFT
+
+    def result_for(self, user_id: int) -> str:
+        """win / loss / draw с точки зрения игрока"""
+        if self.outcome == DRAW:
+            return "draw"
+        won = (self.outcome == ATTACKER_WON) == (self.attacker == user_id)
+        return "win" if won else "loss"
+
+    def hits_for(self, user_id: int) -> tuple:
+        """(урон игрока, урон соперника, флаги удара игрока)"""
+        if self.attacker == user_id:
+            return self.damage_attacker, self.damage_defender, self.flags & 7
+        return self.damage_defender, self.damage_attacker, (self.flags >> DEFENDER_SHIFT) & 7
+
+
+def fight_entry(attacker_id: int, defender_id: int, hit_attacker: tuple, hit_defender: tuple,
+                winner_side, bonus: tuple, ts: int = None) -> tuple:
+    """Запись журнала из результата battle.resolve_fight (список чисел — можно слать по RPC)"""
+    flags = 0
+    for shift, (_, is_crit, is_miss, is_lucky) in ((0, hit_attacker), (DEFENDER_SHIFT, hit_defender)):
+        flags |= (CRIT * is_crit | MISS * is_miss | LUCKY * is_lucky) << shift
+    outcome = DRAW if winner_side is None else (ATTACKER_WON, DEFENDER_WON)[winner_side]
+    flags |= outcome << RESULT_SHIFT
+    bonus_attack, bonus_defense = bonus if winner_side is not None else (0, 0)
+    return (int(time.time()) if ts is None else ts, attacker_id, defender_id,
+            min(hit_attacker[0], MAX_DAMAGE), min(hit_defender[0], MAX_DAMAGE), flags, bonus_attack, bonus_defense)
+
+
+class FightLog:
+    """Журнал боёв только на дописывание
+
+    Запись — 40 байт struct: время, id обоих, урон обоих, флаги, бонусы
+    и номера предыдущих записей каждого из двух игроков. Номер последней
+    записи игрока лежит в словаре heads, так что «последние N боёв» — это
+    проход по цепочке из N записей через mmap, а не чтение файла.
+
+    append только кладёт запись в хвост в памяти; на диск хвост уходит
+    одной записью из потока (run / flush), не блокируя цикл событий.
+    Запросы видят и ещё не записанные бои. heads сохраняются в файл
+    индекса при close; после падения недостающие записи дочитываются
+    из журнала при open.
+    """
+
+    RECORD = struct.Struct("<IqqIIBBBxII")
+    HEADER = b"HCFLOG1\n"
+    INDEX_HEADER = b"HCFIDX1\n"
+    INDEX_ITEM = struct.Struct("<qI")
+
+    def __init__(self, path: str, flush_interval: float = 0.5, max_pending: int = 1000):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.heads = {}  # {user_id: номер последней записи}
+        self._count = 0  # записей всего, с хвостом
+        self._flushed = 0  # записей в файле
+        self._tail = []  # упакованные записи, ещё не записанные в файл
+        self._file = None
+        self._map = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return self._count
+
+    # ===================
+    # ОТКРЫТИЕ И ИНДЕКС
+    # ===================
+
+    def open(self):
+        """Открытие журнала и восстановление heads (синхронно — звать из потока)"""
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                f.write(self.HEADER)
+        self._file = open(self.path, "r+b")
+        if self._file.read(len(self.HEADER)) != self.HEADER:
+            raise ValueError(f"{self.path}: не журнал боёв")
+        size = os.fstat(self._file.fileno()).st_size
+        records, extra = divmod(size - len(self.HEADER), self.RECORD.size)
+        if extra:  # недописанная запись после падения
+            self._file.truncate(len(self.HEADER) + records * self.RECORD.size)
+        self._count = self._flushed = records
+        self._remap()
+
+        indexed = self._load_index()
+        for number, (_, attacker, defender, *_rest) in enumerate(
+                self.RECORD.iter_unpack(self._map[self._offset(indexed):self._offset(records)]), indexed):
+            self.heads[attacker] = number
+            self.heads[defender] = number
+        self._file.seek(0, os.SEEK_END)
+
+    def _load_index(self) -> int:
+        """heads из файла индекса; возвращает, сколько записей он покрывает"""
+        self.heads = {}
+        if not os.path.exists(self.index_path):
+            return 0
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(self.INDEX_HEADER):
+            return 0
+        covered = struct.unpack_from("<Q", data, len(self.INDEX_HEADER))[0]
+        if covered > self._count:
+            return 0  # индекс от другого журнала
+        start = len(self.INDEX_HEADER) + 8
+        self.heads = dict(self.INDEX_ITEM.iter_unpack(data[start:]))
+        return covered
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.INDEX_HEADER + struct.pack("<Q", self._flushed))
+            f.write(b"".join(self.INDEX_ITEM.pack(user_id, number) for user_id, number in self.heads.items()))
+        os.replace(tmp_path, self.index_path)
+
+    def _offset(self, number: int) -> int:
+        return len(self.HEADER) + number * self.RECORD.size
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # ===================
+    # ЗАПИСЬ
+    # ===================
+
+    def append(self, entry):
+        """Бой из fight_entry: в хвост, цепочки обоих игроков сразу указывают на него"""
+        ts, attacker, defender, damage_attacker, damage_defender, flags, bonus_attack, bonus_defense = entry
+        number = self._count
+        self._tail.append(self.RECORD.pack(
+            ts, attacker, defender, damage_attacker, damage_defender, flags, bonus_attack, bonus_defense,
+            self.heads.get(attacker, NO_RECORD), self.heads.get(defender, NO_RECORD),
+        ))
+        self.heads[attacker] = number
+        self.heads[defender] = number
+        self._count += 1
+        if len(self._tail) >= self.max_pending:
+            self._wakeup.set()
+
+    async def record(self, entries: list):
+        """Пачка боёв; async — как у шардовой обёртки, которая шлёт чужие по RPC"""
+        for entry in entries:
+            self.append(entry)
+
+    async def flush(self):
+        """Хвост — в файл одной записью из потока, потом новый mmap
+
+        Под shield: отмена run посреди записи не должна оставить записанный
+        хвост неубранным — close записал бы его второй раз.
+        """
+        await asyncio.shield(self._flush())
+
+    async def _flush(self):
+        async with self._flush_lock:
+            n = len(self._tail)
+            if not n:
+                return
+            data = b"".join(self._tail[:n])
+            await asyncio.to_thread(self._write, data)
+            del self._tail[:n]  # за время записи хвост мог вырасти — убираем только записанное
+            self._flushed += n
+            self._remap()
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._file.flush()
+
+    async def run(self):
+        """Фоновая задача: сброс хвоста раз в flush_interval или при max_pending записей"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        if self._file is None:
+            return
+        await self.flush()
+        await asyncio.to_thread(self._save_index)
+        self._map.close()
+        self._file.close()
+        self._map = self._file = None
+
+    # ===================
+    # ЗАПРОСЫ
+    # ===================
+
+    def _read(self, number: int) -> tuple:
+        if number >= self._flushed:
+            return self.RECORD.unpack(self._tail[number - self._flushed])
+        return self.RECORD.unpack_from(self._map, self._offset(number))
+
+    def _chain(self, user_id: int):
+        number = self.heads.get(user_id, NO_RECORD)
+        while number != NO_RECORD:
+            raw = self._read(number)
+            yield FightRecord(*raw[:8])
+            number = raw[8] if raw[1] == user_id else raw[9]
+
+    def last_fights(self, user_id: int, limit: int = 10) -> list:
+        """Последние бои игрока, от новых к старым"""
+        fights = []
+        for record in self._chain(user_id):
+            fights.append(record)
+            if len(fights) >= limit:
+                break
+        return fights
+
+    def streak(self, user_id: int, limit: int = 1000) -> tuple:
+        """Текущая серия: (win / loss / draw, длина) или (None, 0) без боёв"""
+        kind, length = None, 0
+        for record in self._chain(user_id):
+            result = record.result_for(user_id)
+            if kind is not None and result != kind:
+                break
+            kind = result
+            length += 1
+            if length >= limit:
+                break
+        return kind, length
+
+    def stats(self) -> dict:
+        return {"fights": self._count, "pending": len(self._tail), "players": len(self.heads)}
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    async def main():
+        total = 10_000_000
+        players = 200_000
+        rng = random.Random(1)
+        ids = [10**9 + i for i in range(players)]
+        with tempfile.TemporaryDirectory() as work:
+            log = FightLog(os.path.join(work, "fights.log"), max_pending=50_000)
+            log.open()
+            started = time.perf_counter()
+            for n in range(total):
+                a, d = rng.sample(ids, 2)
+                log.append((n, a, d, rng.randint(0, 300), rng.randint(0, 300), rng.randrange(256), 3, 2))
+                if len(log._tail) >= log.max_pending:
+                    await log.flush()
+            await log.flush()
+            elapsed = time.perf_counter() - started
+            print(f"Запись: {total / elapsed:,.0f} боёв/с, файл {os.path.getsize(log.path) / 2**20:.0f} МБ")
+
+            sample = rng.sample(ids, 10_000)
+            for name, query in (("последние 10", lambda user_id: log.last_fights(user_id, 10)),
+                                ("серия", log.streak)):
+                latencies = []
+                for user_id in sample:
+                    begin = time.perf_counter()
+                    query(user_id)
+                    latencies.append(time.perf_counter() - begin)
+                latencies.sort()
+                print(f"{name}: p50 {latencies[len(latencies) // 2] * 1e6:.1f} мкс, "
+                      f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} мкс")
+
+            expected = log.last_fights(sample[0])
+            await log.close()
+            for label in ("с индексом", "без индекса (чтение журнала)"):
+                started = time.perf_counter()
+                reopened = FightLog(log.path)
+                reopened.open()
+                print(f"Открытие {label}: {time.perf_counter() - started:.2f} с")
+                assert reopened.last_fights(sample[0]) == expected
+                reopened._map.close()
+                reopened._file.close()
+                if os.path.exists(reopened.index_path):
+                    os.remove(reopened.index_path)
+
+    asyncio.run(main())
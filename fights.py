@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import heapq
+from collections import deque
+
+
+class FightRegistry:
+    """Открытые вызовы на бой
+
+    У каждого вызова есть срок жизни (ttl), у игрока — не больше
+    max_per_player открытых вызовов (самый старый вытесняется).
+    Сроки лежат в куче, поэтому очистка просроченных не перебирает
+    все вызовы. Если задан path, вызовы переживают перезапуск.
+    """
+
+    def __init__(self, ttl: int = 15 * 60, max_per_player: int = 3, path: str = None):
+        self.ttl = ttl
+        self.max_per_player = max_per_player
+        self.path = path
+        self._fights = {}  # {fight_id: (owner_id, expires_at)}
+        self._by_owner = {}  # {owner_id: deque(fight_id)} в порядке создания
+        self._heap = []  # [(expires_at, fight_id)]
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._fights)
+
+    def __contains__(self, fight_id: str):
+        return self.get(fight_id) is not None
+
+    @staticmethod
+    def owner_of(fight_id: str):
+        """id автора вызова из fight_id (fight_{owner}_{ts}) или None"""
+        parts = fight_id.split("_")
+        if len(parts) < 3 or parts[0] != "fight" or not parts[1].isdigit():
+            return None
+        return int(parts[1])
+
+    def open(self, owner_id: int) -> str:
+        """Новый вызов от owner_id; возвращает fight_id"""
+        now = time.time()
+        self.expire(now)
+
+        fight_id = f"fight_{owner_id}_{int(now)}"
+        n = 1
+        while fight_id in self._fights:
+            n += 1
+            fight_id = f"fight_{owner_id}_{int(now)}_{n}"
+
+        owned = self._by_owner.setdefault(owner_id, deque())
+        while len(owned) >= self.max_per_player:
+            self._remove(owned[0])
+            self.evicted += 1
+
+        self._add(fight_id, owner_id, now + self.ttl)
+        return fight_id
+
+    def get(self, fight_id: str):
+        """Владелец вызова или None, если вызова нет или он просрочен"""
+        item = self._fights.get(fight_id)
+        if item is None or item[1] <= time.time():
+            return None
+        return item[0]
+
+    def claim(self, fight_id: str):
+        """Забрать вызов (он сразу закрывается); None — уже забран или просрочен"""
+        owner_id = self.get(fight_id)
+        if owner_id is not None:
+            self._remove(fight_id)
+        return owner_id
+
+    def expire(self, now: float = None) -> int:
+        """Удаление просроченных вызовов"""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, fight_id = heapq.heappop(self._heap)
+            item = self._fights.get(fight_id)
+            # В куче могут остаться записи уже закрытых вызовов
+            if item is not None and item[1] == expires_at:
+                self._remove(fight_id)
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def _add(self, fight_id: str, owner_id: int, expires_at: float):
+        self._fights[fight_id] = (owner_id, expires_at)
+        self._by_owner.setdefault(owner_id, deque()).append(fight_id)
+        heapq.heappush(self._heap, (expires_at, fight_id))
+
+    def _remove(self, fight_id: str):
+        owner_id, _ = self._fights.pop(fight_id)
+        owned = self._by_owner[owner_id]
+        owned.remove(fight_id)  # не больше max_per_player элементов
+        if not owned:
+            del self._by_owner[owner_id]
+        if len(self._heap) > 2 * len(self._fights) + 64:
+            # Чистим кучу от закрытых вызовов, чтобы она не росла
+            self._heap = [(exp, fid) for fid, (_, exp) in self._fights.items()]
+            heapq.heapify(self._heap)
+
+    # ===================
+    # СОХРАНЕНИЕ
+    # ===================
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        now = time.time()
+        for fight_id, (owner_id, expires_at) in sorted(saved.items(), key=lambda x: x[1][1]):
+            if expires_at > now:
+                self._add(fight_id, int(owner_id), expires_at)
+
+    def save(self):
+        if not self.path:
+            return
+        self.expire()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._fights, f)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> dict:
+        return {"open": len(self._fights), "expired": self.expired, "evicted": self.evicted}
@@ -0,0 +1,198 @@
+import time
+from bisect import bisect_left, insort
+
+
+def winrate(p: dict) -> float:
+    total = p["wins"] + p["losses"]
+    return (p["wins"] / total * 100) if total > 0 else 0
+
+
+TOP_KEYS = {
+    "wins": lambda p: p.get("wins", 0),
+    "size": lambda p: p.get("attack", 0) + p.get("defense", 0),
+    "winrate": winrate,
+}
+
+
+class _SortedBlocks:
+    """Отсортированный список, разбитый на блоки
+
+    Вставка и удаление — бинарный поиск по максимумам блоков и сдвиг внутри
+    одного короткого блока, поэтому стоимость не растёт с числом игроков
+    так, как у одного большого списка. Первые n элементов читаются за O(n).
+    """
+
+    LOAD = 500
+
+    def __init__(self):
+        self._blocks = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, value):
+        self._len += 1
+        if not self._maxes:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            return
+
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._blocks[pos].append(value)
+            self._maxes[pos] = value
+        else:
+            insort(self._blocks[pos], value)
+
+        block = self._blocks[pos]
+        if len(block) > self.LOAD * 2:
+            # Делим переполненный блок пополам
+            self._blocks.insert(pos + 1, block[self.LOAD:])
+            del block[self.LOAD:]
+            self._maxes.insert(pos, block[-1])
+
+    def remove(self, value):
+        pos = bisect_left(self._maxes, value)
+        block = self._blocks[pos]
+        idx = bisect_left(block, value)
+        del block[idx]
+        self._len -= 1
+
+        if not block:
+            del self._blocks[pos]
+            del self._maxes[pos]
+        elif idx == len(block):
+            self._maxes[pos] = block[-1]
+
+    def head(self, n: int) -> list:
+        result = []
+        for block in self._blocks:
+            for value in block:
+                if len(result) == n:
+                    return result
+                result.append(value)
+        return result
+
+
+class Leaderboards:
+    """Индекс всех таблиц лидеров, обновляемый при каждом сохранении игрока
+
+    Ключ записи — (-значение, порядковый номер игрока, id): при равенстве
+    значений игроки идут в порядке добавления, как при старой сортировке.
+    Винрейт считается один раз при обновлении, а не на каждый запрос топа.
+    """
+
+    def __init__(self):
+        self._boards = {top_type: _SortedBlocks() for top_type in TOP_KEYS}
+        self._entries = {}  # {user_id: {top_type: ключ}}
+        self._order = {}  # {user_id: порядковый номер}
+
+    def update(self, user_id: int, data: dict):
+        """Обновление позиций игрока во всех топах"""
+        order = self._order.setdefault(user_id, len(self._order))
+        entries = self._entries.setdefault(user_id, {})
+        for top_type, key_func in TOP_KEYS.items():
+            new_key = (-key_func(data), order, user_id)
+            old_key = entries.get(top_type)
+            if old_key == new_key:
+                continue
+            board = self._boards[top_type]
+            if old_key is not None:
+                board.remove(old_key)
+            board.add(new_key)
+            entries[top_type] = new_key
+
+    def remove(self, user_id: int):
+        entries = self._entries.pop(user_id, {})
+        for top_type, key in entries.items():
+            self._boards[top_type].remove(key)
+
+    def rebuild(self, players: dict):
+        """Полная перестройка индекса (при загрузке и массовом сбросе)"""
+        self.__init__()
+        for user_id, data in players.items():
+            self.update(user_id, data)
+
+    def top(self, top_type: str, limit: int = 10) -> list:
+        """id первых limit игроков"""
+        return [key[2] for key in self._boards[top_type].head(limit)]
+
+
+class TopCache:
+    """Кэш готового текста топ-10 по каждому типу топа
+
+    Запись сбрасывается, только когда сохранённый игрок уже есть в топе
+    или его новое значение дотягивает до последнего места в нём.
+    Счётчики hits / misses / invalidations показывают пользу кэша.
+    ttl ограничивает жизнь записи, когда игроки меняются и там, откуда
+    player_saved не приходит (другие шарды).
+    """
+
+    def __init__(self, limit: int = 10, ttl: float = None):
+        self.limit = limit
+        self.ttl = ttl
+        self._entries = {}  # {top_type: (текст, id игроков в топе, значение последнего места, годен до)}
+        self._generation = {top_type: 0 for top_type in TOP_KEYS}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, top_type: str):
+        entry = self._entries.get(top_type)
+        if entry is None or (entry[3] is not None and entry[3] < time.monotonic()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def generation(self, top_type: str) -> int:
+        return self._generation.get(top_type, 0)
+
+    def put(self, top_type: str, text: str, top_players: list, generation: int):
+        """Сохранение текста, если топ не менялся, пока он рендерился"""
+        if generation != self.generation(top_type):
+            return
+        key_func = TOP_KEYS[top_type]
+        ids = {user_id for user_id, _ in top_players}
+        threshold = key_func(top_players[-1][1]) if len(top_players) >= self.limit else None
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[top_type] = (text, ids, threshold, expires_at)
+
+    def _invalidate(self, top_type: str):
+        self._generation[top_type] += 1
+        if self._entries.pop(top_type, None) is not None:
+            self.invalidations += 1
+
+    def player_saved(self, user_id: int, data: dict):
+        for top_type, key_func in TOP_KEYS.items():
+            entry = self._entries.get(top_type)
+            if entry is None:
+                self._generation[top_type] += 1
+                continue
+            _, ids, threshold, _ = entry
+            if user_id in ids or threshold is None or key_func(data) >= threshold:
+                self._invalidate(top_type)
+
+    def player_deleted(self, user_id: int):
+        for top_type in TOP_KEYS:
+            entry = self._entries.get(top_type)
+            if entry is None:
+                self._generation[top_type] += 1
+            elif user_id in entry[1]:
+                self._invalidate(top_type)
+
+    def players_reset(self):
+        for top_type in TOP_KEYS:
+            self._invalidate(top_type)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits / total * 100) if total > 0 else 0,
+        }
@@ -0,0 +1,355 @@
+"""Нагрузочный тест: настоящий dp из bot.py против локальной заглушки Bot API
+
+    python loadtest.py --users 200 --updates 20000 --latency 0.02 --out run.json
+    python loadtest.py --users 200 --updates 20000 --baseline run.json
+
+Бот запускается во временной папке (свои players.json, fights.json), запросы
+к Telegram уходят на заглушку на 127.0.0.1. Каждый виртуальный игрок жмёт
+кнопки по очереди: следующий апдейт — после ответа на предыдущий.
+
+Игроки жмут без пауз, поэтому окно CallbackDedupe по умолчанию выключено
+(--cooldown 0), иначе почти все нажатия отбрасывались бы до хендлеров.
+Нажатия, погашенные CallbackDedupe, считаются отдельно и не входят
+в задержки и пропускную способность.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+from aiohttp import web  # type: ignore
+from aiogram import BaseMiddleware  # type: ignore
+
+DEFAULT_MIX = {"inline": 20, "profile": 20, "grow": 15, "attack": 10, "accept": 10, "top": 25}
+TOP_TYPES = ("wins", "size", "winrate")
+
+
+class StubBotAPI:
+    """Заглушка Bot API: отвечает как Telegram с задержкой latency ± jitter
+
+    Из клавиатур вызовов на бой (editMessageText с accept_*) собирает
+    открытые fight_id, чтобы генератор мог их принимать.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        self.challenges = []  # fight_id из клавиатур вызовов
+        self._runner = None
+        self._handlers = {
+            "getme": self._get_me,
+            "getchat": self._get_chat,
+            "editmessagetext": self._edit_message_text,
+            "answercallbackquery": self._true,
+            "answerinlinequery": self._true,
+            "sendmessage": self._send_message,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        handler = self._handlers.get(method.lower())
+        self.calls[method] += 1
+        if handler is None:
+            return web.json_response(
+                {"ok": False, "error_code": 404, "description": "Not Found: method not found"}, status=404
+            )
+        params = dict(await request.post())
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return web.json_response({"ok": True, "result": handler(params)})
+
+    @staticmethod
+    def _true(params: dict):
+        return True
+
+    @staticmethod
+    def _get_me(params: dict) -> dict:
+        return {"id": 1, "is_bot": True, "first_name": "H&C", "username": "loadtest_bot"}
+
+    @staticmethod
+    def _get_chat(params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        return {
+            "id": chat_id, "type": "private", "first_name": f"user{chat_id}",
+            "accent_color_id": 0, "max_reaction_count": 11,
+            "accepted_gift_types": {
+                "unlimited_gifts": True, "limited_gifts": True,
+                "unique_gifts": True, "premium_subscription": True,
+            },
+        }
+
+    def _edit_message_text(self, params: dict):
+        markup = params.get("reply_markup")
+        if markup and "accept_" in markup:
+            for row in json.loads(markup)["inline_keyboard"]:
+                for button in row:
+                    data = button.get("callback_data") or ""
+                    if data.startswith("accept_"):
+                        self.challenges.append(data[len("accept_"):])
+        if "inline_message_id" in params:
+            return True
+        return self._send_message(params)
+
+    @staticmethod
+    def _send_message(params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        return {
+            "message_id": int(params.get("message_id", 1)), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+        }
+
+
+class PassedCallbacks(BaseMiddleware):
+    """Outer-middleware после CallbackDedupe: update_id нажатий, дошедших до хендлеров"""
+
+    def __init__(self):
+        self.update_ids = set()
+
+    async def __call__(self, handler, event, data):
+        self.update_ids.add(data["event_update"].update_id)
+        return await handler(event, data)
+
+
+class UpdateGenerator:
+    """Синтетические апдейты от users игроков в пропорциях mix"""
+
+    def __init__(self, stub: StubBotAPI, users: int, mix: dict = None, seed: int = None,
+                 first_user_id: int = 10_000_000):
+        self.stub = stub
+        self.rng = random.Random(seed)
+        self.user_ids = [first_user_id + i for i in range(users)]
+        mix = mix or DEFAULT_MIX
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self._update_id = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+    def _callback(self, user_id: int, data: str) -> dict:
+        return {"callback_query": {
+            "id": str(self._update_id), "from": self._user(user_id), "chat_instance": "loadtest",
+            "inline_message_id": f"im{user_id}", "data": data,
+        }}
+
+    def _pick_challenge(self, user_id: int):
+        """Случайный чужой вызов; свои и уже принятые остаются или выбрасываются"""
+        challenges = self.stub.challenges
+        for _ in range(min(len(challenges), 5)):
+            i = self.rng.randrange(len(challenges))
+            fight_id = challenges[i]
+            if fight_id.split("_")[1] != str(user_id):
+                challenges[i] = challenges[-1]
+                challenges.pop()
+                return fight_id
+        return None
+
+    def next(self, user_id: int):
+        """(действие, апдейт в формате Bot API) для очередного нажатия игрока"""
+        self._update_id += 1
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action == "accept":
+            fight_id = self._pick_challenge(user_id)
+            if fight_id is None:
+                action = "attack"  # принимать нечего — бросаем вызов сами
+            else:
+                update = self._callback(user_id, f"accept_{fight_id}")
+        if action == "inline":
+            update = {"inline_query": {
+                "id": str(self._update_id), "from": self._user(user_id), "query": "", "offset": "",
+            }}
+        elif action == "top":
+            update = self._callback(user_id, f"top_{self.rng.choice(TOP_TYPES)}")
+        elif action != "accept":
+            update = self._callback(user_id, f"{action}_{user_id}")
+        update["update_id"] = self._update_id
+        return action, update
+
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+    return {
+        "count": len(samples),
+        "mean": round(sum(samples) / len(samples) * 1000, 3),
+        "p50": at(0.50), "p95": at(0.95), "p99": at(0.99),
+        "max": round(samples[-1] * 1000, 3),
+    }
+
+
+async def run_load(app, generator: UpdateGenerator, updates: int, passed: PassedCallbacks = None) -> dict:
+    """Прогон updates апдейтов через app.dp; задержки — время feed_raw_update
+
+    С passed нажатия, не дошедшие до хендлеров, идут в deduplicated, а не в задержки.
+    """
+    latencies = defaultdict(list)
+    deduplicated = Counter()
+    errors = Counter()
+    remaining = [updates]
+
+    async def player(user_id: int):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            action, update = generator.next(user_id)
+            started = time.perf_counter()
+            try:
+                await app.dp.feed_raw_update(app.bot, update)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            elapsed = time.perf_counter() - started
+            if passed is not None and "callback_query" in update:
+                if update["update_id"] not in passed.update_ids:
+                    deduplicated[action] += 1
+                    continue
+                passed.update_ids.discard(update["update_id"])
+            latencies[action].append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(player(user_id) for user_id in generator.user_ids))
+    duration = time.perf_counter() - started
+
+    total = [value for values in latencies.values() for value in values]
+    return {
+        "updates": len(total),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(total) / duration, 1),
+        "latency_ms": _percentiles(total),
+        "by_action": {action: _percentiles(values) for action, values in sorted(latencies.items())},
+        "deduplicated": dict(deduplicated),
+        "errors": dict(errors),
+    }
+
+
+def compare(result: dict, baseline: dict) -> list:
+    """Строки сравнения с прошлым прогоном (положительный процент — стало больше)"""
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    lines = [f"пропускная способность: {result['throughput_rps']} rps "
+             f"({delta(result['throughput_rps'], baseline['throughput_rps'])})"]
+    for key in ("p50", "p95", "p99"):
+        new, old = result["latency_ms"][key], baseline["latency_ms"][key]
+        lines.append(f"{key}: {new} мс ({delta(new, old)})")
+    for action, stats in result["by_action"].items():
+        old = baseline.get("by_action", {}).get(action)
+        if old and old.get("count"):
+            lines.append(f"  {action:<8} p95 {stats['p95']} мс ({delta(stats['p95'], old['p95'])})")
+    return lines
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        action, weight = part.split("=")
+        if action not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"неизвестное действие: {action}")
+        mix[action] = float(weight)
+    return mix
+
+
+async def main_async(args):
+    stub = StubBotAPI(args.latency, args.jitter)
+    base_url = await stub.start()
+
+    # bot.py читает токен и пути к файлам при импорте
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="hc-loadtest-"))
+    os.environ["BOT_TOKEN"] = "123456:LOADTEST"
+    from aiogram.client.session.aiohttp import AiohttpSession  # type: ignore
+    from aiogram.client.telegram import TelegramAPIServer  # type: ignore
+    import bot as app
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    if not args.no_limits:
+        session.middleware(app.outbox)
+    app.bot.session = session
+    app.callback_dedupe.cooldown = args.cooldown
+    passed = PassedCallbacks()
+    app.dp.callback_query.outer_middleware(passed)  # после callback_dedupe из bot.py
+
+    generator = UpdateGenerator(stub, args.users, args.mix, args.seed)
+    await app.dp.emit_startup(bot=app.bot, dispatcher=app.dp)
+    try:
+        if args.warmup:
+            await run_load(app, generator, args.warmup, passed)
+            stub.calls.clear()
+        result = await run_load(app, generator, args.updates, passed)
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot, dispatcher=app.dp)
+        await session.close()
+        await stub.stop()
+
+    result["api_calls"] = dict(stub.calls)
+    result["config"] = {
+        "users": args.users, "mix": args.mix or DEFAULT_MIX, "latency": args.latency,
+        "jitter": args.jitter, "limits": not args.no_limits, "backend": app.PLAYER_BACKEND,
+        "cooldown": args.cooldown, "seed": args.seed,
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест H&C против заглушки Bot API")
+    parser.add_argument("--users", type=int, default=100, help="виртуальных игроков")
+    parser.add_argument("--updates", type=int, default=10_000, help="апдейтов в замере")
+    parser.add_argument("--warmup", type=int, default=500, help="апдейтов на прогрев (не в замере)")
+    parser.add_argument("--mix", type=_parse_mix, default=None,
+                        help="веса действий, например inline=20,profile=20,grow=15,attack=10,accept=10,top=25")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа заглушки, с")
+    parser.add_argument("--jitter", type=float, default=0.01, help="случайная добавка к задержке, с")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="без OutboundScheduler: чистое время обработчиков без лимитов Telegram")
+    parser.add_argument("--cooldown", type=float, default=0.0,
+                        help="окно CallbackDedupe, с (игроки жмут без пауз, поэтому по умолчанию 0)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="папка для файлов бота (по умолчанию временная)")
+    parser.add_argument("--out", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    result = asyncio.run(main_async(args))
+
+    latency = result["latency_ms"]
+    print(f"{result['updates']} апдейтов за {result['duration_s']} с: {result['throughput_rps']} rps")
+    print(f"задержка: p50 {latency['p50']} мс, p95 {latency['p95']} мс, p99 {latency['p99']} мс")
+    for action, stats in result["by_action"].items():
+        print(f"  {action:<8} {stats['count']:>7}  p50 {stats['p50']:>8} мс  p99 {stats['p99']:>8} мс")
+    if result["deduplicated"]:
+        print(f"погашено CallbackDedupe (не в замере): {result['deduplicated']}")
+    if result["errors"]:
+        print(f"ошибки: {result['errors']}")
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            print("\n".join(["сравнение с " + args.baseline] + compare(result, json.load(f))))
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class PlayerLocks:
+    """Блокировки отдельных игроков
+
+    Чтение-изменение-сохранение игрока выполняется под его замком, поэтому
+    параллельные рост и бои одного игрока не теряют изменения, а разные
+    игроки друг друга не ждут. Несколько замков берутся в порядке id,
+    так что два встречных боя не могут заблокировать друг друга.
+    Замок удаляется, когда его никто не держит и не ждёт.
+    """
+
+    def __init__(self):
+        self._locks = {}  # {user_id: [asyncio.Lock, сколько задач держат или ждут]}
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    @asynccontextmanager
+    async def hold(self, *user_ids: int):
+        acquired = []
+        try:
+            for user_id in sorted(set(user_ids)):
+                await self._acquire(user_id)
+                acquired.append(user_id)
+            yield
+        finally:
+            for user_id in reversed(acquired):
+                self._release(user_id)
+
+    async def _acquire(self, user_id: int):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.acquisitions += 1
+
+        lock = entry[0]
+        if not lock.locked():
+            await lock.acquire()
+            return
+
+        self.contended += 1
+        started = time.perf_counter()
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._unref(user_id, entry)
+            raise
+        finally:
+            self.wait_time += time.perf_counter() - started
+
+    def _release(self, user_id: int):
+        entry = self._locks[user_id]
+        entry[0].release()
+        self._unref(user_id, entry)
+
+    def _unref(self, user_id: int, entry: list):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._locks),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_ms": self.wait_time * 1000,
+        }
@@ -0,0 +1,204 @@
+"""Очередь подбора соперника по рейтингу
+
+    python matchmaking.py  # время подбора при 100k игроков в очереди
+"""
+import time
+import math
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import islice
+
+
+def rating(p: dict) -> int:
+    """Рейтинг в духе Эло: от 1000, +400 за каждое десятикратное
+    превосходство побед над поражениями и по 8 очков за сантиметр члена
+    и половину уровня сисек (защита срезает урон примерно вдвое слабее,
+    чем атака его наносит, см. battle.py)"""
+    record = 400 * math.log10((p["wins"] + 1) / (p["losses"] + 1))
+    power = 8 * (p["attack"] + p["defense"] / 2)
+    return round(1000 + record + power)
+
+
+class MatchQueue:
+    """Игроки, ждущие соперника, в корзинах по рейтингу
+
+    Корзина — bucket_width очков рейтинга, внутри неё игроки в порядке
+    постановки в очередь (OrderedDict). Непустые корзины лежат в
+    отсортированном списке, поэтому ближайшие к рейтингу находятся
+    бисекцией за O(log n), а не перебором очереди. Допуск по рейтингу
+    растёт со временем ожидания: base_window сразу, плюс widen_rate очков
+    в секунду, но не больше max_window. Пара подходит, если разница
+    рейтингов укладывается в допуск хотя бы одного из двух — дольше
+    ждущий соглашается на более далёкого соперника.
+    """
+
+    def __init__(self, bucket_width: int = 50, base_window: int = 50,
+                 widen_rate: float = 25, max_window: int = 500):
+        self.bucket_width = bucket_width
+        self.base_window = max(base_window, bucket_width)  # в своей корзине пара есть всегда
+        self.widen_rate = widen_rate
+        self.max_window = max_window
+        self._buckets = {}  # {корзина: OrderedDict(user_id -> None)}
+        self._keys = []  # отсортированные номера непустых корзин
+        self._queued = {}  # {user_id: (рейтинг, время постановки, chat_id)}
+        self._order = OrderedDict()  # user_id в порядке ожидания — старейший первый
+        self.matched = 0
+
+    def __len__(self):
+        return len(self._queued)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._queued
+
+    def window(self, queued_at: float, now: float) -> float:
+        return min(self.max_window, self.base_window + self.widen_rate * (now - queued_at))
+
+    def chat_of(self, user_id: int):
+        item = self._queued.get(user_id)
+        return item[2] if item is not None else None
+
+    def join(self, user_id: int, user_rating: int, chat_id: int = None, now: float = None):
+        """Встать в очередь; если соперник уже ждёт — (его id, его chat_id), иначе None"""
+        now = time.monotonic() if now is None else now
+        if user_id in self._queued:
+            return None
+        opponent_id = self._find(user_id, user_rating, self.base_window, now)
+        if opponent_id is None:
+            self._insert(user_id, user_rating, now, chat_id)
+            return None
+        opponent_chat = self._queued[opponent_id][2]
+        self._remove(opponent_id)
+        self.matched += 1
+        return opponent_id, opponent_chat
+
+    def leave(self, user_id: int) -> bool:
+        if user_id not in self._queued:
+            return False
+        self._remove(user_id)
+        return True
+
+    def tick(self, now: float = None, limit: int = 100) -> list:
+        """Подбор для limit дольше всех ждущих: их допуск успел вырасти
+
+        Возвращает пары (user_id, chat_id, opponent_id, opponent_chat_id);
+        оба игрока уже вынуты из очереди.
+        """
+        now = time.monotonic() if now is None else now
+        pairs = []
+        for user_id in list(islice(self._order, limit)):
+            item = self._queued.get(user_id)
+            if item is None:
+                continue  # уже забран в пару на этом тике
+            user_rating, queued_at, chat_id = item
+            opponent_id = self._find(user_id, user_rating, self.window(queued_at, now), now)
+            if opponent_id is None:
+                continue
+            opponent_chat = self._queued[opponent_id][2]
+            self._remove(user_id)
+            self._remove(opponent_id)
+            self.matched += 1
+            pairs.append((user_id, chat_id, opponent_id, opponent_chat))
+        return pairs
+
+    # ===================
+    # ИНДЕКС
+    # ===================
+
+    def _find(self, user_id: int, user_rating: int, own_window: float, now: float):
+        """Ближайший по корзинам подходящий соперник или None
+
+        Из каждой корзины смотрим только старейшего: у него самый широкий
+        допуск в ней. Корзины перебираем от своей наружу и
+        останавливаемся, когда даже максимальный допуск их не достаёт.
+        """
+        if not self._order:
+            return None
+        oldest = self._queued[next(iter(self._order))][1]
+        reach = max(own_window, self.window(oldest, now))
+        width = self.bucket_width
+        center = user_rating // width
+        hi = bisect_left(self._keys, center)
+        lo = hi - 1
+        while lo >= 0 or hi < len(self._keys):
+            # Следующая корзина — ближайшая к своей из двух сторон
+            if hi >= len(self._keys) or (lo >= 0 and center - self._keys[lo] <= self._keys[hi] - center):
+                key = self._keys[lo]
+                lo -= 1
+            else:
+                key = self._keys[hi]
+                hi += 1
+            if (abs(key - center) - 1) * width > reach:
+                break
+            bucket = self._buckets[key]
+            for candidate in bucket:
+                if candidate == user_id:
+                    continue
+                other_rating, queued_at, _ = self._queued[candidate]
+                if abs(other_rating - user_rating) <= max(own_window, self.window(queued_at, now)):
+                    return candidate
+                break  # остальные в корзине ждут меньше — их допуск не шире
+        return None
+
+    def _insert(self, user_id: int, user_rating: int, now: float, chat_id):
+        key = user_rating // self.bucket_width
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = OrderedDict()
+            insort(self._keys, key)
+        bucket[user_id] = None
+        self._queued[user_id] = (user_rating, now, chat_id)
+        self._order[user_id] = None
+
+    def _remove(self, user_id: int):
+        user_rating = self._queued.pop(user_id)[0]
+        del self._order[user_id]
+        key = user_rating // self.bucket_width
+        bucket = self._buckets[key]
+        del bucket[user_id]
+        if not bucket:
+            del self._buckets[key]
+            del self._keys[bisect_left(self._keys, key)]
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queued), "buckets": len(self._keys), "matched": self.matched}
+
+
+if __name__ == "__main__":
+    import random
+
+    random.seed(1)
+    queue = MatchQueue()
+    size = 100_000
+    started = time.monotonic()
+    for user_id in range(size):
+        # Заполняем напрямую: через join ждущие сразу разобрали бы друг друга
+        wins, losses = random.randint(0, 200), random.randint(0, 200)
+        p = {"attack": random.randint(3, 150), "defense": random.randint(1, 80), "wins": wins, "losses": losses}
+        queue._insert(user_id, rating(p), started - random.uniform(0, 30), None)
+    print(f"В очереди: {len(queue)}, корзин: {queue.stats()['buckets']}")
+
+    samples = [random.randint(600, 3500) for _ in range(10_000)]
+    latencies = []
+    for n, sample in enumerate(samples):
+        begin = time.perf_counter()
+        match = queue.join(size + n, sample)
+        latencies.append(time.perf_counter() - begin)
+        if match is not None:  # возвращаем соперника, чтобы размер очереди не падал
+            queue._insert(match[0], sample, started, None)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f"Подбор: p50 {p50:.1f} мкс, p99 {p99:.1f} мкс, найдено пар {queue.matched} из {len(samples)}")
+
+    # Без пары: рейтинг далеко от всех, обход корзин упирается в допуск
+    begin = time.perf_counter()
+    for n in range(1000):
+        queue.join(-1 - n, 20_000 + n)
+        queue.leave(-1 - n)
+    print(f"Без пары (встать и выйти): {(time.perf_counter() - begin) / 1000 * 1e6:.1f} мкс")
+
+    # Для сравнения: линейный поиск ближайшего по всей очереди
+    begin = time.perf_counter()
+    for sample in samples[:100]:
+        min(queue._queued.items(), key=lambda item: abs(item[1][0] - sample))
+    print(f"Перебор очереди: {(time.perf_counter() - begin) / 100 * 1e6:.1f} мкс на подбор")
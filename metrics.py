@@ -0,0 +1,220 @@
+import os
+import time
+import inspect
+from bisect import bisect_left
+from functools import wraps
+from aiohttp import web  # type: ignore
+from aiogram import BaseMiddleware  # type: ignore
+from aiogram.types import CallbackQuery  # type: ignore
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware  # type: ignore
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 — не поднимать эндпоинт
+
+# Границы корзин в секундах: от 1 мс до 10 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus: счётчики по корзинам, сумма и количество"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """Реестр метрик: гистограммы и счётчики с метками, гейджи-функции
+
+    Запись — это поиск корзины и пара сложений, так что метрики можно
+    не выключать в проде. Текст для Prometheus собирается только при
+    запросе к эндпоинту.
+    """
+
+    def __init__(self, prefix: str = "hc"):
+        self.prefix = prefix
+        self._histograms = {}  # {имя: (описание, метки, {значения меток: Histogram})}
+        self._counters = {}  # {имя: (описание, метки, {значения меток: число})}
+        self._gauges = {}  # {имя: (описание, функция)}
+        self._runner = None
+
+    def histogram(self, name: str, description: str, labels: tuple = ()):
+        self._histograms[name] = (description, labels, {})
+
+    def counter(self, name: str, description: str, labels: tuple = ()):
+        self._counters[name] = (description, labels, {})
+
+    def gauge(self, name: str, description: str, func):
+        """func() -> число, словарь {метка: число} или awaitable с ними"""
+        self._gauges[name] = (description, func)
+
+    def observe(self, name: str, value: float, *labels):
+        series = self._histograms[name][2]
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, *labels, value: float = 1):
+        series = self._counters[name][2]
+        series[labels] = series.get(labels, 0) + value
+
+    def timed(self, name: str, *labels):
+        """Декоратор async-функции: длительность каждого вызова в гистограмму name"""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    # ===================
+    # ЭКСПОРТ
+    # ===================
+
+    async def render(self) -> str:
+        lines = []
+        for name, (description, label_names, series) in self._histograms.items():
+            full = f"{self.prefix}_{name}"
+            lines += [f"# HELP {full} {description}", f"# TYPE {full} histogram"]
+            for values, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{full}_bucket{_labels(label_names, values, le)} {cumulative}")
+                lines.append(f"{full}_sum{_labels(label_names, values)} {histogram.sum:.6f}")
+                lines.append(f"{full}_count{_labels(label_names, values)} {histogram.count}")
+        for name, (description, label_names, series) in self._counters.items():
+            full = f"{self.prefix}_{name}"
+            lines += [f"# HELP {full} {description}", f"# TYPE {full} counter"]
+            for values, value in series.items():
+                lines.append(f"{full}{_labels(label_names, values)} {value}")
+        for name, (description, func) in self._gauges.items():
+            full = f"{self.prefix}_{name}"
+            value = func()
+            if inspect.isawaitable(value):
+                value = await value
+            lines += [f"# HELP {full} {description}", f"# TYPE {full} gauge"]
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    lines.append(f'{full}{{key="{key}"}} {item}')
+            else:
+                lines.append(f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=await self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start_server(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        """Эндпоинт /metrics на отдельном порту (не мешает вебхуку на PORT)"""
+        if not port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop_server(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Время хендлеров: inner-middleware на message, inline_query и callback_query
+
+    Все кнопки идут через один callback_dispatch, поэтому для них имя
+    берётся у хендлера, который выберет CallbackRouter.
+    """
+
+    def __init__(self, metrics: Metrics, callback_router=None):
+        self.metrics = metrics
+        self.callback_router = callback_router
+        metrics.histogram("handler_seconds", "Время обработки апдейта хендлером", ("handler",))
+        metrics.counter("handler_errors_total", "Исключения в хендлерах", ("handler",))
+
+    def _name(self, event, data) -> str:
+        if self.callback_router is not None and isinstance(event, CallbackQuery):
+            route = self.callback_router.resolve(event.data)
+            if route is not None:
+                return route[0].__name__
+        handler = data.get("handler")
+        return handler.callback.__name__ if handler is not None else "unknown"
+
+    async def __call__(self, handler, event, data):
+        name = self._name(event, data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.inc("handler_errors_total", name)
+            raise
+        finally:
+            self.metrics.observe("handler_seconds", time.perf_counter() - started, name)
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    """Число и время запросов к Bot API по методам (middleware сессии бота)
+
+    Регистрируется после OutboundScheduler, поэтому меряет сам запрос,
+    без ожидания в очереди лимитов.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        metrics.histogram("api_request_seconds", "Время запроса к Bot API", ("method",))
+        metrics.counter("api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.metrics.inc("api_errors_total", api_method, type(e).__name__)
+            raise
+        finally:
+            self.metrics.observe("api_request_seconds", time.perf_counter() - started, api_method)
+
+
+def instrument_persistence(metrics: Metrics, repo, fights=None):
+    """Оборачивает записи хранилища в гистограмму persistence_seconds{op}"""
+    metrics.histogram("persistence_seconds", "Время записи игроков и вызовов на диск", ("op",))
+    for op in ("save", "save_many", "reset_all"):
+        setattr(repo, op, metrics.timed("persistence_seconds", op)(getattr(repo, op)))
+    store = getattr(repo, "store", None)
+    if store is not None:  # json: снапшот пишется при компакции журнала
+        store.compact = metrics.timed("persistence_seconds", "compact")(store.compact)
+    if fights is not None:
+        save = fights.save
+
+        def timed_save():
+            started = time.perf_counter()
+            try:
+                save()
+            finally:
+                metrics.observe("persistence_seconds", time.perf_counter() - started, "fights_save")
+        fights.save = timed_save
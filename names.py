@@ -0,0 +1,164 @@
+import time
+import asyncio
+from collections import OrderedDict
+from aiogram import BaseMiddleware, types  # type: ignore
+
+
+def display_name(user) -> str:
+    """Имя для таблицы лидеров"""
+    return user.full_name[:20]
+
+
+class UserProfileCache:
+    """LRU-кэш профилей Telegram (User / Chat) со сроком жизни записи
+
+    Заполняется из апдейтов и при создании вызова на бой, чтобы принятие
+    боя не требовало get_chat.
+    """
+
+    def __init__(self, maxsize: int = 50_000, ttl: int = 6 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()  # {user_id: (профиль, когда устаревает)}
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, user_id: int, profile):
+        self._items[user_id] = (profile, time.monotonic() + self.ttl)
+        self._items.move_to_end(user_id)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, user_id: int):
+        item = self._items.get(user_id)
+        if item is None or item[1] < time.monotonic():
+            self._items.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(user_id)
+        self.hits += 1
+        return item[0]
+
+
+class NameResolver:
+    """Имена игроков для топов
+
+    Имена в первую очередь берутся из types.User входящих апдейтов, так что
+    get_chat нужен только для тех, кто давно не писал боту. Недостающие
+    имена запрашиваются параллельно (не больше concurrency запросов сразу),
+    неудачи кэшируются на negative_ttl секунд, а найденные имена
+    сохраняются одной пачкой. Тех, кто пишет боту, но ещё не игрок
+    (inline-запросы), remember тоже помнит negative_ttl секунд, чтобы
+    не ходить в хранилище на каждый апдейт; сохранение игрока это сбрасывает.
+    """
+
+    def __init__(self, bot, repo, locks, concurrency: int = 5, negative_ttl: int = 600, known_size: int = 100_000):
+        self.bot = bot
+        self.repo = repo
+        self.locks = locks
+        self.negative_ttl = negative_ttl
+        self.known_size = known_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._failed = {}  # {user_id: когда можно повторить запрос}
+        self._known = OrderedDict()  # {user_id: имя, уже записанное в хранилище}
+        self._absent = {}  # {user_id не игрока: когда проверить хранилище снова}
+        self.api_calls = 0
+
+    async def remember(self, user: types.User):
+        """Запоминаем имя из апдейта, если игрок уже есть в базе"""
+        user_id = user.id
+        name = display_name(user)
+        if self._known.get(user_id) == name:
+            self._known.move_to_end(user_id)
+            return
+        now = time.monotonic()
+        if self._absent.get(user_id, 0) > now:
+            return
+
+        async with self.locks.hold(user_id):
+            p = await self.repo.get(user_id)
+            if p is None:
+                if len(self._absent) > self.known_size:
+                    self._absent = {k: v for k, v in self._absent.items() if v > now}
+                self._absent[user_id] = now + self.negative_ttl
+                return
+            if p.get("name") != name:
+                p["name"] = name
+                await self.repo.save(user_id, p)
+        self._known[user_id] = name
+        if len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def player_saved(self, user_id: int, data: dict):
+        self._absent.pop(user_id, None)  # новый игрок — имя нужно записать
+        # Сброс игрока (или любое сохранение без имени) — имя нужно записать заново
+        if user_id in self._known and data.get("name") != self._known[user_id]:
+            del self._known[user_id]
+
+    def player_deleted(self, user_id: int):
+        self._known.pop(user_id, None)
+
+    def players_reset(self):
+        self._known.clear()
+
+    async def fill_missing(self, top_players: list):
+        """Дозапрос имён для записей топа без name"""
+        now = time.monotonic()
+        missing = [
+            (user_id, data) for user_id, data in top_players
+            if not data.get("name") and self._failed.get(user_id, 0) <= now
+        ]
+        if not missing:
+            return
+
+        names = await asyncio.gather(*(self._fetch(user_id) for user_id, _ in missing))
+        found = {}
+        for (user_id, data), name in zip(missing, names):
+            if name:
+                data["name"] = name
+                found[user_id] = name
+        if not found:
+            return
+
+        # Пишем имя в свежую запись игрока, а не в строку топа:
+        # пока шли запросы, статы могли измениться
+        async with self.locks.hold(*found):
+            updates = {}
+            for user_id, name in found.items():
+                p = await self.repo.get(user_id)
+                if p is not None:
+                    p["name"] = name
+                    updates[user_id] = p
+            if updates:
+                await self.repo.save_many(updates)
+
+    async def _fetch(self, user_id: int):
+        async with self._semaphore:
+            self.api_calls += 1
+            try:
+                user = await self.bot.get_chat(user_id)
+            except Exception:
+                now = time.monotonic()
+                if len(self._failed) > self.known_size:
+                    self._failed = {k: v for k, v in self._failed.items() if v > now}
+                self._failed[user_id] = now + self.negative_ttl
+                return None
+        self._failed.pop(user_id, None)
+        return display_name(user)
+
+
+class NameMiddleware(BaseMiddleware):
+    """Обновляет имя и профиль игрока по каждому апдейту, где есть from_user"""
+
+    def __init__(self, resolver: NameResolver, profiles: UserProfileCache):
+        self.resolver = resolver
+        self.profiles = profiles
+
+    async def __call__(self, handler, event, data):
+        result = await handler(event, data)
+        # После хендлера: новый игрок к этому моменту уже создан
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.profiles.put(user.id, user)
+            await self.resolver.remember(user)
+        return result
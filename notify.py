@@ -0,0 +1,198 @@
+"""Напоминания «можно растить» по истечении GROW_COOLDOWN
+
+    python notify.py  # память и время планировщика на 500k подписчиков
+"""
+import time
+import heapq
+import asyncio
+import logging
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError  # type: ignore
+
+GROW_READY_TEXT = "🌱 Можно снова растить! /grow"
+
+
+class GrowNotifier:
+    """Один планировщик на всех подписчиков вместо задачи на игрока
+
+    Сроки лежат в куче (last_grow + cooldown, user_id), актуальный срок
+    каждого подписчика — в словаре: запись кучи, чей срок уже не совпадает
+    со словарём, просто пропускается. На игрока — запись словаря и
+    запись кучи, сколько бы раз он ни сохранялся. Наблюдатель
+    хранилища: рост подписчика переставляет напоминание, отписка его
+    снимает. При старте всё восстанавливается из хранилища (rebuild).
+
+    Напоминания уходят пачками не больше batch штук раз в interval
+    секунд, чтобы волна сроков не забивала общие лимиты Telegram.
+    Кто заблокировал бота, отписывается.
+    """
+
+    def __init__(self, bot, repo, locks, cooldown: int, batch: int = 10, interval: float = 1.0):
+        self.bot = bot
+        self.repo = repo
+        self.locks = locks
+        self.cooldown = cooldown
+        self.batch = batch
+        self.interval = interval
+        self._heap = []  # [(срок, user_id)]
+        self._due = {}  # {user_id: (срок, chat_id)}
+        self._wakeup = asyncio.Event()
+        self.sent = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self._due)
+
+    # ===================
+    # РАСПИСАНИЕ
+    # ===================
+
+    def schedule(self, user_id: int, p):
+        """Поставить, переставить или снять напоминание по записи игрока"""
+        if p.get("notify") is None:
+            self._due.pop(user_id, None)  # запись в куче станет мусором
+            return
+        due = p["last_grow"] + self.cooldown
+        if due <= time.time():
+            self._due.pop(user_id, None)  # расти уже можно — напоминать не о чем
+            return
+        current = self._due.get(user_id)
+        if current is not None and current[0] == due:
+            if current[1] != p["notify"]:
+                self._due[user_id] = (due, p["notify"])
+            return
+        self._due[user_id] = (due, p["notify"])
+        heapq.heappush(self._heap, (due, user_id))
+        if self._heap[0][1] == user_id:
+            self._wakeup.set()  # новый ближайший срок — пересчитать сон
+
+    def player_saved(self, user_id: int, data):
+        self.schedule(user_id, data)
+
+    def player_deleted(self, user_id: int):
+        self._due.pop(user_id, None)
+
+    def players_reset(self):
+        self._heap.clear()
+        self._due.clear()
+
+    async def rebuild(self, batch: int = 10_000, grace: int = 10 * 60):
+        """Расписание из хранилища: одна куча вместо heappush на каждого
+
+        Отправленное напоминание нигде не отмечается, поэтому сроки старше
+        grace секунд считаются уже напомненными — иначе каждый перезапуск
+        повторял бы напоминания всем, кто давно может расти. Сроки,
+        истёкшие за короткий простой (деплой), ещё напоминаются.
+        """
+        self._heap.clear()
+        self._due.clear()
+        oldest = time.time() - grace
+        async for part in self.repo.iter_players(batch):
+            for user_id, p in part:
+                if p.get("notify") is not None and p["last_grow"] + self.cooldown > oldest:
+                    due = p["last_grow"] + self.cooldown
+                    self._due[user_id] = (due, p["notify"])
+                    self._heap.append((due, user_id))
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def pop_due(self, now: float, limit: int) -> list:
+        """До limit наступивших напоминаний [(user_id, chat_id)], уже снятых с расписания"""
+        ready = []
+        while self._heap and self._heap[0][0] <= now and len(ready) < limit:
+            due, user_id = heapq.heappop(self._heap)
+            current = self._due.get(user_id)
+            if current is None or current[0] != due:
+                continue  # игрок вырос ещё раз или отписался
+            del self._due[user_id]
+            ready.append((user_id, current[1]))
+        return ready
+
+    # ===================
+    # ОТПРАВКА
+    # ===================
+
+    async def run(self):
+        """Фоновая задача: спит до ближайшего срока и рассылает пачками"""
+        while True:
+            ready = self.pop_due(time.time(), self.batch)
+            if ready:
+                await asyncio.gather(*(self._send(user_id, chat_id) for user_id, chat_id in ready))
+                await asyncio.sleep(self.interval)
+                continue
+            delay = self._heap[0][0] - time.time() if self._heap else 3600
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, min(delay, 3600)))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, user_id: int, chat_id: int):
+        try:
+            await self.bot.send_message(chat_id, GROW_READY_TEXT)
+            self.sent += 1
+        except (TelegramForbiddenError, TelegramBadRequest):
+            self.failed += 1
+            await self.unsubscribe(user_id)  # бот заблокирован или чат недоступен
+        except Exception:
+            self.failed += 1
+            logging.exception("Не удалось напомнить о росте %s", user_id)
+
+    async def unsubscribe(self, user_id: int):
+        async with self.locks.hold(user_id):
+            p = await self.repo.get(user_id)
+            if p is not None and p.get("notify") is not None:
+                p["notify"] = None
+                await self.repo.save(user_id, p)
+
+    def stats(self) -> dict:
+        return {"subscribed": len(self._due), "heap": len(self._heap), "sent": self.sent, "failed": self.failed}
+
+
+if __name__ == "__main__":
+    import random
+    import tracemalloc
+    from records import PlayerRecord
+
+    class ListRepository:
+        def __init__(self, players):
+            self.players = players
+
+        async def iter_players(self, batch: int = 1000):
+            for start in range(0, len(self.players), batch):
+                yield self.players[start:start + batch]
+
+    async def main():
+        count = 500_000
+        now = int(time.time())
+        players = [  # сроки в ближайшие 2 часа
+            (10**9 + i, PlayerRecord(last_grow=now - random.randint(0, 2 * 60 * 60 - 1), notify=10**9 + i))
+            for i in range(count)
+        ]
+        notifier = GrowNotifier(None, ListRepository(players), None, cooldown=2 * 60 * 60)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        await notifier.rebuild()
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"rebuild {count}: {elapsed:.2f} с, {memory / count:.0f} байт на подписчика")
+
+        # 100k игроков выросли ещё раз: их старые записи кучи становятся мусором
+        started = time.perf_counter()
+        for user_id, p in players[:100_000]:
+            p.last_grow += 60
+            notifier.player_saved(user_id, p)
+        print(f"перестановка: {(time.perf_counter() - started) / 100_000 * 1e6:.2f} мкс на рост")
+
+        started = time.perf_counter()
+        total = 0
+        while True:
+            ready = notifier.pop_due(now + 3 * 60 * 60, 1000)
+            if not ready:
+                break
+            total += len(ready)
+        print(f"выдача {total} сроков: {(time.perf_counter() - started) / total * 1e6:.2f} мкс на напоминание")
+        print(notifier.stats())
+
+    asyncio.run(main())
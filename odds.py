@@ -0,0 +1,202 @@
+import os
+import time
+import struct
+import random
+import asyncio
+import logging
+import argparse
+from collections import OrderedDict
+
+from battle import calculate_battle_damage
+
+try:
+    import numpy as np  # type: ignore
+    from battle_np import simulate_fights
+except ImportError:  # без numpy клетки считаются скалярным движком
+    np = None
+
+
+def _scalar_win_chance(att_a: int, def_a: int, att_d: int, def_d: int, fights: int) -> float:
+    attacker = {"attack": att_a, "defense": def_a}
+    defender = {"attack": att_d, "defense": def_d}
+    wins = 0
+    for _ in range(fights):
+        dmg1 = calculate_battle_damage(attacker, defender)[0]
+        dmg2 = calculate_battle_damage(defender, attacker)[0]
+        wins += dmg1 > dmg2
+    return wins / fights
+
+
+def simulate_win_chance(att_a: int, def_a: int, att_d: int, def_d: int, fights: int) -> float:
+    """Вероятность победы атакующего методом Монте-Карло"""
+    if np is None:
+        return _scalar_win_chance(att_a, def_a, att_d, def_d, fights)
+    outcome = simulate_fights(np.full(fights, att_a), def_a, att_d, def_d)
+    return float((outcome > 0).mean())
+
+
+class WinOddsTable:
+    """Таблица шансов на победу по (член, сиськи) атакующего и защитника
+
+    Сетка — STEP делений по каждой из 4 координат, одна клетка — один байт
+    (вероятность * 254, 255 — ещё не посчитано), всего LEVELS^4 байт.
+    Таблицу нужно собрать заранее (python odds.py build): без неё
+    недостающие клетки считаются лениво, но в потоке, а не в цикле событий.
+    Для статов вне сетки (отрицательных или слишком больших) сразу
+    отдаётся ближайшая клетка сетки, а точный шанс симулируется в фоне
+    и кэшируется в LRU для следующих запросов.
+    """
+
+    STEP = 5
+    LEVELS = 24  # значения 0, 5, ..., 115
+    UNKNOWN = 255
+    HEADER = b"HCODDS1"
+
+    def __init__(self, path: str = None, fights: int = 2000, lru_size: int = 4096):
+        self.path = path
+        self.fights = fights
+        self._cells = bytearray([self.UNKNOWN]) * (self.LEVELS ** 4)
+        self.lru_size = lru_size
+        self._exact = OrderedDict()  # {статы вне сетки: шанс}
+        self._pending = {}  # {статы вне сетки: задача фоновой симуляции}
+        self.lazy_cells = 0
+
+    def _cell_index(self, stats: tuple):
+        """(индекс ближайшей клетки, лежат ли статы на сетке)"""
+        index = 0
+        on_grid = True
+        for value in stats:
+            idx = (value + self.STEP // 2) // self.STEP
+            if value < 0 or idx >= self.LEVELS:
+                on_grid = False
+                idx = min(max(idx, 0), self.LEVELS - 1)
+            index = index * self.LEVELS + idx
+        return index, on_grid
+
+    async def _cell(self, index: int) -> float:
+        cell = self._cells[index]
+        if cell == self.UNKNOWN:
+            grid_stats = [(index // self.LEVELS ** k) % self.LEVELS * self.STEP for k in (3, 2, 1, 0)]
+            chance = await asyncio.to_thread(simulate_win_chance, *grid_stats, self.fights)
+            cell = round(chance * 254)
+            if self._cells[index] == self.UNKNOWN:
+                self._cells[index] = cell
+                self.lazy_cells += 1
+        return cell / 254
+
+    async def _simulate_exact(self, stats: tuple):
+        try:
+            chance = await asyncio.to_thread(simulate_win_chance, *stats, self.fights)
+        except Exception:
+            logging.exception("Не удалось посчитать шанс для %s", stats)
+            return
+        finally:
+            del self._pending[stats]
+        self._exact[stats] = chance
+        if len(self._exact) > self.lru_size:
+            self._exact.popitem(last=False)
+
+    async def win_chance(self, attacker: dict, defender: dict) -> float:
+        """Шанс, что attacker победит defender в бою callback_fight_accept"""
+        stats = (attacker["attack"], attacker["defense"], defender["attack"], defender["defense"])
+        index, on_grid = self._cell_index(stats)
+        if on_grid:
+            return await self._cell(index)
+
+        chance = self._exact.get(stats)
+        if chance is not None:
+            self._exact.move_to_end(stats)
+            return chance
+        if stats not in self._pending:
+            self._pending[stats] = asyncio.create_task(self._simulate_exact(stats))
+        return await self._cell(index)  # пока точного нет — оценка по краю сетки
+
+    # ===================
+    # СБОРКА И ФАЙЛ
+    # ===================
+
+    def build(self, progress=None):
+        """Расчёт всех клеток; с numpy — пачкой на каждую пару статов атакующего"""
+        grid = [i * self.STEP for i in range(self.LEVELS)]
+        pairs = [(a, d) for a in grid for d in grid]
+        if np is not None:
+            att_d = np.repeat([a for a, _ in pairs], self.fights)
+            def_d = np.repeat([d for _, d in pairs], self.fights)
+        for n, (att_a, def_a) in enumerate(pairs):
+            base = n * len(pairs)
+            if np is not None:
+                outcome = simulate_fights(att_a, def_a, att_d, def_d).reshape(len(pairs), self.fights)
+                chances = (outcome > 0).mean(axis=1)
+                self._cells[base:base + len(pairs)] = bytes(np.rint(chances * 254).astype(np.uint8))
+            else:
+                for m, (a, d) in enumerate(pairs):
+                    self._cells[base + m] = round(_scalar_win_chance(att_a, def_a, a, d, self.fights) * 254)
+            if progress:
+                progress(n + 1, len(pairs))
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            logging.warning("Нет таблицы шансов %s: собери её командой python odds.py build", self.path)
+            return False
+        with open(self.path, "rb") as f:
+            header = f.read(len(self.HEADER) + 2)
+            if header != self.HEADER + struct.pack("BB", self.STEP, self.LEVELS):
+                return False  # таблица от другой сетки
+            data = f.read()
+        if len(data) != len(self._cells):
+            return False
+        self._cells[:] = data
+        return True
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"  # шарды могут сохранять одновременно
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER + struct.pack("BB", self.STEP, self.LEVELS))
+            f.write(self._cells)
+        os.replace(tmp_path, self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Таблица шансов на победу")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="посчитать всю таблицу и сохранить в файл")
+    build.add_argument("--path", default="odds.bin")
+    build.add_argument("--fights", type=int, default=1000, help="боёв на клетку")
+    bench = sub.add_parser("bench", help="время одного запроса к таблице")
+    bench.add_argument("--path", default="odds.bin")
+    args = parser.parse_args()
+
+    table = WinOddsTable(args.path, fights=args.fights if args.command == "build" else 2000)
+    if args.command == "build":
+        started = time.perf_counter()
+
+        def progress(done, total):
+            if done % 24 == 0 or done == total:
+                print(f"\r{done}/{total}", end="", flush=True)
+
+        table.build(progress)
+        table.save()
+        print(f"\nГотово за {time.perf_counter() - started:.1f} с: {args.path}")
+    else:
+        if not table.load():
+            print("Файл таблицы не найден, клетки будут считаться лениво")
+        samples = [
+            ({"attack": random.randint(3, 115), "defense": random.randint(1, 115)},
+             {"attack": random.randint(3, 115), "defense": random.randint(1, 115)})
+            for _ in range(1000)
+        ]
+
+        async def bench_lookups(number: int = 200) -> float:
+            for attacker, defender in samples:  # прогрев ленивых клеток
+                await table.win_chance(attacker, defender)
+            started = time.perf_counter()
+            for _ in range(number):
+                for attacker, defender in samples:
+                    await table.win_chance(attacker, defender)
+            return (time.perf_counter() - started) / (number * len(samples)) * 1e6
+
+        print(f"Запрос к таблице: {asyncio.run(bench_lookups()):.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
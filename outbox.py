@@ -0,0 +1,186 @@
+import time
+import asyncio
+import logging
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware  # type: ignore
+from aiogram.exceptions import TelegramRetryAfter  # type: ignore
+
+
+class TokenBucket:
+    """Ведро токенов: rate запросов в секунду, до burst подряд"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Занять токен; возвращает, сколько секунд подождать до отправки"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Флуд-контроль от Telegram: ничего не отправлять seconds секунд"""
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class _PendingEdit:
+    __slots__ = ("method", "future")
+
+    def __init__(self, method, future):
+        self.method = method
+        self.future = future
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Bot API (middleware сессии бота)
+
+    Отправки и правки сообщений проходят через вёдра токенов: общее,
+    на чат и на inline-сообщение. Пока правка одного сообщения ждёт
+    своей очереди, новые правки того же сообщения не встают в очередь,
+    а заменяют её текст — уйдёт только последняя. На RetryAfter запрос
+    повторяется после паузы, и весь чат ставится на эту паузу.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, group_burst: float = 5,
+                 inline_rate: float = 1, inline_burst: float = 2, max_retries: int = 3,
+                 max_buckets: int = 100_000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.inline_rate = inline_rate
+        self.inline_burst = inline_burst
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+        self._buckets = {}  # {ключ чата или inline-сообщения: TokenBucket}
+        self._pending = {}  # {ключ сообщения: _PendingEdit}
+        self.queued = 0
+        self.max_queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        if not api_method.startswith(("send", "edit")):
+            return await self._send(make_request, bot, method)
+
+        key = self._message_key(method) if api_method.startswith("edit") else None
+        if key is None:
+            await self._throttle(method)
+            return await self._send(make_request, bot, method)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Эту правку заменяет более новая, которая ещё ждёт отправки
+            pending.method = method
+            self.coalesced += 1
+            return await asyncio.shield(pending.future)
+
+        pending = self._pending[key] = _PendingEdit(method, asyncio.get_running_loop().create_future())
+        pending.future.add_done_callback(_consume_exception)
+        try:
+            await self._throttle(method)
+        except BaseException:
+            del self._pending[key]
+            pending.future.cancel()
+            raise
+        # Дальше новые правки этого сообщения встают в очередь заново
+        del self._pending[key]
+        try:
+            result = await self._send(make_request, bot, pending.method)
+        except BaseException as e:
+            pending.future.set_exception(e)
+            raise
+        pending.future.set_result(result)
+        return result
+
+    @staticmethod
+    def _message_key(method):
+        inline_message_id = getattr(method, "inline_message_id", None)
+        if inline_message_id:
+            return inline_message_id
+        message_id = getattr(method, "message_id", None)
+        chat_id = getattr(method, "chat_id", None)
+        if message_id is not None and chat_id is not None:
+            return (chat_id, message_id)
+        return None
+
+    def _bucket(self, key, rate: float, burst: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self.prune()
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _method_buckets(self, method) -> list:
+        buckets = [self.global_bucket]
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            # Группы и каналы (отрицательный id) Telegram ограничивает сильнее
+            if isinstance(chat_id, str) or chat_id < 0:
+                buckets.append(self._bucket(chat_id, self.group_rate, self.group_burst))
+            else:
+                buckets.append(self._bucket(chat_id, self.chat_rate, self.chat_burst))
+        inline_message_id = getattr(method, "inline_message_id", None)
+        if inline_message_id:
+            buckets.append(self._bucket(inline_message_id, self.inline_rate, self.inline_burst))
+        return buckets
+
+    async def _throttle(self, method):
+        now = time.monotonic()
+        delay = max(bucket.reserve(now) for bucket in self._method_buckets(method))
+        if delay <= 0:
+            return
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.queued -= 1
+
+    async def _send(self, make_request, bot, method):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await make_request(bot, method)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logging.warning("Флуд-контроль на %s: ждём %s с", method.__api_method__, e.retry_after)
+                for bucket in self._method_buckets(method)[1:]:
+                    bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    def prune(self):
+        """Удаление полных (давно не использованных) вёдер"""
+        now = time.monotonic()
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.burst
+        }
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+        }
+
+
+def _consume_exception(future):
+    # Ошибку получает первый запрос; ждущие правки могут и не появиться
+    if not future.cancelled():
+        future.exception()
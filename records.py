@@ -0,0 +1,109 @@
+class PlayerRecord:
+    """Компактная запись игрока вместо словаря со строковыми ключами
+
+    Поля лежат в __slots__, поэтому запись в разы меньше dict. Доступ
+    p["attack"], p.get("name") и dict(p) работает как у словаря, так что
+    код, написанный под словари, менять не нужно.
+    """
+
+    __slots__ = ("attack", "defense", "wins", "losses", "last_grow", "name", "notify")
+
+    FIELDS = ("attack", "defense", "wins", "losses", "last_grow")
+
+    def __init__(self, attack: int = 10, defense: int = 2, wins: int = 0, losses: int = 0,
+                 last_grow: int = 0, name: str = None, notify: int = None):
+        self.attack = attack
+        self.defense = defense
+        self.wins = wins
+        self.losses = losses
+        self.last_grow = last_grow
+        self.name = name
+        self.notify = notify  # чат для напоминания о росте, None — не напоминать
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlayerRecord":
+        return cls(data["attack"], data["defense"], data["wins"], data["losses"],
+                   data["last_grow"], data.get("name"), data.get("notify"))
+
+    def to_dict(self) -> dict:
+        """Словарь в формате players.json (name и notify — только если заданы)"""
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if self.name is not None:
+            data["name"] = self.name
+        if self.notify is not None:
+            data["notify"] = self.notify
+        return data
+
+    def copy(self) -> "PlayerRecord":
+        return PlayerRecord(self.attack, self.defense, self.wins, self.losses, self.last_grow, self.name,
+                            self.notify)
+
+    # Интерфейс словаря
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other):
+        if isinstance(other, PlayerRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"PlayerRecord({self.to_dict()})"
+
+
+if __name__ == "__main__":
+    # Бенчмарк памяти: старые словари со строковыми id против PlayerRecord с int id
+    import gc
+    import random
+    import tracemalloc
+
+    count = 1_000_000
+    rng = random.Random(1)
+    rows = [
+        (rng.randrange(10**9, 8 * 10**9), rng.randint(-20, 300), rng.randint(-5, 80),
+         rng.randint(0, 500), rng.randint(0, 500), rng.randrange(1_700_000_000, 1_760_000_000))
+        for _ in range(count)
+    ]
+
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        data = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del data
+        return size
+
+    old = measure(lambda: {
+        str(user_id): {"attack": a, "defense": d, "wins": w, "losses": l, "last_grow": g}
+        for user_id, a, d, w, l, g in rows
+    })
+    new = measure(lambda: {
+        int(str(user_id)): PlayerRecord(a, d, w, l, g)
+        for user_id, a, d, w, l, g in rows
+    })
+    print(f"{count} игроков")
+    print(f"dict со строковыми ключами: {old / 2**20:8.1f} МБ ({old / count:.0f} Б на игрока)")
+    print(f"PlayerRecord с int id:      {new / 2**20:8.1f} МБ ({new / count:.0f} Б на игрока)")
+    print(f"экономия: {(1 - new / old) * 100:.0f}%")
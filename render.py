@@ -0,0 +1,342 @@
+"""Тексты и клавиатуры бота и единый путь правки сообщения
+
+Шаблоны — функции на f-строках: разбор формата делает компилятор один
+раз, а не str.format на каждый апдейт. Клавиатуры зависят только от id
+владельца (или типа топа) и кэшируются; типы aiogram неизменяемые,
+поэтому один объект можно отдавать всем апдейтам.
+
+    python render.py  # микробенчмарк подготовки ответа
+"""
+from functools import lru_cache
+from aiogram.methods import EditMessageText  # type: ignore
+from aiogram.types import (  # type: ignore
+    CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InputTextMessageContent,
+)
+from fightlog import CRIT, MISS, LUCKY
+
+MENU_TEXT = "🎮 **RPG H&C** - твоя мини-RPG игра!\n\nВыбери действие:"
+NOT_YOUR_MENU = "❌ Это не твое меню! Создай свое через inline режим"
+
+TOP_ORDER = ("wins", "size", "winrate")
+TOP_LABELS = {"wins": "🏆 Победы", "size": "🥒🍒 Размер", "winrate": "📊 Винрейт"}
+TOP_TITLES = {
+    "wins": "🏆 Топ-10 по победам:",
+    "size": "🥒🍒 Топ-10 по сумме члена и сисек:",
+    "winrate": "📊 Топ-10 по винрейту:",
+}
+
+
+# ===================
+# КЛАВИАТУРЫ
+# ===================
+
+@lru_cache(maxsize=10_000)
+def main_keyboard(owner_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="👤 Профиль", callback_data=f"profile_{owner_id}")],
+        [InlineKeyboardButton(text="🌱 Вырастить член", callback_data=f"grow_{owner_id}")],
+        [InlineKeyboardButton(text="⚔️ Атака", callback_data=f"attack_{owner_id}")],
+        [InlineKeyboardButton(text="🏆 Топ", callback_data="top_wins")]
+    ])
+
+
+@lru_cache(maxsize=10_000)
+def back_keyboard(owner_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{owner_id}")]
+    ])
+
+
+@lru_cache(maxsize=10_000)
+def cooldown_keyboard(owner_id: int) -> InlineKeyboardMarkup:
+    """Ответ «ещё рано растить»: напоминание и назад"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔔 Напомнить, когда можно", callback_data=f"notify_{owner_id}")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{owner_id}")]
+    ])
+
+
+@lru_cache(maxsize=10_000)
+def new_fight_keyboard(owner_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Новый бой", callback_data=f"back_to_menu_{owner_id}")]
+    ])
+
+
+@lru_cache(maxsize=4096)
+def top_keyboard(current: str, owner_id: int) -> InlineKeyboardMarkup:
+    next_type = TOP_ORDER[(TOP_ORDER.index(current) + 1) % len(TOP_ORDER)]
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{owner_id}"),
+            InlineKeyboardButton(text=f"➡️ {TOP_LABELS[next_type]}", callback_data=f"top_{next_type}")
+        ]
+    ])
+
+
+@lru_cache(maxsize=64)
+def tournament_keyboard(organizer_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🏟 Участвовать", callback_data=f"tour_{organizer_id}")]
+    ])
+
+
+def challenge_keyboard(fight_id: str) -> InlineKeyboardMarkup:
+    # fight_id у каждого вызова свой — кэшировать нечего
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⚔️ Согласиться", callback_data=f"accept_{fight_id}")]
+    ])
+
+
+@lru_cache(maxsize=10_000)
+def fight_keyboard(attacker_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура /fight"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⚔️ Принять бой!", callback_data=f"fight_accept_{attacker_id}")]
+    ])
+
+
+@lru_cache(maxsize=10_000)
+def inline_results(owner_id: int) -> list:
+    """Готовая статья с главным меню для владельца"""
+    return [InlineQueryResultArticle(
+        id="main_menu",
+        title="🎮 RPG H&C",
+        description="Твоя RPG игра с членами и сисками!",
+        input_message_content=InputTextMessageContent(message_text=MENU_TEXT, parse_mode="Markdown"),
+        reply_markup=main_keyboard(owner_id),
+    )]
+
+
+# ===================
+# ШАБЛОНЫ
+# ===================
+
+def profile_text(name: str, p: dict, grow_cooldown: str) -> str:
+    total = p["wins"] + p["losses"]
+    winrate = (p["wins"] / total * 100) if total > 0 else 0
+    return (
+        f"👤 Профиль {name}\n"
+        f"🥒 Член: {p['attack']}см\n"
+        f"🍒Сиськи: {p['defense']} lvl\n"
+        f"🏆 Побед: {p['wins']}\n"
+        f"💀 Поражений: {p['losses']}\n"
+        f"📊 Винрейт: {winrate:.1f}%\n\n"
+        f"🕐 Рост: {grow_cooldown}"
+    )
+
+
+FIGHT_RESULT_MARKS = {"win": "🏆", "loss": "💀", "draw": "🤝"}
+STREAK_TITLES = {"win": "побед", "loss": "поражений", "draw": "ничьих"}
+
+
+def fight_history_text(user_id: int, records: list, streak: tuple, names: dict) -> str:
+    """Блок профиля: последние бои (fightlog.FightRecord) и текущая серия
+
+    names — {user_id: имя} известных соперников, остальные без имени
+    """
+    if not records:
+        return "📜 Боёв ещё не было"
+    lines = ["📜 Последние бои:"]
+    for record in records:
+        result = record.result_for(user_id)
+        own, other, flags = record.hits_for(user_id)
+        opponent = record.defender if record.attacker == user_id else record.attacker
+        marks = f"{' 🔥' if flags & CRIT else ''}{' 💨' if flags & MISS else ''}{' ⭐' if flags & LUCKY else ''}"
+        bonus = ""
+        if result != "draw":
+            sign = "+" if result == "win" else "-"
+            bonus = f" ({sign}{record.bonus_attack}см, {sign}{record.bonus_defense} lvl)"
+        against = f" vs {names[opponent]}" if opponent in names else ""
+        lines.append(f"{FIGHT_RESULT_MARKS[result]} {own}:{other}{marks}{bonus}{against}")
+    kind, length = streak
+    if length > 1:
+        lines.append(f"🔁 Серия {STREAK_TITLES[kind]}: {length}")
+    return "\n".join(lines)
+
+
+def cooldown_text(grow_cooldown: str) -> str:
+    return f"⏰ {grow_cooldown}"
+
+
+def _change_emoji(change: int, big: int) -> str:
+    # Особые эмодзи для экстремальных значений
+    if change >= big:
+        return "🚀"
+    if change <= -2:
+        return "💥"
+    return "📈" if change > 0 else "📉" if change < 0 else "➡️"
+
+
+def grow_text(result: dict) -> str:
+    return (
+        f"🌱 **Результат роста:**\n\n"
+        f"🥒 Член: {_change_emoji(result['cucumber_change'], 10)} {result['cucumber_change']:+}см "
+        f"(теперь {result['new_attack']}см)\n"
+        f"🍒Сиськи: {_change_emoji(result['shield_change'], 4)} {result['shield_change']:+} lvl "
+        f"(теперь {result['new_defense']} lvl)"
+    )
+
+
+def challenge_text(name: str, p: dict, newbie_chance: float) -> str:
+    return (
+        f"⚔ {name} вызывает на бой!\n"
+        f"Член: {p['attack']}, Сиськи: {p['defense']}\n"
+        f"Побед: {p['wins']}, поражений: {p['losses']}\n"
+        f"🎲 Шанс против новичка: {newbie_chance * 100:.0f}%\n"
+    )
+
+
+def fight_call_text(name: str, p: dict) -> str:
+    """Вызов командой /fight"""
+    return (
+        f"⚔️ **{name} готов к бою!**\n\n"
+        f"🥒 Член: {p['attack']}см\n"
+        f"🍒Сиськи: {p['defense']} lvl\n"
+        f"🏆 Побед: {p['wins']}\n"
+        f"💀 Поражений: {p['losses']}\n\n"
+        f"Кто осмелится принять вызов?\n"
+        f"💡 *Теперь в боях есть криты, промахи и удача!*"
+    )
+
+
+MATCH_LEFT = "🚪 Ты вышел из очереди подбора"
+
+
+def match_wait_text(user_rating: int) -> str:
+    return (
+        f"🔎 Ищем соперника под твой рейтинг {user_rating}...\n"
+        f"Чем дольше ждёшь, тем шире разброс. /match ещё раз — выйти из очереди"
+    )
+
+
+def tournament_open_text(mode_name: str) -> str:
+    return (
+        f"🏟 **Открыта регистрация на турнир ({mode_name})!**\n\n"
+        f"Жми кнопку, чтобы участвовать. Все бои пройдут разом, "
+        f"победы и проигрыши засчитываются как в обычных боях."
+    )
+
+
+def tournament_summary_text(mode_name: str, names: dict, standings: list, fights: int,
+                            wins: dict, losses: dict, limit: int = 10) -> str:
+    """Итог турнира одним сообщением: победитель и верх таблицы
+
+    Без разметки: в именах бывают подчёркивания, а сообщение одно на весь турнир
+    """
+    lines = [
+        f"🏟 Турнир ({mode_name}) завершён!",
+        f"Участников: {len(names)}, боёв: {fights}",
+        "",
+        f"🥇 Победитель: {names[standings[0][0]]}",
+        "",
+    ]
+    for place, (user_id, _) in enumerate(standings[:limit], 1):
+        lines.append(f"{place}. {names[user_id]} — {wins[user_id]} побед / {losses[user_id]} пораж.")
+    return "\n".join(lines)
+
+
+def _hit_text(hit: tuple) -> str:
+    damage, is_crit, is_miss, is_lucky = hit
+    if is_miss:
+        return "   💨 Промах! (0 урона)"
+    return f"   💥 {damage} урона{' 🔥КРИТ!' if is_crit else ''}{' ⭐УДАЧА!' if is_lucky else ''}"
+
+
+def fight_result_text(attacker_name: str, defender_name: str, chances: tuple, hits: tuple,
+                      winner_name: str = None, bonus: tuple = None) -> str:
+    """hits — результаты calculate_battle_damage атакующего и защитника, winner_name None — ничья"""
+    if winner_name is None:
+        result = "🤝 Ничья! Никто не получает награды."
+    else:
+        result = (
+            f"🏆 Победитель: {winner_name}\n"
+            f"🎁 Получает: +{bonus[0]}см члена, +{bonus[1]} lvl сисек"
+        )
+    return (
+        f"⚔️ **Результат боя:**\n\n"
+        f"🎲 Шансы: {chances[0] * 100:.0f}% / {chances[1] * 100:.0f}%\n\n"
+        f"🔸 {attacker_name}:\n{_hit_text(hits[0])}\n"
+        f"🔹 {defender_name}:\n{_hit_text(hits[1])}\n\n"
+        f"{result}"
+    )
+
+
+def top_text(top_type: str, top_players: list) -> str:
+    lines = [TOP_TITLES[top_type], ""]
+    for i, (user_id, p) in enumerate(top_players, 1):
+        if top_type == "wins":
+            value = f"{p['wins']} побед"
+        elif top_type == "size":
+            value = f"{p['attack']}см + {p['defense']} lvl"
+        else:
+            total = p["wins"] + p["losses"]
+            value = f"{(p['wins'] / total * 100):.1f}%" if total > 0 else "0%"
+        lines.append(f"{i}. {p.get('name') or f'ID:{user_id}'} — {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ===================
+# ОТВЕТ НА КНОПКУ
+# ===================
+
+def edit_method(callback: CallbackQuery, text: str, reply_markup=None, parse_mode: str = None) -> EditMessageText:
+    """Правка сообщения с кнопкой: inline-сообщение или обычное — один метод API"""
+    params = {"text": text, "reply_markup": reply_markup}
+    if parse_mode is not None:
+        params["parse_mode"] = parse_mode
+    if callback.inline_message_id:
+        params["inline_message_id"] = callback.inline_message_id
+    else:
+        params["chat_id"] = callback.message.chat.id
+        params["message_id"] = callback.message.message_id
+    return EditMessageText(**params)
+
+
+async def respond(callback: CallbackQuery, text: str, reply_markup=None, parse_mode: str = None):
+    return await callback.bot(edit_method(callback, text, reply_markup, parse_mode))
+
+
+if __name__ == "__main__":
+    import timeit
+    from aiogram.types import Chat, Message, User  # type: ignore
+    from datetime import datetime
+
+    user = User(id=123456789, is_bot=False, first_name="Игрок")
+    inline = CallbackQuery(id="1", from_user=user, chat_instance="c", data="profile_123456789",
+                           inline_message_id="AAAAAgAAAAAAAAAA")
+    message = CallbackQuery(id="2", from_user=user, chat_instance="c", data="profile_123456789",
+                            message=Message(message_id=5, date=datetime.now(), chat=Chat(id=1, type="private")))
+    p = {"attack": 42, "defense": 17, "wins": 12, "losses": 7, "last_grow": 0}
+
+    def before(callback):
+        # Как было в хендлерах: новая клавиатура и своя ветка на каждый апдейт
+        total = p["wins"] + p["losses"]
+        winrate = (p["wins"] / total * 100) if total > 0 else 0
+        text = (
+            f"👤 Профиль Игрок\n"
+            f"🥒 Член: {p['attack']}см\n"
+            f"🍒Сиськи: {p['defense']} lvl\n"
+            f"🏆 Побед: {p['wins']}\n"
+            f"💀 Поражений: {p['losses']}\n"
+            f"📊 Винрейт: {winrate:.1f}%\n\n"
+            f"🕐 Рост: Можно растить! 🌱"
+        )
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back_to_menu_{callback.from_user.id}")]
+        ])
+        if callback.inline_message_id:
+            return EditMessageText(text=text, inline_message_id=callback.inline_message_id, reply_markup=markup)
+        return EditMessageText(text=text, chat_id=callback.message.chat.id,
+                               message_id=callback.message.message_id, reply_markup=markup)
+
+    def after(callback):
+        return edit_method(callback, profile_text("Игрок", p, "Можно растить! 🌱"),
+                           back_keyboard(callback.from_user.id))
+
+    number = 50_000
+    for name, func in (("было", before), ("стало", after)):
+        for kind, callback in (("inline", inline), ("сообщение", message)):
+            seconds = timeit.timeit(lambda: func(callback), number=number)
+            print(f"{name:>6}, {kind:<9}: {seconds / number * 1e6:6.2f} мкс на ответ")
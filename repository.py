@@ -0,0 +1,305 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+import aiosqlite  # type: ignore
+from storage import PlayerStore
+from leaderboard import Leaderboards
+from records import PlayerRecord
+
+def new_player() -> PlayerRecord:
+    """Статы нового игрока: 10 см, 2 lvl"""
+    return PlayerRecord()
+
+
+class PlayerRepository(ABC):
+    """Общий интерфейс хранилища игроков
+
+    Хендлеры работают только через него: get / get_or_create читают игрока,
+    save фиксирует изменения, top отдаёт таблицу лидеров.
+    Наблюдатели (кэши) получают player_saved / player_deleted / players_reset.
+    Хранилище без какого-то из абстрактных методов не создаётся.
+    """
+
+    def __init__(self):
+        self.observers = []
+
+    def subscribe(self, observer):
+        self.observers.append(observer)
+
+    def _notify_saved(self, items: dict):
+        for observer in self.observers:
+            for user_id, data in items.items():
+                observer.player_saved(user_id, data)
+
+    def _notify_deleted(self, user_ids: list):
+        for observer in self.observers:
+            for user_id in user_ids:
+                observer.player_deleted(user_id)
+
+    def _notify_reset(self):
+        for observer in self.observers:
+            observer.players_reset()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def get(self, user_id: int):
+        """Запись игрока или None"""
+
+    @abstractmethod
+    async def save(self, user_id: int, data: PlayerRecord):
+        """Сохранение записи игрока"""
+
+    async def save_many(self, items: dict):
+        for user_id, data in items.items():
+            await self.save(user_id, data)
+
+    @abstractmethod
+    async def delete_many(self, user_ids: list):
+        """Удаление игроков"""
+
+    @abstractmethod
+    async def top(self, top_type: str, limit: int = 10) -> list:
+        """Таблица лидеров [(user_id, запись)] по типу топа из TOP_KEYS"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Число игроков"""
+
+    @abstractmethod
+    async def reset_all(self):
+        """Сброс всех игроков к статам новичка"""
+
+    @abstractmethod
+    def iter_players(self, batch: int = 1000) -> AsyncIterator[list]:
+        """Все игроки пачками [(user_id, запись)] без загрузки всей базы в один список"""
+
+    async def get_or_create(self, user_id: int) -> PlayerRecord:
+        """Инициализация нового игрока
+
+        Вызывается без замка игрока, поэтому чтение и запись не должны
+        разделяться await: хранилище, где это не так, переопределяет метод.
+        """
+        p = await self.get(user_id)
+        if p is None:
+            p = new_player()
+            await self.save(user_id, p)
+        return p
+
+
+class MemoryPlayerRepository(PlayerRepository):
+    """Игроки в памяти, на диске — снапшот players.json + журнал (как раньше)"""
+
+    def __init__(self, data_file: str):
+        super().__init__()
+        self.store = PlayerStore(data_file)
+        self.players = {}
+        self.leaderboards = Leaderboards()
+
+    async def open(self):
+        self.players = self.store.load()
+        self.leaderboards.rebuild(self.players)
+
+    async def close(self):
+        await self.store.close()
+
+    async def get(self, user_id: int):
+        # Отдаём живой словарь: изменения видны сразу, save пишет их в журнал
+        return self.players.get(user_id)
+
+    async def save(self, user_id: int, data: PlayerRecord):
+        self.players[user_id] = data
+        self.store.append(user_id, data)
+        self.leaderboards.update(user_id, data)
+        self._notify_saved({user_id: data})
+
+    async def save_many(self, items: dict):
+        self.players.update(items)
+        self.store.append_many(items)
+        for user_id, data in items.items():
+            self.leaderboards.update(user_id, data)
+        self._notify_saved(items)
+
+    async def delete_many(self, user_ids: list):
+        for user_id in user_ids:
+            self.players.pop(user_id, None)
+            self.leaderboards.remove(user_id)
+        self.store.append_many(dict.fromkeys(user_ids))  # None в журнале — удаление
+        self._notify_deleted(user_ids)
+
+    async def top(self, top_type: str, limit: int = 10) -> list:
+        return [(user_id, self.players[user_id]) for user_id in self.leaderboards.top(top_type, limit)]
+
+    async def count(self) -> int:
+        return len(self.players)
+
+    async def iter_players(self, batch: int = 1000):
+        user_ids = list(self.players)
+        for start in range(0, len(user_ids), batch):
+            part = [(user_id, self.players.get(user_id)) for user_id in user_ids[start:start + batch]]
+            yield [(user_id, p) for user_id, p in part if p is not None]
+
+    async def reset_all(self):
+        for user_id in self.players:
+            self.players[user_id] = new_player()
+        self.leaderboards.rebuild(self.players)
+        self._notify_reset()
+        # Массовый сброс сразу уходит в новый снапшот, а не в журнал
+        await self.store.compact()
+
+
+class SqlitePlayerRepository(PlayerRepository):
+    """Игроки в SQLite (WAL) с индексами под таблицы лидеров
+
+    Все запросы идут через aiosqlite в отдельном потоке и не блокируют
+    event loop. При первом запуске импортируется players.json.
+    """
+
+    # Выражения совпадают с индексами, чтобы ORDER BY ... LIMIT шёл по индексу
+    TOP_ORDER = {
+        "wins": "wins",
+        "size": "(attack + defense)",
+        "winrate": "(CASE WHEN wins + losses > 0 THEN wins * 100.0 / (wins + losses) ELSE 0 END)",
+    }
+
+    def __init__(self, db_file: str, import_file: str = None):
+        super().__init__()
+        self.db_file = db_file
+        self.import_file = import_file
+        self.db = None
+
+    async def open(self):
+        self.db = await aiosqlite.connect(self.db_file)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS players ("
+            " id INTEGER PRIMARY KEY,"
+            " attack INTEGER NOT NULL,"
+            " defense INTEGER NOT NULL,"
+            " wins INTEGER NOT NULL,"
+            " losses INTEGER NOT NULL,"
+            " last_grow INTEGER NOT NULL,"
+            " name TEXT,"
+            " notify INTEGER)"
+        )
+        async with self.db.execute("PRAGMA table_info(players)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "notify" not in columns:  # база до напоминаний о росте
+            await self.db.execute("ALTER TABLE players ADD COLUMN notify INTEGER")
+        for top_type, expr in self.TOP_ORDER.items():
+            await self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_top_{top_type} ON players ({expr})")
+        await self.db.commit()
+
+        if self.import_file and await self.count() == 0 and os.path.exists(self.import_file):
+            with open(self.import_file, "r", encoding="utf-8") as f:
+                await self.save_many({
+                    int(user_id): PlayerRecord.from_dict(data) for user_id, data in json.load(f).items()
+                })
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    def _player_params(self, user_id: int, data: PlayerRecord) -> tuple:
+        return (user_id, data.attack, data.defense, data.wins, data.losses, data.last_grow, data.name,
+                data.notify)
+
+    async def get(self, user_id: int):
+        async with self.db.execute(
+            "SELECT attack, defense, wins, losses, last_grow, name, notify FROM players WHERE id = ?",
+            (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return PlayerRecord(*row) if row else None
+
+    async def get_or_create(self, user_id: int) -> PlayerRecord:
+        """INSERT OR IGNORE: игрок, созданный или изменённый между запросами, не затирается"""
+        p = await self.get(user_id)
+        if p is not None:
+            return p
+        p = new_player()
+        async with self.db.execute(
+            "INSERT OR IGNORE INTO players (id, attack, defense, wins, losses, last_grow, name, notify)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._player_params(user_id, p)
+        ) as cursor:
+            created = cursor.rowcount == 1
+        await self.db.commit()
+        if not created:
+            return await self.get(user_id)
+        self._notify_saved({user_id: p})
+        return p
+
+    async def save(self, user_id: int, data: PlayerRecord):
+        await self.save_many({user_id: data})
+
+    async def save_many(self, items: dict):
+        await self.db.executemany(
+            "INSERT INTO players (id, attack, defense, wins, losses, last_grow, name, notify)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET attack = excluded.attack, defense = excluded.defense,"
+            " wins = excluded.wins, losses = excluded.losses, last_grow = excluded.last_grow,"
+            " name = excluded.name, notify = excluded.notify",
+            [self._player_params(user_id, data) for user_id, data in items.items()]
+        )
+        await self.db.commit()
+        self._notify_saved(items)
+
+    async def delete_many(self, user_ids: list):
+        await self.db.executemany("DELETE FROM players WHERE id = ?", [(user_id,) for user_id in user_ids])
+        await self.db.commit()
+        self._notify_deleted(user_ids)
+
+    async def top(self, top_type: str, limit: int = 10) -> list:
+        order = self.TOP_ORDER[top_type]
+        async with self.db.execute(
+            f"SELECT id, attack, defense, wins, losses, last_grow, name, notify FROM players"
+            f" ORDER BY {order} DESC LIMIT ?",
+            (limit,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [(row[0], PlayerRecord(*row[1:])) for row in rows]
+
+    async def count(self) -> int:
+        async with self.db.execute("SELECT COUNT(*) FROM players") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def iter_players(self, batch: int = 1000):
+        last_id = None
+        while True:
+            async with self.db.execute(
+                "SELECT id, attack, defense, wins, losses, last_grow, name, notify FROM players"
+                " WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id if last_id is not None else -2**63, batch)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+            yield [(row[0], PlayerRecord(*row[1:])) for row in rows]
+            last_id = rows[-1][0]
+
+    async def reset_all(self):
+        p = new_player()
+        await self.db.execute(
+            "UPDATE players SET attack = ?, defense = ?, wins = ?, losses = ?, last_grow = ?, name = NULL,"
+            " notify = NULL",
+            (p.attack, p.defense, p.wins, p.losses, p.last_grow)
+        )
+        await self.db.commit()
+        self._notify_reset()
+
+
+def create_repository(backend: str, data_file: str, db_file: str) -> PlayerRepository:
+    """Выбор хранилища по имени: json (по умолчанию) или sqlite"""
+    if backend == "sqlite":
+        return SqlitePlayerRepository(db_file, import_file=data_file)
+    if backend == "json":
+        return MemoryPlayerRepository(data_file)
+    raise ValueError(f"Неизвестное хранилище игроков: {backend}")
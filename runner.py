@@ -0,0 +1,105 @@
+import os
+import asyncio
+import logging
+from aiohttp import web  # type: ignore
+from aiogram import BaseMiddleware, Bot, Dispatcher  # type: ignore
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application  # type: ignore
+
+RUN_MODE = os.getenv("RUN_MODE", "polling")  # polling или webhook
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+
+
+class UpdateLimiter(BaseMiddleware):
+    """Ограничение числа одновременно обрабатываемых апдейтов
+
+    Считает апдейты в работе, чтобы при остановке дождаться их
+    завершения до финального сохранения игроков.
+    """
+
+    def __init__(self, limit: int):
+        self._semaphore = asyncio.Semaphore(limit)
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def __call__(self, handler, event, data):
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float):
+        """Ожидание завершения апдейтов, которые уже в работе"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Не дождались %s апдейтов при остановке", self._in_flight)
+
+
+async def run_polling(dp: Dispatcher, bot: Bot):
+    """Long polling только нужных типов апдейтов, хендлеры — параллельными задачами"""
+    await bot.delete_webhook(drop_pending_updates=False)
+    await dp.start_polling(
+        bot,
+        polling_timeout=POLLING_TIMEOUT,
+        handle_as_tasks=True,
+        tasks_concurrency_limit=MAX_CONCURRENT_UPDATES,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+def run_webhook(dp: Dispatcher, bot: Bot):
+    """Вебхук на aiohttp: Telegram получает ответ сразу, апдейт обрабатывается в фоне"""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для RUN_MODE=webhook нужен WEBHOOK_URL")
+
+    async def set_webhook(bot: Bot):
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+
+    dp.startup.register(set_webhook)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+def run(dp: Dispatcher, bot: Bot, cluster=None):
+    """Запуск бота в режиме RUN_MODE (с шардами — фронт или воркер ShardCluster)"""
+    logging.basicConfig(level=logging.INFO)
+    if cluster is not None and cluster.sharded:
+        cluster.run(dp, bot)
+    elif RUN_MODE == "webhook":
+        run_webhook(dp, bot)
+    elif RUN_MODE == "polling":
+        asyncio.run(run_polling(dp, bot))
+    else:
+        raise ValueError(f"Неизвестный RUN_MODE: {RUN_MODE}")
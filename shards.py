@@ -0,0 +1,783 @@
+"""Несколько процессов-шардов: игроки разбиты по хэшу id
+
+    SHARD_COUNT=4 python bot.py
+
+Фронт-процесс получает апдейты (polling или вебхук, как в RUN_MODE) и
+пересылает каждый воркеру по хэшу id игрока. Воркер — обычный бот на
+127.0.0.1:SHARD_BASE_PORT+i со своей частью игроков (players.shard{i}.json,
+fights.shard{i}.json, fights.shard{i}.log). Чужих игроков воркер читает, пишет и блокирует
+через RPC к их шарду, поэтому хендлеры не знают о шардах.
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import signal
+import asyncio
+import logging
+import secrets
+import subprocess
+from contextlib import AsyncExitStack, asynccontextmanager
+import aiohttp  # type: ignore
+from aiohttp import web  # type: ignore
+from aiogram import Bot, Dispatcher  # type: ignore
+from aiogram.webhook.aiohttp_server import setup_application  # type: ignore
+
+from callbacks import OWNER_ACTIONS, decode
+from fights import FightRegistry
+from leaderboard import TOP_KEYS
+from records import PlayerRecord
+from bulk import bulk_update
+from repository import PlayerRepository
+from runner import (
+    RUN_MODE, MAX_CONCURRENT_UPDATES, POLLING_TIMEOUT, SHUTDOWN_DRAIN_TIMEOUT, WEBHOOK_URL, WEBHOOK_PATH,
+    WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS, WEBAPP_HOST, WEBAPP_PORT,
+)
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX = os.getenv("SHARD_INDEX")  # задаёт фронт при запуске воркера
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", "8700"))
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+SHARD_RPC_TIMEOUT = 30
+SHARD_LOCK_LEASE = 15  # замок по RPC отпускается сам, если держатель пропал и не продлевает его
+SHARD_LOCK_RENEW = SHARD_LOCK_LEASE / 3  # держатель продлевает аренду с запасом на задержки RPC
+SHARD_START_TIMEOUT = 120
+MATCH_SHARD = 0  # /match всех игроков — на один шард, чтобы очередь подбора была общей
+SHARD_BULK_POLL = 2  # секунды между опросами хода массовой операции на шардах
+
+
+def route_user_id(update: dict):
+    """Игрок, на чей шард идёт апдейт
+
+    Кнопки меню — на шард владельца из callback_data, принятие боя —
+    на шард автора вызова (там лежит вызов), остальное — на шард
+    отправителя.
+    """
+    callback = update.get("callback_query")
+    if callback is not None:
+        action = decode(callback.get("data") or "")
+        if action is not None:
+            if action.kind in OWNER_ACTIONS:
+                return action.arg
+            if action.kind == "accept":
+                owner_id = FightRegistry.owner_of(action.arg)
+                if owner_id is not None:
+                    return owner_id
+        return callback["from"]["id"]
+    for event in update.values():
+        if isinstance(event, dict) and "from" in event:
+            return event["from"]["id"]
+    return None
+
+
+def is_match_command(update: dict) -> bool:
+    """/match (вход в очередь подбора и выход из неё)"""
+    text = (update.get("message") or {}).get("text") or ""
+    return text.split(maxsplit=1)[:1] == ["/match"] or text.startswith("/match@")
+
+
+class _LockLease:
+    """Аренда замка для другого шарда: событие unlock и срок, который продлевает renew"""
+
+    __slots__ = ("release", "expires")
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.renew()
+
+    def renew(self):
+        self.expires = asyncio.get_running_loop().time() + SHARD_LOCK_LEASE
+
+
+class ShardCluster:
+    """Шард этого процесса и связь с остальными
+
+    Без SHARD_COUNT (один процесс) все игроки локальные, а обёртки
+    wrap_repository / wrap_locks возвращают хранилище и замки как есть.
+    """
+
+    def __init__(self, count: int = 1, index: int = 0, base_port: int = SHARD_BASE_PORT, secret: str = ""):
+        self.count = count
+        self.index = index  # None — фронт-процесс
+        self.base_port = base_port
+        self.secret = secret
+        self.data_file = None
+        self.local_repo = None
+        self.local_locks = None
+        self.local_fight_log = None
+        self._session = None
+        self._leases = {}  # {id аренды: _LockLease}
+        self._tasks = set()
+        self._bulk_jobs = {}  # {id задания: ход массовой операции на этом шарде}
+        self._rpc = {
+            "get": self._rpc_get,
+            "get_or_create": self._rpc_get_or_create,
+            "save_many": self._rpc_save_many,
+            "top": self._rpc_top,
+            "count": self._rpc_count,
+            "reset_all": self._rpc_reset_all,
+            "delete_many": self._rpc_delete_many,
+            "bulk_start": self._rpc_bulk_start,
+            "bulk_status": self._rpc_bulk_status,
+            "log_fights": self._rpc_log_fights,
+            "lock": self._rpc_lock,
+            "unlock": self._rpc_unlock,
+            "renew": self._rpc_renew,
+            "drain": self._rpc_drain,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ShardCluster":
+        if SHARD_COUNT <= 1:
+            return cls()
+        index = int(SHARD_INDEX) if SHARD_INDEX is not None else None
+        return cls(SHARD_COUNT, index, SHARD_BASE_PORT, SHARD_SECRET)
+
+    @property
+    def sharded(self) -> bool:
+        return self.count > 1
+
+    def shard_of(self, user_id: int) -> int:
+        return zlib.crc32(str(user_id).encode()) % self.count
+
+    def is_local(self, user_id: int) -> bool:
+        return self.count == 1 or self.shard_of(user_id) == self.index
+
+    def partition_file(self, path: str, index: int = None) -> str:
+        """players.json -> players.shard2.json для шарда 2 (без шардов — как есть)"""
+        index = self.index if index is None else index
+        if not self.sharded or index is None:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}.shard{index}{ext}"
+
+    def wrap_repository(self, repo: PlayerRepository, data_file: str) -> PlayerRepository:
+        """data_file — общий players.json, который делится между шардами при первом запуске"""
+        self.local_repo = repo
+        self.data_file = data_file
+        if not self.sharded or self.index is None:
+            return repo
+        return ShardedPlayerRepository(self, repo)
+
+    def wrap_locks(self, locks):
+        self.local_locks = locks
+        if not self.sharded or self.index is None:
+            return locks
+        return ShardedLocks(self, locks)
+
+    def wrap_fight_log(self, fight_log):
+        self.local_fight_log = fight_log
+        if not self.sharded or self.index is None:
+            return fight_log
+        return ShardedFightLog(self, fight_log)
+
+    # ===================
+    # RPC МЕЖДУ ШАРДАМИ
+    # ===================
+
+    def _url(self, index: int, path: str) -> str:
+        return f"http://127.0.0.1:{self.base_port + index}{path}"
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(
+            headers={"X-Shard-Secret": self.secret},
+            timeout=aiohttp.ClientTimeout(total=SHARD_RPC_TIMEOUT),
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def call(self, index: int, name: str, **params):
+        async with self._session.post(self._url(index, f"/rpc/{name}"), json=params) as response:
+            response.raise_for_status()
+            return (await response.json())["result"]
+
+    async def call_all(self, name: str, **params) -> list:
+        """Вызов на всех шардах, включая свой (его — без HTTP)"""
+        return await asyncio.gather(*(
+            self._rpc[name](**params) if index == self.index else self.call(index, name, **params)
+            for index in range(self.count)
+        ))
+
+    def _authorized(self, request: web.Request) -> bool:
+        return secrets.compare_digest(request.headers.get("X-Shard-Secret", ""), self.secret)
+
+    async def _handle_rpc(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=403)
+        handler = self._rpc.get(request.match_info["name"])
+        if handler is None:
+            return web.Response(status=404)
+        return web.json_response({"result": await handler(**await request.json())})
+
+    async def _rpc_get(self, user_id: int):
+        p = await self.local_repo.get(user_id)
+        return p.to_dict() if p is not None else None
+
+    async def _rpc_get_or_create(self, user_id: int):
+        return (await self.local_repo.get_or_create(user_id)).to_dict()
+
+    async def _rpc_save_many(self, items: dict):
+        await self.local_repo.save_many({
+            int(user_id): PlayerRecord.from_dict(data) for user_id, data in items.items()
+        })
+
+    async def _rpc_top(self, top_type: str, limit: int):
+        return [(user_id, p.to_dict()) for user_id, p in await self.local_repo.top(top_type, limit)]
+
+    async def _rpc_count(self):
+        return await self.local_repo.count()
+
+    async def _rpc_reset_all(self):
+        await self.local_repo.reset_all()
+
+    async def _rpc_delete_many(self, user_ids: list):
+        await self.local_repo.delete_many(user_ids)
+
+    async def _rpc_bulk_start(self, op: str, where: str = None, assignments: str = None) -> str:
+        """Запуск массовой операции над игроками этого шарда в фоне
+
+        На миллионах игроков она идёт дольше SHARD_RPC_TIMEOUT, поэтому
+        RPC только возвращает id задания, а ход отдаёт bulk_status.
+        """
+        job_id = secrets.token_hex(8)
+        job = self._bulk_jobs[job_id] = {"seen": 0, "touched": 0, "done": False, "error": None}
+
+        def progress(seen: int, touched: int):
+            job["seen"], job["touched"] = seen, touched
+
+        async def run():
+            try:
+                job["touched"] = await bulk_update(self.local_repo, op, where, assignments,
+                                                   locks=self.local_locks, progress=progress)
+            except (ValueError, SyntaxError, ArithmeticError, TypeError) as e:
+                job["error"] = str(e)
+            except Exception as e:
+                logging.exception("Массовая операция %s на шарде не удалась", op)
+                job["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                job["done"] = True
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    async def _rpc_bulk_status(self, job_id: str):
+        """Ход задания; завершённое отдаётся один раз и забывается"""
+        job = self._bulk_jobs.get(job_id)
+        if job is not None and job["done"]:
+            del self._bulk_jobs[job_id]
+        return job
+
+    async def bulk(self, op: str, where: str = None, assignments: str = None, progress=None) -> int:
+        """Массовая операция на всех шардах: запуск заданий и опрос их хода
+
+        progress(seen, touched) получает суммы по всем шардам.
+        """
+        jobs = await self.call_all("bulk_start", op=op, where=where, assignments=assignments)
+        states = [None] * self.count
+        while not all(state is not None and state["done"] for state in states):
+            await asyncio.sleep(SHARD_BULK_POLL)
+            running = [index for index, state in enumerate(states) if state is None or not state["done"]]
+            for index, state in zip(running, await asyncio.gather(*(
+                self._rpc_bulk_status(jobs[index]) if index == self.index
+                else self.call(index, "bulk_status", job_id=jobs[index])
+                for index in running
+            ))):
+                if state is None:
+                    raise RuntimeError(f"Шард {index} потерял задание массовой операции")
+                states[index] = state
+            if progress:
+                progress(sum(state["seen"] for state in states if state is not None),
+                         sum(state["touched"] for state in states if state is not None))
+        errors = [f"шард {index}: {state['error']}" for index, state in enumerate(states) if state["error"]]
+        if errors:
+            raise ValueError("; ".join(errors))
+        return sum(state["touched"] for state in states)
+
+    async def _rpc_log_fights(self, entries: list):
+        await self.local_fight_log.record(entries)
+
+    async def _rpc_lock(self, user_id: int) -> str:
+        """Замок своего игрока для другого шарда: держится до unlock или истечения аренды
+
+        Держатель продлевает аренду через renew, пока замок ему нужен;
+        аренда истекает, только если держатель пропал или не на связи.
+        """
+        lease = secrets.token_hex(8)
+        state = self._leases[lease] = _LockLease()
+        loop = asyncio.get_running_loop()
+        acquired = loop.create_future()
+
+        async def holder():
+            try:
+                async with self.local_locks.hold(user_id):
+                    state.renew()  # срок — от момента захвата, а не от запроса
+                    acquired.set_result(None)
+                    while not state.release.is_set():
+                        remaining = state.expires - loop.time()
+                        if remaining <= 0:
+                            logging.warning("Аренда замка игрока %s истекла без unlock", user_id)
+                            break
+                        try:
+                            await asyncio.wait_for(state.release.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            pass  # срок мог продлиться — проверим заново
+            finally:
+                self._leases.pop(lease, None)
+
+        task = asyncio.create_task(holder())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        try:
+            await acquired
+        except BaseException:
+            task.cancel()
+            raise
+        return lease
+
+    async def _rpc_unlock(self, lease: str):
+        state = self._leases.get(lease)
+        if state is not None:
+            state.release.set()
+
+    async def _rpc_renew(self, lease: str) -> bool:
+        """False — аренда уже истекла и замок отпущен"""
+        state = self._leases.get(lease)
+        if state is None:
+            return False
+        state.renew()
+        return True
+
+    async def _rpc_drain(self, timeout: float):
+        """Дождаться апдейтов в работе, пока соседи ещё отвечают на RPC"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    # ===================
+    # ВОРКЕР
+    # ===================
+
+    def run(self, dp: Dispatcher, bot: Bot):
+        if self.index is None:
+            asyncio.run(self._run_front(dp, bot))
+        else:
+            self._run_worker(dp, bot)
+
+    def _run_worker(self, dp: Dispatcher, bot: Bot):
+        """Бот шарда: апдейты от фронта и RPC соседей на локальном порту"""
+
+        async def process(update: dict):
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception:
+                # feed_raw_update сам не пишет в лог (это делают только polling и вебхук aiogram)
+                logging.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+        async def handle_update(request: web.Request) -> web.Response:
+            if not self._authorized(request):
+                return web.Response(status=403)
+            task = asyncio.create_task(process(await request.json()))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return web.Response()
+
+        async def start_cluster(app):
+            await self.start()
+
+        async def close_cluster(app):
+            await self.close()
+
+        app = web.Application()
+        app.router.add_post("/update", handle_update)
+        app.router.add_post("/rpc/{name}", self._handle_rpc)
+        app.router.add_get("/health", lambda request: web.Response(text="ok"))
+        app.on_startup.append(start_cluster)
+        setup_application(app, dp, bot=bot)
+        app.on_cleanup.append(close_cluster)
+        web.run_app(app, host="127.0.0.1", port=self.base_port + self.index,
+                    access_log=None, print=None)
+
+    # ===================
+    # ФРОНТ
+    # ===================
+
+    def _shard_count_file(self) -> str:
+        root, ext = os.path.splitext(self.data_file)
+        return f"{root}.shards{ext}"
+
+    def _split_count(self):
+        """На сколько шардов уже разбиты игроки (None — ещё не разбиты)
+
+        Без файла с числом шардов (разбиение старой версией или падение
+        до его записи) число выводится из имён файлов шардов.
+        """
+        path = self._shard_count_file()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["count"]
+        root, ext = os.path.splitext(self.data_file)
+        pattern = re.compile(re.escape(os.path.basename(root)) + r"\.shard(\d+)" + re.escape(ext) + "$")
+        indexes = [
+            int(match.group(1)) for name in os.listdir(os.path.dirname(self.data_file) or ".")
+            if (match := pattern.match(name))
+        ]
+        return max(indexes) + 1 if indexes else None
+
+    def _save_split_count(self):
+        path = self._shard_count_file()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"count": self.count}, f)
+        os.replace(path + ".tmp", path)
+
+    async def split_players(self):
+        """Разбиение общего players.json по шардам (один раз, при первом запуске)
+
+        Число шардов записывается рядом с частями. С другим SHARD_COUNT
+        игроки попали бы не на свои шарды и создались бы заново, поэтому
+        запуск прерывается: сначала игроков нужно собрать обратно.
+        """
+        split_count = self._split_count()
+        if split_count is not None:
+            if split_count != self.count:
+                raise RuntimeError(
+                    f"Игроки разбиты на {split_count} шардов, а SHARD_COUNT={self.count}. "
+                    f"Верни SHARD_COUNT={split_count} или собери игроков в один файл: "
+                    f"python bulk.py --data <файл шарда> export shardN.ndjson для каждого шарда, "
+                    f"убери файлы шардов и {self._shard_count_file()}, "
+                    f"загрузи выгрузки командой python bulk.py import"
+                )
+            self._save_split_count()
+            return
+        targets = [self.partition_file(self.data_file, index) for index in range(self.count)]
+        await self.local_repo.open()
+        parts = [{} for _ in range(self.count)]
+        async for batch in self.local_repo.iter_players():
+            for user_id, p in batch:
+                parts[self.shard_of(user_id)][str(user_id)] = p.to_dict()
+        await self.local_repo.close()
+        for path, part in zip(targets, parts):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(part, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        self._save_split_count()
+        logging.info("Игроки разбиты по %s шардам: %s", self.count, [len(part) for part in parts])
+
+    def _spawn_workers(self) -> list:
+        env = dict(os.environ, SHARD_COUNT=str(self.count), SHARD_SECRET=self.secret,
+                   SHARD_BASE_PORT=str(self.base_port))
+        return [
+            subprocess.Popen([sys.executable, *sys.argv], env=dict(env, SHARD_INDEX=str(index)))
+            for index in range(self.count)
+        ]
+
+    async def _wait_ready(self, workers: list):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SHARD_START_TIMEOUT
+        for index, worker in enumerate(workers):
+            while True:
+                if worker.poll() is not None:
+                    raise RuntimeError(f"Шард {index} завершился при запуске")
+                try:
+                    async with self._session.get(self._url(index, "/health")) as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if loop.time() > deadline:
+                    raise RuntimeError(f"Шард {index} не запустился за {SHARD_START_TIMEOUT} с")
+                await asyncio.sleep(0.2)
+
+    async def forward(self, update: dict):
+        if is_match_command(update):
+            index = MATCH_SHARD  # бой найденной пары с чужими игроками — через их шарды
+        else:
+            user_id = route_user_id(update)
+            index = self.shard_of(user_id) if user_id is not None else update["update_id"] % self.count
+        try:
+            async with self._session.post(self._url(index, "/update"), json=update) as response:
+                response.raise_for_status()
+        except Exception:
+            logging.exception("Апдейт %s не доставлен шарду %s", update.get("update_id"), index)
+
+    async def _poll(self, dp: Dispatcher, bot: Bot):
+        await bot.delete_webhook(drop_pending_updates=False)
+        allowed_updates = dp.resolve_used_update_types()
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPDATES * self.count)
+        offset = None
+
+        async def forward(update: dict):
+            try:
+                await self.forward(update)
+            finally:
+                semaphore.release()
+
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates,
+                    request_timeout=POLLING_TIMEOUT + 10,
+                )
+            except Exception:
+                logging.exception("Ошибка получения апдейтов")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await semaphore.acquire()
+                task = asyncio.create_task(forward(update.model_dump(mode="json", by_alias=True, exclude_none=True)))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _serve_webhook(self, dp: Dispatcher, bot: Bot):
+        if not WEBHOOK_URL:
+            raise RuntimeError("Для RUN_MODE=webhook нужен WEBHOOK_URL")
+
+        async def handle(request: web.Request) -> web.Response:
+            if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+                return web.Response(status=401)
+            await self.forward(await request.json())
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def _run_front(self, dp: Dispatcher, bot: Bot):
+        """Фронт: делит игроков, запускает воркеров и раздаёт им апдейты"""
+        self.secret = self.secret or secrets.token_hex(16)
+        await self.split_players()
+        main_task = asyncio.current_task()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+
+        await self.start()
+        workers = self._spawn_workers()
+        try:
+            await self._wait_ready(workers)
+            logging.info("Запущено шардов: %s", self.count)
+            if RUN_MODE == "webhook":
+                await self._serve_webhook(dp, bot)
+            else:
+                await self._poll(dp, bot)
+        except asyncio.CancelledError:
+            logging.info("Остановка по SIGTERM")  # штатный выход, без трейсбэка
+        finally:
+            # Дослать начатое и дать шардам доделать апдейты, пока все они
+            # на связи; потом остановить воркеров — они сами сохранятся
+            if self._tasks:
+                await asyncio.wait(set(self._tasks), timeout=SHARD_RPC_TIMEOUT)
+            await asyncio.gather(*(
+                self.call(index, "drain", timeout=SHUTDOWN_DRAIN_TIMEOUT) for index in range(self.count)
+            ), return_exceptions=True)
+            for worker in workers:
+                if worker.poll() is None:
+                    worker.send_signal(signal.SIGTERM)
+            await asyncio.gather(*(asyncio.to_thread(worker.wait) for worker in workers))
+            await self.close()
+            await bot.session.close()
+
+
+class ShardedPlayerRepository(PlayerRepository):
+    """Хранилище всех игроков поверх своей части и RPC к остальным шардам
+
+    Наблюдатели подписываются на локальное хранилище: каждый шард
+    сбрасывает свои кэши, когда сохраняются его игроки.
+    """
+
+    def __init__(self, cluster: ShardCluster, local: PlayerRepository):
+        super().__init__()
+        self.cluster = cluster
+        self.local = local
+
+    def subscribe(self, observer):
+        self.local.subscribe(observer)
+
+    async def open(self):
+        await self.local.open()
+
+    async def close(self):
+        await self.local.close()
+
+    async def get(self, user_id: int):
+        if self.cluster.is_local(user_id):
+            return await self.local.get(user_id)
+        data = await self.cluster.call(self.cluster.shard_of(user_id), "get", user_id=user_id)
+        return PlayerRecord.from_dict(data) if data is not None else None
+
+    async def get_or_create(self, user_id: int) -> PlayerRecord:
+        if self.cluster.is_local(user_id):
+            return await self.local.get_or_create(user_id)
+        data = await self.cluster.call(self.cluster.shard_of(user_id), "get_or_create", user_id=user_id)
+        return PlayerRecord.from_dict(data)
+
+    async def save(self, user_id: int, data: PlayerRecord):
+        await self.save_many({user_id: data})
+
+    async def save_many(self, items: dict):
+        parts = {}
+        for user_id, data in items.items():
+            parts.setdefault(self.cluster.shard_of(user_id), {})[user_id] = data
+        await asyncio.gather(*(
+            self.local.save_many(part) if index == self.cluster.index else self.cluster.call(
+                index, "save_many", items={str(user_id): p.to_dict() for user_id, p in part.items()})
+            for index, part in parts.items()
+        ))
+
+    async def delete_many(self, user_ids: list):
+        parts = {}
+        for user_id in user_ids:
+            parts.setdefault(self.cluster.shard_of(user_id), []).append(user_id)
+        await asyncio.gather(*(
+            self.local.delete_many(part) if index == self.cluster.index
+            else self.cluster.call(index, "delete_many", user_ids=part)
+            for index, part in parts.items()
+        ))
+
+    async def top(self, top_type: str, limit: int = 10) -> list:
+        """Слияние топов всех шардов: глобальный топ-N есть среди их топ-N"""
+        key_func = TOP_KEYS[top_type]
+        merged = []
+        for part in await self.cluster.call_all("top", top_type=top_type, limit=limit):
+            merged += [(user_id, PlayerRecord.from_dict(data)) for user_id, data in part]
+        merged.sort(key=lambda item: (-key_func(item[1]), item[0]))
+        return merged[:limit]
+
+    async def count(self) -> int:
+        return sum(await self.cluster.call_all("count"))
+
+    async def reset_all(self):
+        await self.cluster.call_all("reset_all")
+
+    async def iter_players(self, batch: int = 1000):
+        """Только свои игроки: каждый шард выгружает свою часть"""
+        async for part in self.local.iter_players(batch):
+            yield part
+
+
+class ShardedLocks:
+    """PlayerLocks для всех игроков: чужие блокируются на их шарде по RPC
+
+    Замки берутся по возрастанию id через все шарды, как в PlayerLocks,
+    поэтому встречные бои игроков с разных шардов не блокируют друг друга.
+    Аренда чужого замка продлевается, пока он держится; если она всё же
+    истекла (шард долго был не на связи), задача-держатель отменяется
+    и получает RuntimeError, а не сохраняет запись без замка.
+    """
+
+    def __init__(self, cluster: ShardCluster, local):
+        self.cluster = cluster
+        self.local = local
+
+    @asynccontextmanager
+    async def hold(self, *user_ids: int):
+        if all(self.cluster.is_local(user_id) for user_id in user_ids):
+            async with self.local.hold(*user_ids):
+                yield
+            return
+        async with AsyncExitStack() as stack:
+            for user_id in sorted(set(user_ids)):
+                if self.cluster.is_local(user_id):
+                    await stack.enter_async_context(self.local.hold(user_id))
+                else:
+                    await stack.enter_async_context(self._remote(user_id))
+            yield
+
+    @asynccontextmanager
+    async def _remote(self, user_id: int):
+        index = self.cluster.shard_of(user_id)
+        lease = await self.cluster.call(index, "lock", user_id=user_id)
+        owner = asyncio.current_task()
+        lost = False
+
+        async def renew():
+            nonlocal lost
+            while True:
+                await asyncio.sleep(SHARD_LOCK_RENEW)
+                try:
+                    alive = await self.cluster.call(index, "renew", lease=lease)
+                except Exception:
+                    logging.exception("Не удалось продлить замок игрока %s", user_id)
+                    continue
+                if not alive:
+                    logging.error("Замок игрока %s потерян: аренда истекла", user_id)
+                    lost = True
+                    owner.cancel()
+                    return
+
+        renewer = asyncio.create_task(renew())
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not lost:
+                raise
+            owner.uncancel()
+            raise RuntimeError(f"Замок игрока {user_id} потерян, изменения не сохранены") from None
+        finally:
+            renewer.cancel()
+            await self.cluster.call(index, "unlock", lease=lease)
+
+    def stats(self) -> dict:
+        return self.local.stats()
+
+
+class ShardedFightLog:
+    """Журнал боёв: бой пишется в журналы шардов обоих игроков
+
+    История игрока читается на его шарде (туда приходят его апдейты),
+    поэтому запросы идут в свой журнал без RPC.
+    """
+
+    RPC_CHUNK = 10_000  # боёв в одном запросе (турнир даёт сотни тысяч)
+
+    def __init__(self, cluster: ShardCluster, local):
+        self.cluster = cluster
+        self.local = local
+
+    def open(self):
+        self.local.open()
+
+    async def run(self):
+        await self.local.run()
+
+    async def close(self):
+        await self.local.close()
+
+    async def record(self, entries: list):
+        parts = {}
+        for entry in entries:
+            for index in {self.cluster.shard_of(entry[1]), self.cluster.shard_of(entry[2])}:
+                parts.setdefault(index, []).append(entry)
+        await asyncio.gather(*(
+            self.local.record(part) if index == self.cluster.index else self._send(index, part)
+            for index, part in parts.items()
+        ))
+
+    async def _send(self, index: int, entries: list):
+        for start in range(0, len(entries), self.RPC_CHUNK):
+            await self.cluster.call(index, "log_fights", entries=entries[start:start + self.RPC_CHUNK])
+
+    def last_fights(self, user_id: int, limit: int = 10) -> list:
+        return self.local.last_fights(user_id, limit)
+
+    def streak(self, user_id: int) -> tuple:
+        return self.local.streak(user_id)
+
+    def stats(self) -> dict:
+        return self.local.stats()
@@ -0,0 +1,151 @@
+import os
+import json
+import shutil
+import asyncio
+import logging
+from records import PlayerRecord
+
+
+class PlayerStore:
+    """Хранилище игроков: снапшот + журнал изменений (write-ahead log)
+
+    Каждое изменение игрока дописывается одной строкой в журнал
+    ``<snapshot>.log`` вместо перезаписи всего файла. Когда журнал
+    разрастается, он сжимается в новый снапшот в фоновом потоке.
+    Формат снапшота совпадает со старым ``players.json``; в памяти игроки
+    хранятся как {int id: PlayerRecord}.
+    """
+
+    def __init__(self, snapshot_path: str, log_path: str = None, compact_every: int = 5000):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or snapshot_path + ".log"
+        self.old_log_path = self.log_path + ".old"
+        self.compact_every = compact_every
+        self.players = {}
+        self._log = None
+        self._log_records = 0
+        self._compacting = None
+
+    # ===================
+    # ВОССТАНОВЛЕНИЕ
+    # ===================
+
+    def load(self) -> dict:
+        """Загрузка последнего снапшота и проигрывание журнала поверх него"""
+        self.players = self._read_snapshot()
+        replayed = 0
+        # .old остаётся, если сжатие не успело завершиться
+        for path in (self.old_log_path, self.log_path):
+            replayed += self._replay(path)
+
+        if replayed:
+            # Сразу фиксируем восстановленное состояние, чтобы начать с чистого журнала
+            self._write_snapshot({str(user_id): data.to_dict() for user_id, data in self.players.items()})
+            for path in (self.old_log_path, self.log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        return self.players
+
+    def _read_snapshot(self) -> dict:
+        if not os.path.exists(self.snapshot_path):
+            return {}
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            return {int(user_id): PlayerRecord.from_dict(data) for user_id, data in json.load(f).items()}
+
+    def _replay(self, path: str) -> int:
+        """Применение записей журнала; обрезанная последняя строка пропускается"""
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # недописанная строка после падения
+                user_id = int(record["id"])
+                if record["p"] is None:
+                    self.players.pop(user_id, None)
+                else:
+                    self.players[user_id] = PlayerRecord.from_dict(record["p"])
+                count += 1
+        return count
+
+    # ===================
+    # ЗАПИСЬ
+    # ===================
+
+    def append(self, user_id: int, data: PlayerRecord = None):
+        """Запись состояния одного игрока в журнал (None — удаление)"""
+        self.append_many({user_id: data})
+
+    def append_many(self, items: dict):
+        """Запись нескольких игроков одной операцией записи"""
+        lines = "".join(
+            json.dumps({"id": user_id, "p": data.to_dict() if data is not None else None},
+                       ensure_ascii=False, separators=(",", ":")) + "\n"
+            for user_id, data in items.items()
+        )
+        self._log.write(lines)
+        self._log.flush()
+        self._log_records += len(items)
+
+        if self._log_records >= self.compact_every and self._compacting is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._compacting = loop.create_task(self.compact())
+            self._compacting.add_done_callback(self._compaction_done)
+
+    @staticmethod
+    def _compaction_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Сжатие журнала игроков не удалось", exc_info=task.exception())
+
+    async def compact(self):
+        """Сжатие журнала в новый снапшот; запись файла идёт в отдельном потоке"""
+        current = asyncio.current_task()
+        while self._compacting is not None and self._compacting is not current:
+            await asyncio.wait([self._compacting])
+        self._compacting = current
+        try:
+            # Ротация журнала: новые изменения пишутся в свежий файл,
+            # старый удаляется только после успешной записи снапшота.
+            # .old от неудавшегося сжатия ещё не в снапшоте — дописываем
+            # к нему, а не заменяем
+            self._log.close()
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.old_log_path):
+                    with open(self.log_path, "rb") as src, open(self.old_log_path, "ab") as dst:
+                        shutil.copyfileobj(src, dst)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.old_log_path)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log_records = 0
+
+            snapshot = {str(user_id): data.to_dict() for user_id, data in self.players.items()}
+            await asyncio.to_thread(self._write_snapshot, snapshot)
+            if os.path.exists(self.old_log_path):
+                os.remove(self.old_log_path)
+        finally:
+            self._compacting = None
+
+    def _write_snapshot(self, snapshot: dict):
+        """Атомарная запись снапшота: временный файл + os.replace"""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def close(self):
+        """Финальное сжатие при остановке бота"""
+        await self.compact()
+        self._log.close()
@@ -0,0 +1,176 @@
+"""Турнир: регистрация и расчёт всей сетки за один проход в памяти
+
+    python tournament.py  # время сетки на 1000 игроков и цена записи
+"""
+import random
+from collections import Counter
+
+from battle import can_fight, resolve_fight
+from fightlog import fight_entry
+
+MODES = {"single": "на вылет", "round": "круговой"}
+
+
+class Tournament:
+    """Открытый турнир: организатор, чат, режим и участники
+
+    run() считает все бои сетки теми же resolve_fight, что и обычный
+    бой, на копиях записей игроков: статы меняются от боя к бою так же,
+    как если бы бои шли по отдельности. Сохранить записи нужно одним
+    save_many после run(). Бой, в котором кто-то не проходит can_fight,
+    не проводится (как отказ в обычном бою): на вылет проходит
+    соперник, в круговом никто не получает очков. Проведённые бои
+    копятся в history (записи fightlog) для журнала боёв.
+    """
+
+    MAX_REMATCHES = 3  # ничьи на вылет переигрываются, потом проходит посев выше
+
+    def __init__(self, organizer_id: int, chat_id: int, mode: str = "single", max_players: int = 1000):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим турнира: {mode}")
+        self.organizer_id = organizer_id
+        self.chat_id = chat_id
+        self.mode = mode
+        self.max_players = max_players
+        self.players = {}  # {user_id: имя} в порядке регистрации
+        self.fights = 0
+        self.wins = Counter()
+        self.losses = Counter()
+        self.history = []
+
+    def __len__(self):
+        return len(self.players)
+
+    def join(self, user_id: int, name: str) -> bool:
+        if user_id in self.players or len(self.players) >= self.max_players:
+            return False
+        self.players[user_id] = name
+        return True
+
+    def run(self, records: dict) -> list:
+        """Все бои сетки; records — {user_id: запись}, меняются на месте
+
+        Возвращает итоговую таблицу [(user_id, очки)] от первого места:
+        на вылет очки — номер круга, до которого игрок дошёл, в круговом —
+        2 за победу и 1 за ничью.
+        """
+        if self.mode == "round":
+            return self._round_robin(records)
+        return self._single_elimination(records)
+
+    def _duel(self, records: dict, a: int, b: int):
+        """Один бой: 0 — победил a, 1 — b, None — ничья или бой не состоялся"""
+        if not (can_fight(records[a]) and can_fight(records[b])):
+            return None
+        self.fights += 1
+        hit_a, hit_b, winner_side, bonus = resolve_fight(records[a], records[b])
+        self.history.append(fight_entry(a, b, hit_a, hit_b, winner_side, bonus))
+        if winner_side is not None:
+            winner, loser = (a, b) if winner_side == 0 else (b, a)
+            self.wins[winner] += 1
+            self.losses[loser] += 1
+        return winner_side
+
+    def _single_elimination(self, records: dict) -> list:
+        alive = list(self.players)
+        random.shuffle(alive)  # посев
+        reached = {}
+        stage = 0
+        while len(alive) > 1:
+            stage += 1
+            advanced = []
+            if len(alive) % 2:
+                advanced.append(alive.pop())  # нечётному — проход без боя
+            for a, b in zip(alive[::2], alive[1::2]):
+                if not can_fight(records[a]) or not can_fight(records[b]):
+                    winner = a if can_fight(records[a]) or not can_fight(records[b]) else b
+                else:
+                    winner = a  # после MAX_REMATCHES ничьих
+                    for _ in range(self.MAX_REMATCHES):
+                        side = self._duel(records, a, b)
+                        if side is not None:
+                            winner = (a, b)[side]
+                            break
+                loser = b if winner == a else a
+                reached[loser] = stage
+                advanced.append(winner)
+            alive = advanced
+        if alive:
+            reached[alive[0]] = stage + 1
+        return sorted(reached.items(), key=lambda item: -item[1])
+
+    def _round_robin(self, records: dict) -> list:
+        points = {user_id: 0 for user_id in self.players}
+        order = list(self.players)
+        if len(order) % 2:
+            order.append(None)  # пропуск тура
+        n = len(order)
+        # Круговой метод: в каждом туре каждый играет не больше одного боя,
+        # поэтому статы меняются так же, как в турах подряд
+        for _ in range(n - 1):
+            for i in range(n // 2):
+                a, b = order[i], order[n - 1 - i]
+                if a is None or b is None:
+                    continue
+                side = self._duel(records, a, b)
+                if side is None:
+                    if can_fight(records[a]) and can_fight(records[b]):
+                        points[a] += 1
+                        points[b] += 1
+                    continue
+                points[(a, b)[side]] += 2
+            order.insert(1, order.pop())
+        return sorted(points.items(), key=lambda item: (-item[1], -self.wins[item[0]]))
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import asyncio
+    import tempfile
+    from records import PlayerRecord
+    from repository import create_repository
+
+    def make_records(count: int) -> dict:
+        return {
+            user_id: PlayerRecord(random.randint(10, 120), random.randint(2, 60))
+            for user_id in range(1, count + 1)
+        }
+
+    random.seed(1)
+    for mode, count in (("single", 1000), ("round", 1000)):
+        tour = Tournament(0, 0, mode)
+        for user_id in range(1, count + 1):
+            tour.join(user_id, f"p{user_id}")
+        records = make_records(count)
+        started = time.perf_counter()
+        tour.run(records)
+        print(f"{MODES[mode]}, {count} игроков: {tour.fights} боёв за {time.perf_counter() - started:.2f} с")
+
+    # Цена записи: сохранение после каждого боя против одного save_many
+    async def persistence(backend: str):
+        with tempfile.TemporaryDirectory() as work:
+            repo = create_repository(backend, os.path.join(work, "players.json"), os.path.join(work, "players.db"))
+            await repo.open()
+            tour = Tournament(0, 0, "single")
+            for user_id in range(1, 1001):
+                tour.join(user_id, f"p{user_id}")
+            records = make_records(1000)
+            await repo.save_many(records)
+            pairs = [(a, a + 1) for a in range(1, 1000, 2)] * 2  # по числу боёв сетки
+            started = time.perf_counter()
+            for a, b in pairs:
+                await repo.save_many({a: records[a], b: records[b]})
+            per_fight = time.perf_counter() - started
+            tour.run(records)
+            started = time.perf_counter()
+            await repo.save_many(records)
+            once = time.perf_counter() - started
+            await repo.close()
+        print(f"{backend}: {len(pairs)} записей по бою {per_fight * 1000:.0f} мс, одна пачка {once * 1000:.1f} мс")
+
+    for backend in ("json", "sqlite"):
+        try:
+            asyncio.run(persistence(backend))
+        except ImportError as e:
+            print(f"{backend}: пропущено ({e})")